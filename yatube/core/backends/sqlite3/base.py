@@ -0,0 +1,16 @@
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """SQLite, в котором atomic() может начать транзакцию с BEGIN
+    IMMEDIATE (см. core.db.immediate_atomic): блокировка на запись
+    берется сразу и ждет busy_timeout. После обычного BEGIN чтение
+    держит снимок БД, и первая запись при занятой БД получает
+    'database is locked' сразу, без ожидания."""
+
+    begin_immediate = False
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute(
+            'BEGIN IMMEDIATE' if self.begin_immediate else 'BEGIN'
+        )
@@ -0,0 +1,221 @@
+import pickle
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+from .metrics import MeteredCacheMixin, registry
+
+# ключ поколения в общем кэше: его увеличение сбрасывает локальные
+# кэши всех процессов
+GENERATION_KEY = 'two_tier.generation'
+
+_missing = object()
+# локальные кэши по имени общего: один на процесс, как у LocMemCache
+_stores = {}
+_stores_lock = threading.Lock()
+
+registry.describe('yatube_cache_tier_requests_total', 'counter',
+                  'Обращения к уровням кэша: local или shared, hit или miss')
+
+
+class LocalStore:
+    """Ограниченный LRU-кэш процесса. Значения хранятся
+    сериализованными: иначе изменение объекта из кэша (например,
+    cookie у закэшированного ответа) увидели бы другие запросы."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+        self.generation = None
+        self.checked_at = 0.0
+
+    def get(self, key):
+        with self.lock:
+            item = self.data.get(key)
+            if item is None:
+                return _missing
+            expires, value = item
+            if expires <= time.monotonic():
+                del self.data[key]
+                return _missing
+            self.data.move_to_end(key)
+        return pickle.loads(value)
+
+    def set(self, key, value, timeout):
+        value = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self.lock:
+            self.data[key] = (time.monotonic() + timeout, value)
+            self.data.move_to_end(key)
+            while len(self.data) > self.max_entries:
+                self.data.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.data.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+
+class TwoTierCache(BaseCache):
+    """Двухуровневый кэш: LRU в памяти процесса с коротким временем
+    жизни поверх общего для всех процессов кэша (LOCATION - его
+    алиас в CACHES). Чтение сначала идет в локальный уровень, запись -
+    в оба.
+
+    Запись и удаление ключа не доходят до локальных копий в других
+    процессах, они доживают до LOCAL_TIMEOUT. Поэтому invalidate,
+    incr, decr и clear меняют поколение в общем кэше, а процессы
+    не реже раза в GENERATION_CHECK_INTERVAL сверяют его и при
+    расхождении очищают локальный уровень. Так bump_cache_version
+    доходит до всех процессов почти сразу. Обычный delete поколение
+    не меняет: блокировки и другие ключи, которые читают только через
+    add, удаляются часто и не должны очищать кэши всех процессов.
+
+    OPTIONS: LOCAL_MAX_ENTRIES (1000), LOCAL_TIMEOUT (5 с),
+    GENERATION_CHECK_INTERVAL (1 с)."""
+
+    def __init__(self, location, params):
+        options = params.get('OPTIONS', {})
+        super().__init__(params)
+        self.shared_alias = location
+        self.local_timeout = options.get('LOCAL_TIMEOUT', 5)
+        self.check_interval = options.get('GENERATION_CHECK_INTERVAL', 1)
+        with _stores_lock:
+            self.local = _stores.setdefault(
+                location, LocalStore(options.get('LOCAL_MAX_ENTRIES', 1000))
+            )
+
+    @property
+    def shared(self):
+        return caches[self.shared_alias]
+
+    def count(self, tier, hit):
+        registry.inc('yatube_cache_tier_requests_total',
+                     (('tier', tier), ('result', 'hit' if hit else 'miss')))
+
+    def local_key(self, key, version):
+        key = self.make_key(key, version)
+        self.validate_key(key)
+        return key
+
+    def local_ttl(self, timeout):
+        if timeout is DEFAULT_TIMEOUT or timeout is None:
+            return self.local_timeout
+        return min(timeout, self.local_timeout)
+
+    def sync_generation(self, force=False):
+        """Очищает локальный уровень, если другой процесс увеличил
+        поколение."""
+        now = time.monotonic()
+        if not force and now - self.local.checked_at < self.check_interval:
+            return
+        generation = self.shared.get(GENERATION_KEY)
+        if generation != self.local.generation:
+            self.local.clear()
+            self.local.generation = generation
+        self.local.checked_at = now
+
+    def broadcast(self):
+        """Меняет поколение: все процессы очистят локальный уровень,
+        этот - сразу. Поколение - случайная строка, а не incr: incr
+        общего FileBasedCache - это get + set, и из двух одновременных
+        смен одна терялась бы."""
+        self.shared.set(GENERATION_KEY, uuid.uuid4().hex, None)
+        self.sync_generation(force=True)
+
+    def get(self, key, default=None, version=None):
+        self.sync_generation()
+        local_key = self.local_key(key, version)
+        value = self.local.get(local_key)
+        self.count('local', value is not _missing)
+        if value is not _missing:
+            return value
+        value = self.shared.get(key, _missing, version)
+        self.count('shared', value is not _missing)
+        if value is _missing:
+            return default
+        self.local.set(local_key, value, self.local_timeout)
+        return value
+
+    def get_many(self, keys, version=None):
+        self.sync_generation()
+        found, missed = {}, []
+        for key in keys:
+            value = self.local.get(self.local_key(key, version))
+            self.count('local', value is not _missing)
+            if value is _missing:
+                missed.append(key)
+            else:
+                found[key] = value
+        if missed:
+            shared = self.shared.get_many(missed, version)
+            for key in missed:
+                self.count('shared', key in shared)
+            for key, value in shared.items():
+                self.local.set(self.local_key(key, version), value,
+                               self.local_timeout)
+            found.update(shared)
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.shared.set(key, value, timeout, version)
+        self.store_local(key, value, timeout, version)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self.shared.add(key, value, timeout, version)
+        if added:
+            self.store_local(key, value, timeout, version)
+        return added
+
+    def store_local(self, key, value, timeout, version):
+        ttl = self.local_ttl(timeout)
+        if ttl > 0:
+            self.local.set(self.local_key(key, version), value, ttl)
+        else:
+            self.local.delete(self.local_key(key, version))
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.shared.touch(key, timeout, version)
+
+    def has_key(self, key, version=None):
+        self.sync_generation()
+        if self.local.get(self.local_key(key, version)) is not _missing:
+            return True
+        return self.shared.has_key(key, version)
+
+    def delete(self, key, version=None):
+        self.shared.delete(key, version)
+        self.local.delete(self.local_key(key, version))
+
+    def delete_many(self, keys, version=None):
+        self.shared.delete_many(keys, version)
+        for key in keys:
+            self.local.delete(self.local_key(key, version))
+
+    def invalidate(self, key, version=None):
+        """delete, который сбрасывает и локальные копии ключа во всех
+        процессах (вместе с остальным их локальным уровнем)."""
+        self.shared.delete(key, version)
+        self.broadcast()
+
+    def incr(self, key, delta=1, version=None):
+        # атомарен, только если атомарен incr общего кэша
+        value = self.shared.incr(key, delta, version)
+        self.broadcast()
+        return value
+
+    def clear(self):
+        self.shared.clear()
+        self.local.clear()
+        self.broadcast()
+
+
+class MeteredTwoTierCache(MeteredCacheMixin, TwoTierCache):
+    """TwoTierCache с подсчетом попаданий и промахов по префиксу."""
@@ -0,0 +1,156 @@
+import random
+import sqlite3
+import time
+from contextlib import ExitStack, closing, contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import (DEFAULT_DB_ALIAS, OperationalError, connections,
+                       transaction)
+from django.db.models import FileField
+
+# сообщения SQLite о том, что БД занята другим соединением
+BUSY_MESSAGES = ('database is locked', 'database is busy')
+# cookie, которая после записи закрепляет пользователя за основной БД
+PIN_COOKIE = 'pin_primary'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+# приложения, которые читают только из основной БД: сессия и
+# пользователь с реплики "разлогинивают" после записи, а задачи
+# очереди с реплики можно пропустить или захватить дважды
+PRIMARY_APPS = ('sessions', 'auth', 'jobs')
+
+# БД для чтения в текущем запросе: одна на весь запрос, чтобы
+# страница не собиралась из реплик с разным отставанием
+_read_alias = ContextVar('read_alias', default=None)
+
+
+def configure_sqlite(sender, connection, **kwargs):
+    """Приемник connection_created: выставляет PRAGMA из
+    SQLITE_PRAGMAS каждому новому соединению с SQLite."""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name, value in settings.SQLITE_PRAGMAS.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+def is_busy(error):
+    return any(message in str(error) for message in BUSY_MESSAGES)
+
+
+@contextmanager
+def immediate_atomic(using=DEFAULT_DB_ALIAS):
+    """transaction.atomic(), который в SQLite начинает транзакцию
+    с BEGIN IMMEDIATE (core.backends.sqlite3). Если за busy_timeout
+    блокировку получить не удалось, BEGIN повторяется с растущей
+    задержкой. Код блока к этому моменту еще не выполнялся, поэтому
+    повтор не повторяет его побочных эффектов.
+
+    Блокировка держится до конца блока и останавливает всех
+    остальных писателей, поэтому в блоке - только запись в БД:
+    проверка формы, обработка картинок (save_files) и отрисовка
+    ответа - до или после него."""
+    connection = connections[using]
+    delay = settings.SQLITE_BUSY_RETRY_DELAY
+    with ExitStack() as stack:
+        for attempt in range(settings.SQLITE_BUSY_RETRIES + 1):
+            connection.begin_immediate = True
+            try:
+                stack.enter_context(transaction.atomic(using=using))
+                break
+            except OperationalError as error:
+                if (not is_busy(error)
+                        or attempt == settings.SQLITE_BUSY_RETRIES):
+                    raise
+            finally:
+                connection.begin_immediate = False
+            time.sleep(delay)
+            delay *= 2
+        yield
+
+
+def save_files(instance):
+    """Пишет новые файлы полей instance в хранилище, как это делает
+    FileField.pre_save в save(), но до immediate_atomic: хеширование
+    и запись файла не держат блокировку БД."""
+    for field in instance._meta.concrete_fields:
+        if isinstance(field, FileField):
+            file = getattr(instance, field.attname)
+            if file and not file._committed:
+                file.save(file.name, file.file, save=False)
+
+
+@contextmanager
+def primary_reads():
+    """Внутри блока ORM читает из основной БД, даже если запрос
+    читает с реплики. Нужен для данных, которые переживают запрос:
+    страница из отставшей реплики попала бы в общий кэш под новой
+    версией и отдавалась бы всем и после того, как реплика догонит."""
+    token = _read_alias.set(DEFAULT_DB_ALIAS)
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+def choose_read_alias(pinned=False):
+    """Случайная реплика или основная БД, если реплик нет."""
+    if pinned or not settings.DATABASE_REPLICAS:
+        return DEFAULT_DB_ALIAS
+    return random.choice(settings.DATABASE_REPLICAS)
+
+
+class PrimaryReplicaRouter:
+    """Запись - в основную БД. Чтение внутри запроса - из БД, которую
+    выбрал ReplicaPinningMiddleware (случайная реплика или основная).
+    Вне запроса (команды, обработчик очереди) и для PRIMARY_APPS
+    чтение всегда из основной БД: отставшая реплика вернула бы
+    старые данные, которые потом записываются обратно."""
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label in PRIMARY_APPS:
+            return DEFAULT_DB_ALIAS
+        return _read_alias.get() or DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # реплики - копии основной БД, объекты из них связаны
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # схему реплики получают копированием основной БД
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicaPinningMiddleware:
+    """Закрепляет запрос за основной БД, если он пишет (не GET/HEAD)
+    или если пользователь писал последние DATABASE_PIN_SECONDS
+    секунд: так он сразу видит свой пост или комментарий, даже
+    если реплики еще отстают."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        writes = request.method not in SAFE_METHODS
+        pinned = writes or PIN_COOKIE in request.COOKIES
+        token = _read_alias.set(choose_read_alias(pinned))
+        try:
+            response = self.get_response(request)
+        finally:
+            _read_alias.reset(token)
+        if writes and response.status_code < 400:
+            response.set_cookie(PIN_COOKIE, '1',
+                                max_age=settings.DATABASE_PIN_SECONDS,
+                                httponly=True, samesite='Lax')
+        return response
+
+
+def copy_database(source, target):
+    """Копирует файл SQLite source в target через backup API:
+    копия согласована даже при одновременной записи в source."""
+    with closing(sqlite3.connect(source)) as src, \
+            closing(sqlite3.connect(target)) as dst:
+        src.backup(dst)
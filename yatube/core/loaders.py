@@ -0,0 +1,43 @@
+import os
+
+from django.template import TemplateDoesNotExist
+from django.template.loaders import cached
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+class AutoreloadCachedLoader(cached.Loader):
+    """cached.Loader для разработки: шаблон разбирается один раз,
+    но при изменении его файла кэш сбрасывается. Проверка - один
+    stat на шаблон (вместе с base.html и include) за запрос, это
+    много дешевле разбора. Отсутствие шаблона не кэшируется, чтобы
+    новый файл был виден без перезапуска."""
+
+    def __init__(self, engine, loaders):
+        super().__init__(engine, loaders)
+        self.mtimes = {}
+
+    def get_template(self, template_name, skip=None):
+        try:
+            template = super().get_template(template_name, skip)
+        except TemplateDoesNotExist:
+            self.get_template_cache.pop(
+                self.cache_key(template_name, skip), None
+            )
+            raise
+        path = template.origin.name
+        mtime = _mtime(path)
+        if self.mtimes.setdefault(path, mtime) == mtime:
+            return template
+        self.reset()
+        self.mtimes = {path: mtime}
+        return super().get_template(template_name, skip)
+
+    def reset(self):
+        super().reset()
+        self.mtimes = {}
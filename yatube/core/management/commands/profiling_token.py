@@ -0,0 +1,20 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.profiling import FORMAT_HTML, FORMAT_PROF, make_token
+
+
+class Command(BaseCommand):
+    """Выдает значение заголовка X-Profile для профилирования
+    запросов без входа под staff."""
+    help = 'Печатает подписанное значение заголовка X-Profile'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=(FORMAT_HTML, FORMAT_PROF),
+                            default=FORMAT_HTML)
+
+    def handle(self, *args, **options):
+        self.stdout.write(make_token(options['format']))
+        self.stderr.write(
+            f'Действует {settings.PROFILING_TOKEN_MAX_AGE} с'
+        )
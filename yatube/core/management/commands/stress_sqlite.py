@@ -0,0 +1,114 @@
+import multiprocessing
+import os
+import sqlite3
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+# режим SQLite по умолчанию: журнал отката, полная синхронизация
+DEFAULT_PRAGMAS = {'journal_mode': 'DELETE', 'synchronous': 'FULL',
+                   'busy_timeout': 5000}
+
+SCHEMA = (
+    'CREATE TABLE post (id INTEGER PRIMARY KEY, author_id INTEGER, '
+    'text TEXT, pub_date REAL)',
+    'CREATE INDEX post_date_idx ON post (pub_date, id)',
+    'CREATE TABLE stats (author_id INTEGER PRIMARY KEY, posts INTEGER)',
+)
+# запросы, похожие на главную страницу и на post_create с
+# обновлением счетчика автора
+READ_SQL = ('SELECT id, author_id, text FROM post '
+            'ORDER BY pub_date DESC, id DESC LIMIT 10')
+COUNT_SQL = 'SELECT COUNT(*) FROM post'
+INSERT_SQL = 'INSERT INTO post (author_id, text, pub_date) VALUES (?, ?, ?)'
+UPDATE_SQL = 'UPDATE stats SET posts = posts + 1 WHERE author_id = ?'
+
+
+def connect(path, pragmas):
+    db = sqlite3.connect(path, timeout=5, isolation_level=None)
+    for name, value in pragmas.items():
+        db.execute(f'PRAGMA {name} = {value}')
+    return db
+
+
+def worker(path, pragmas, role, seconds, number):
+    """Читает или пишет seconds секунд; возвращает (операций, ошибок)."""
+    db = connect(path, pragmas)
+    done = errors = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        try:
+            if role == 'read':
+                db.execute(READ_SQL).fetchall()
+                db.execute(COUNT_SQL).fetchone()
+            else:
+                db.execute('BEGIN IMMEDIATE')
+                db.execute(INSERT_SQL, (number, 'Нагрузка', time.time()))
+                db.execute(UPDATE_SQL, (number,))
+                db.execute('COMMIT')
+            done += 1
+        except sqlite3.OperationalError:
+            errors += 1
+            if db.in_transaction:
+                db.execute('ROLLBACK')
+    db.close()
+    return role, done, errors
+
+
+def prepare(path, pragmas, rows, writers):
+    db = connect(path, pragmas)
+    for sql in SCHEMA:
+        db.execute(sql)
+    db.execute('BEGIN')
+    db.executemany(INSERT_SQL, ((i % 100, 'Пост', i) for i in range(rows)))
+    db.executemany('INSERT INTO stats VALUES (?, 0)',
+                   ((i,) for i in range(writers)))
+    db.execute('COMMIT')
+    db.close()
+
+
+def run_stress(pragmas, seconds, readers, writers, rows):
+    """Запускает readers читающих и writers пишущих процессов на
+    временной БД с pragmas. Возвращает число чтений, записей и
+    ошибок блокировки за seconds секунд."""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'stress.sqlite3')
+        prepare(path, pragmas, rows, writers)
+        jobs = [(path, pragmas, 'read', seconds, i) for i in range(readers)]
+        jobs += [(path, pragmas, 'write', seconds, i)
+                 for i in range(writers)]
+        with multiprocessing.Pool(len(jobs)) as pool:
+            results = pool.starmap(worker, jobs)
+    return {
+        'reads': sum(done for (role, done, _) in results if role == 'read'),
+        'writes': sum(done for (role, done, _) in results
+                      if role == 'write'),
+        'errors': sum(errors for (_, _, errors) in results),
+    }
+
+
+class Command(BaseCommand):
+    """Нагрузочная проверка SQLite: параллельные процессы читают
+    и пишут во временную БД сначала с настройками по умолчанию,
+    затем с SQLITE_PRAGMAS. Рабочая БД не затрагивается."""
+    help = 'Сравнивает пропускную способность SQLite до и после настройки'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seconds', type=float, default=5)
+        parser.add_argument('--readers', type=int, default=4)
+        parser.add_argument('--writers', type=int, default=2)
+        parser.add_argument('--rows', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        seconds = options['seconds']
+        for title, pragmas in (('по умолчанию', DEFAULT_PRAGMAS),
+                               ('SQLITE_PRAGMAS', settings.SQLITE_PRAGMAS)):
+            result = run_stress(pragmas, seconds, options['readers'],
+                                options['writers'], options['rows'])
+            self.stdout.write(
+                f'{title:>15}: чтений {result["reads"] / seconds:8.0f}/с, '
+                f'записей {result["writes"] / seconds:7.0f}/с, '
+                f'ошибок {result["errors"]}'
+            )
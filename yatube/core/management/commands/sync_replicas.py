@@ -0,0 +1,20 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from core.db import copy_database
+
+
+class Command(BaseCommand):
+    """Обновляет локальные реплики SQLite копией основной БД.
+    Между запусками реплики отстают, как настоящие."""
+    help = 'Копирует основную БД SQLite во все реплики'
+
+    def handle(self, *args, **options):
+        primary = settings.DATABASES[DEFAULT_DB_ALIAS]
+        if not primary['ENGINE'].endswith('sqlite3'):
+            raise CommandError('Копирование поддерживается только '
+                               'для SQLite')
+        for alias in settings.DATABASE_REPLICAS:
+            copy_database(primary['NAME'], settings.DATABASES[alias]['NAME'])
+            self.stdout.write(f'{alias} обновлена')
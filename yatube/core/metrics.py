@@ -0,0 +1,286 @@
+import atexit
+import glob
+import json
+import os
+import threading
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import connections
+
+# границы корзин гистограммы задержки, секунды
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5,
+                   5.0, 10.0)
+# метка для запросов, которые не дошли до какого-либо url
+UNRESOLVED = '<unresolved>'
+
+_missing = object()
+
+
+class Registry:
+    """Счетчики и гистограммы в формате Prometheus. Метки - кортеж
+    пар (имя, значение).
+
+    В многопроцессном режиме (METRICS_MULTIPROC_DIR) каждый процесс
+    не чаще раза в METRICS_FLUSH_INTERVAL секунд сохраняет свои
+    значения в отдельный файл каталога, а /metrics складывает файлы
+    всех процессов. Все метрики - счетчики и гистограммы, поэтому
+    сумма по процессам и есть общее значение. Файлы завершившихся
+    процессов остаются в сумме; каталог очищают при перезапуске
+    всего сервера."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.help = {}
+        self.reset()
+
+    def reset(self):
+        """Обнуляет значения; вызывается и в дочернем процессе после
+        fork, чтобы не посчитать значения родителя дважды."""
+        self.counters = {}
+        self.histograms = {}
+        self.file_id = f'{os.getpid()}-{time.time_ns()}'
+        self.flushed_at = 0.0
+
+    def describe(self, name, kind, text):
+        self.help[name] = (kind, text)
+
+    def inc(self, name, labels=(), value=1):
+        with self.lock:
+            key = (name, labels)
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, labels=(), buckets=LATENCY_BUCKETS):
+        with self.lock:
+            key = (name, labels)
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = {
+                    'buckets': list(buckets),
+                    'counts': [0] * len(buckets),
+                    'sum': 0.0,
+                    'count': 0,
+                }
+            for index, bound in enumerate(histogram['buckets']):
+                if value <= bound:
+                    histogram['counts'][index] += 1
+                    break
+            histogram['sum'] += value
+            histogram['count'] += 1
+
+    def dump(self):
+        with self.lock:
+            return {
+                'counters': [[name, labels, value] for
+                             ((name, labels), value)
+                             in self.counters.items()],
+                'histograms': [[name, labels, histogram] for
+                               ((name, labels), histogram)
+                               in self.histograms.items()],
+            }
+
+    def merge(self, data):
+        """Добавляет к значениям данные из dump() другого процесса."""
+        for name, labels, value in data['counters']:
+            self.inc(name, tuple(map(tuple, labels)), value)
+        with self.lock:
+            for name, labels, histogram in data['histograms']:
+                key = (name, tuple(map(tuple, labels)))
+                total = self.histograms.setdefault(key, {
+                    'buckets': histogram['buckets'],
+                    'counts': [0] * len(histogram['buckets']),
+                    'sum': 0.0,
+                    'count': 0,
+                })
+                total['counts'] = [a + b for (a, b) in
+                                   zip(total['counts'], histogram['counts'])]
+                total['sum'] += histogram['sum']
+                total['count'] += histogram['count']
+
+    def flush(self, force=False):
+        """Сохраняет значения процесса в каталог многопроцессного
+        режима; без force - не чаще METRICS_FLUSH_INTERVAL."""
+        directory = settings.METRICS_MULTIPROC_DIR
+        if not directory:
+            return
+        now = time.monotonic()
+        interval = settings.METRICS_FLUSH_INTERVAL
+        if not force and now - self.flushed_at < interval:
+            return
+        self.flushed_at = now
+        path = os.path.join(directory, f'metrics_{self.file_id}.json')
+        with open(f'{path}.tmp', 'w', encoding='utf-8') as file:
+            json.dump(self.dump(), file)
+        # replace атомарен: читатель не увидит недописанный файл
+        os.replace(f'{path}.tmp', path)
+
+    def collect(self):
+        """Значения для выдачи: свои или сумма по всем процессам."""
+        directory = settings.METRICS_MULTIPROC_DIR
+        if not directory:
+            return self
+        self.flush(force=True)
+        total = Registry()
+        total.help = self.help
+        for path in glob.glob(os.path.join(directory, 'metrics_*.json')):
+            with open(path, encoding='utf-8') as file:
+                total.merge(json.load(file))
+        return total
+
+    def render(self):
+        """Текст в формате выдачи Prometheus (text/plain 0.0.4)."""
+        families = {}
+        # строки гистограммы идут по возрастанию le, поэтому
+        # сортируются ряды, а не строки
+        counters = sorted(self.counters.items(),
+                          key=lambda item: repr(item[0]))
+        histograms = sorted(self.histograms.items(),
+                            key=lambda item: repr(item[0]))
+        for (name, labels), value in counters:
+            families.setdefault(name, []).append(
+                f'{name}{format_labels(labels)} {value}'
+            )
+        for (name, labels), histogram in histograms:
+            lines = families.setdefault(name, [])
+            cumulative = 0
+            for bound, count in zip(histogram['buckets'],
+                                    histogram['counts']):
+                cumulative += count
+                lines.append(f'{name}_bucket'
+                             f'{format_labels(labels + (("le", bound),))}'
+                             f' {cumulative}')
+            lines.append(f'{name}_bucket'
+                         f'{format_labels(labels + (("le", "+Inf"),))}'
+                         f' {histogram["count"]}')
+            lines.append(f'{name}_sum{format_labels(labels)} '
+                         f'{histogram["sum"]}')
+            lines.append(f'{name}_count{format_labels(labels)} '
+                         f'{histogram["count"]}')
+        output = []
+        for name in sorted(families):
+            kind, text = self.help.get(name, ('untyped', ''))
+            output.append(f'# HELP {name} {text}')
+            output.append(f'# TYPE {name} {kind}')
+            output.extend(families[name])
+        return '\n'.join(output) + '\n'
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    pairs = ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', r'\\')
+                         .replace('"', r'\"').replace('\n', r'\n'))
+        for (name, value) in labels
+    )
+    return '{' + pairs + '}'
+
+
+registry = Registry()
+registry.describe('yatube_http_requests_total', 'counter',
+                  'Число запросов по имени url, методу и статусу')
+registry.describe('yatube_http_request_duration_seconds', 'histogram',
+                  'Время обработки запроса по имени url')
+registry.describe('yatube_db_queries_total', 'counter',
+                  'Число запросов к БД по имени url')
+registry.describe('yatube_db_query_seconds_total', 'counter',
+                  'Суммарное время запросов к БД по имени url')
+registry.describe('yatube_cache_requests_total', 'counter',
+                  'Обращения к кэшу по префиксу ключа: hit или miss')
+registry.describe('yatube_thumbnail_requests_total', 'counter',
+                  'Запросы миниатюр sorl-thumbnail')
+registry.describe('yatube_thumbnails_generated_total', 'counter',
+                  'Созданные миниатюры sorl-thumbnail')
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=registry.reset)
+atexit.register(lambda: registry.flush(force=True))
+
+
+def view_name(request):
+    """Имя url запроса с пространством имен, например posts:index."""
+    match = getattr(request, 'resolver_match', None)
+    if match is None or not match.url_name:
+        return UNRESOLVED
+    return match.view_name
+
+
+class MetricsMiddleware:
+    """Считает запросы, их длительность и запросы к БД по имени url.
+    Должен стоять первым, чтобы время включало остальные middleware."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = {'queries': 0, 'time': 0.0}
+
+        def count_query(execute, sql, params, many, context):
+            started = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                stats['queries'] += 1
+                stats['time'] += time.perf_counter() - started
+
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(count_query))
+            response = self.get_response(request)
+        duration = time.perf_counter() - started
+
+        view = (('view', view_name(request)),)
+        registry.inc('yatube_http_requests_total',
+                     view + (('method', request.method),
+                             ('status', response.status_code)))
+        registry.observe('yatube_http_request_duration_seconds', duration,
+                         view)
+        if stats['queries']:
+            registry.inc('yatube_db_queries_total', view, stats['queries'])
+            registry.inc('yatube_db_query_seconds_total', view,
+                         stats['time'])
+        registry.flush()
+        return response
+
+
+def cache_prefix(key):
+    """Метка для ключа кэша: префикс, заданный в коде, без служебных
+    частей ключей Django. Например, страница из
+    cache_page(key_prefix='index_page.5') дает 'index_page', фрагмент
+    {% cache ... single_post %} - 'single_post'."""
+    for service in ('views.decorators.cache.cache_page.',
+                    'views.decorators.cache.cache_header.',
+                    'template.cache.'):
+        if key.startswith(service):
+            key = key[len(service):]
+            break
+    return key.split('.', 1)[0].split(':', 1)[0] or UNRESOLVED
+
+
+class MeteredCacheMixin:
+    """Примесь к бэкенду кэша: считает попадания и промахи get()
+    и get_many() по префиксу ключа."""
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, _missing, version)
+        hit = value is not _missing
+        registry.inc('yatube_cache_requests_total',
+                     (('prefix', cache_prefix(key)),
+                      ('result', 'hit' if hit else 'miss')))
+        return value if hit else default
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        found = super().get_many(keys, version)
+        for key in keys:
+            registry.inc('yatube_cache_requests_total',
+                         (('prefix', cache_prefix(key)),
+                          ('result', 'hit' if key in found else 'miss')))
+        return found
+
+
+class MeteredLocMemCache(MeteredCacheMixin, LocMemCache):
+    """LocMemCache с подсчетом попаданий и промахов."""
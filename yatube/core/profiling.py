@@ -0,0 +1,242 @@
+import cProfile
+import io
+import marshal
+import pstats
+import time
+from collections import defaultdict
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core import signing
+from django.db import connections
+from django.http import HttpResponse
+from django.template import Template
+from django.template.loader import render_to_string
+from django.utils.cache import add_never_cache_headers
+from sorl.thumbnail.base import ThumbnailBackend
+
+from .metrics import registry
+
+# профилирование включает параметр ?profile (для staff) или
+# подписанный заголовок X-Profile (для всех, см. make_token);
+# значение 'prof' отдает файл для pstats/snakeviz, иначе - HTML
+PROFILE_PARAM = 'profile'
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+PROFILE_SALT = 'core.profiling'
+FORMAT_PROF = 'prof'
+FORMAT_HTML = 'html'
+
+# сборщик данных текущего запроса; у остальных запросов он None,
+# и обертки ниже сразу вызывают исходный код
+_collector = ContextVar('profiling_collector', default=None)
+
+
+class Collector:
+    """Данные профилирования одного запроса."""
+
+    def __init__(self):
+        self.queries = []
+        self.templates = defaultdict(lambda: [0, 0.0])
+        self.thumbnails = []
+
+    def sql_wrapper(self, alias):
+        """Обертка execute_wrapper: замеряет каждый запрос к БД."""
+        def wrapper(execute, sql, params, many, context):
+            started = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                self.queries.append({
+                    'alias': alias,
+                    'sql': sql,
+                    'params': params,
+                    'many': many,
+                    'duration': time.perf_counter() - started,
+                })
+        return wrapper
+
+    def slowest_queries(self, limit):
+        """Самые долгие запросы с планом выполнения для SELECT."""
+        slowest = sorted(self.queries, key=lambda query: query['duration'],
+                         reverse=True)[:limit]
+        for query in slowest:
+            query['plan'] = explain(query)
+        return slowest
+
+
+def explain(query):
+    """План запроса или None, если его не построить."""
+    if query['many'] or not query['sql'].lstrip().upper().startswith(
+            'SELECT'):
+        return None
+    connection = connections[query['alias']]
+    sqlite = connection.vendor == 'sqlite'
+    prefix = 'EXPLAIN QUERY PLAN' if sqlite else 'EXPLAIN'
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(f'{prefix} {query["sql"]}', query['params'])
+            rows = cursor.fetchall()
+    except Exception as error:
+        return f'EXPLAIN не выполнен: {error}'
+    # в плане SQLite интересна только последняя колонка - описание шага
+    if sqlite:
+        return '\n'.join(str(row[-1]) for row in rows)
+    return '\n'.join(' '.join(str(col) for col in row) for row in rows)
+
+
+_template_render = Template.render
+
+
+def _profiled_render(self, context):
+    collector = _collector.get()
+    if collector is None:
+        return _template_render(self, context)
+    started = time.perf_counter()
+    try:
+        return _template_render(self, context)
+    finally:
+        stats = collector.templates[self.origin.template_name
+                                    or self.origin.name]
+        stats[0] += 1
+        stats[1] += time.perf_counter() - started
+
+
+Template.render = _profiled_render
+
+
+class ProfiledThumbnailBackend(ThumbnailBackend):
+    """Бэкенд sorl-thumbnail, который считает миниатюры для /metrics
+    и замеряет их получение для профилируемого запроса."""
+
+    def _create_thumbnail(self, *args, **kwargs):
+        registry.inc('yatube_thumbnails_generated_total')
+        return super()._create_thumbnail(*args, **kwargs)
+
+    def get_thumbnail(self, file_, geometry_string, **options):
+        registry.inc('yatube_thumbnail_requests_total')
+        collector = _collector.get()
+        if collector is None:
+            return super().get_thumbnail(file_, geometry_string, **options)
+        started = time.perf_counter()
+        try:
+            return super().get_thumbnail(file_, geometry_string, **options)
+        finally:
+            collector.thumbnails.append({
+                'file': str(file_),
+                'geometry': geometry_string,
+                'duration': time.perf_counter() - started,
+            })
+
+
+def make_token(output=FORMAT_HTML):
+    """Значение заголовка X-Profile, которое включает профилирование
+    на PROFILING_TOKEN_MAX_AGE секунд."""
+    return signing.dumps(output, salt=PROFILE_SALT)
+
+
+def requested_format(request):
+    """Формат отчета, если запрос нужно профилировать, иначе None."""
+    token = request.META.get(PROFILE_HEADER)
+    if token:
+        try:
+            return signing.loads(token, salt=PROFILE_SALT,
+                                 max_age=settings.PROFILING_TOKEN_MAX_AGE)
+        except signing.BadSignature:
+            return None
+    if PROFILE_PARAM in request.GET:
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_staff:
+            return request.GET[PROFILE_PARAM] or FORMAT_HTML
+    return None
+
+
+class ProfilingMiddleware:
+    """Профилирует один запрос: cProfile, время и планы запросов
+    к БД, время отрисовки шаблонов и миниатюр sorl-thumbnail.
+    Вместо страницы возвращает отчет. Должен стоять после
+    AuthenticationMiddleware."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        output = requested_format(request)
+        if output is None:
+            return self.get_response(request)
+
+        collector = Collector()
+        profiler = cProfile.Profile()
+        token = _collector.set(collector)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(
+                        collector.sql_wrapper(connection.alias)
+                    ))
+                profiler.enable()
+                try:
+                    response = self.get_response(request)
+                finally:
+                    profiler.disable()
+        finally:
+            _collector.reset(token)
+        duration = time.perf_counter() - started
+
+        if output == FORMAT_PROF:
+            report = self.prof_response(request, profiler)
+        else:
+            report = self.html_response(request, response, profiler,
+                                        collector, duration)
+        add_never_cache_headers(report)
+        return report
+
+    @staticmethod
+    def prof_response(request, profiler):
+        """Статистика cProfile в формате файла pstats."""
+        profiler.create_stats()
+        response = HttpResponse(marshal.dumps(profiler.stats),
+                                content_type='application/octet-stream')
+        name = request.path.strip('/').replace('/', '_') or 'index'
+        response['Content-Disposition'] = (
+            f'attachment; filename="{name}.prof"'
+        )
+        return response
+
+    @staticmethod
+    def html_response(request, response, profiler, collector, duration):
+        """Сводка по запросу в HTML."""
+        stream = io.StringIO()
+        stats = pstats.Stats(profiler, stream=stream)
+        stats.sort_stats('cumulative').print_stats(
+            settings.PROFILING_TOP_FUNCTIONS
+        )
+        queries_time = sum(query['duration'] for query in collector.queries)
+        context = {
+            'path': request.get_full_path(),
+            'status_code': response.status_code,
+            'duration': duration * 1000,
+            'queries_count': len(collector.queries),
+            'queries_time': queries_time * 1000,
+            'slowest_queries': [
+                dict(query, duration=query['duration'] * 1000)
+                for query in collector.slowest_queries(
+                    settings.PROFILING_EXPLAIN_LIMIT
+                )
+            ],
+            'templates': sorted(
+                ((name, count, total * 1000)
+                 for (name, (count, total)) in collector.templates.items()),
+                key=lambda row: row[2], reverse=True
+            ),
+            'thumbnails': [dict(thumbnail,
+                                duration=thumbnail['duration'] * 1000)
+                           for thumbnail in collector.thumbnails],
+            'thumbnails_time': sum(thumbnail['duration']
+                                   for thumbnail in collector.thumbnails
+                                   ) * 1000,
+            'profile': stream.getvalue(),
+        }
+        return HttpResponse(render_to_string('core/profiling.html', context,
+                                             request=request))
@@ -0,0 +1,134 @@
+import gzip
+import json
+import mimetypes
+import os
+import posixpath
+from urllib.parse import unquote
+from wsgiref.util import FileWrapper
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.utils.http import http_date, parse_http_date_safe
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# что имеет смысл сжимать; картинки и шрифты уже сжаты
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.map', '.svg', '.txt', '.html',
+                           '.json', '.xml', '.ico')
+# файлы с хешем в имени не меняются: браузер хранит их год
+# и не перепроверяет
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+# файлы без хеша браузер перепроверяет через час
+MUTABLE_CACHE_CONTROL = 'public, max-age=3600'
+# кодировки в порядке предпочтения: (кодировка, расширение файла)
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+def compress(path):
+    """Пишет рядом с файлом path сжатые копии .gz и .br (если
+    установлен brotli), если они меньше исходного файла."""
+    with open(path, 'rb') as file:
+        content = file.read()
+    variants = [('.gz', gzip.compress(content, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        variants.append(('.br', brotli.compress(content)))
+    for suffix, data in variants:
+        if len(data) < len(content):
+            with open(path + suffix, 'wb') as file:
+                file.write(data)
+
+
+def accepted_encodings(header):
+    """Кодировки из Accept-Encoding, кроме запрещенных q=0."""
+    encodings = set()
+    for item in header.split(','):
+        encoding, _, params = item.strip().partition(';')
+        quality = params.strip()
+        if quality.startswith('q='):
+            try:
+                if float(quality[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        encodings.add(encoding.strip().lower())
+    return encodings
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """ManifestStaticFilesStorage, который после collectstatic
+    сжимает файлы с хешем в имени: сервер отдает готовые .gz и .br
+    и не сжимает их на каждый запрос."""
+
+    def post_process(self, *args, **kwargs):
+        yield from super().post_process(*args, **kwargs)
+        for name in set(self.hashed_files.values()):
+            if name.endswith(COMPRESSIBLE_EXTENSIONS):
+                compress(self.path(name))
+
+
+class StaticFilesApplication:
+    """WSGI-обертка, которая отдает файлы из STATIC_ROOT, не доходя
+    до Django: без middleware, сессий и запросов к БД. Выбирает
+    сжатую копию по Accept-Encoding. Файлы из манифеста (с хешем
+    в имени) отдаются с immutable, остальные - с коротким max-age.
+    Чего нет в STATIC_ROOT, передается в application."""
+
+    def __init__(self, application, root, prefix):
+        self.application = application
+        self.root = os.path.realpath(root)
+        self.prefix = prefix
+        self.immutable = set()
+        try:
+            with open(os.path.join(self.root, 'staticfiles.json'),
+                      encoding='utf-8') as file:
+                self.immutable = set(json.load(file)['paths'].values())
+        except (OSError, ValueError, KeyError):
+            pass
+
+    def __call__(self, environ, start_response):
+        path = environ.get('PATH_INFO', '')
+        if (environ['REQUEST_METHOD'] not in ('GET', 'HEAD')
+                or not path.startswith(self.prefix)):
+            return self.application(environ, start_response)
+        name = posixpath.normpath(unquote(path[len(self.prefix):]))
+        full_path = os.path.realpath(os.path.join(self.root, name))
+        if (os.path.commonpath([self.root, full_path]) != self.root
+                or not os.path.isfile(full_path)):
+            return self.application(environ, start_response)
+        return self.serve(environ, start_response, name, full_path)
+
+    def serve(self, environ, start_response, name, full_path):
+        content_type, _ = mimetypes.guess_type(full_path)
+        headers = [
+            ('Content-Type', content_type or 'application/octet-stream'),
+            ('Cache-Control', IMMUTABLE_CACHE_CONTROL
+             if name in self.immutable else MUTABLE_CACHE_CONTROL),
+        ]
+        if name.endswith(COMPRESSIBLE_EXTENSIONS):
+            headers.append(('Vary', 'Accept-Encoding'))
+            accepted = accepted_encodings(
+                environ.get('HTTP_ACCEPT_ENCODING', '')
+            )
+            for encoding, suffix in ENCODINGS:
+                if (encoding in accepted
+                        and os.path.isfile(full_path + suffix)):
+                    full_path += suffix
+                    headers.append(('Content-Encoding', encoding))
+                    break
+
+        stat = os.stat(full_path)
+        headers.append(('Last-Modified', http_date(stat.st_mtime)))
+        since = parse_http_date_safe(
+            environ.get('HTTP_IF_MODIFIED_SINCE', '')
+        )
+        if since is not None and int(stat.st_mtime) <= since:
+            start_response('304 Not Modified', headers)
+            return []
+        headers.append(('Content-Length', str(stat.st_size)))
+        start_response('200 OK', headers)
+        if environ['REQUEST_METHOD'] == 'HEAD':
+            return []
+        wrapper = environ.get('wsgi.file_wrapper', FileWrapper)
+        return wrapper(open(full_path, 'rb'))
@@ -7,3 +7,19 @@ def addclass(field, css):
     """Функция-фильтр. Возвращает объект field, содержащий
     дополнительные атрибуты из параметра css."""
     return field.as_widget(attrs={'class': css})
+
+
+# параметры, которые задают страницу; остальные (например, q)
+# переходят в ссылки паджинатора как есть
+PAGE_PARAMS = ('page', 'after', 'before')
+
+
+@register.simple_tag(takes_context=True)
+def page_query(context):
+    """Строка запроса текущей страницы без номера страницы
+    и курсора; паджинатор дописывает к ней свой параметр.
+    Считается один раз на шаблон: {% page_query as page_params %}."""
+    query = context['request'].GET.copy()
+    for name in PAGE_PARAMS:
+        query.pop(name, None)
+    return query.urlencode()
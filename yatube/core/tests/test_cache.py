@@ -0,0 +1,79 @@
+from django.core.cache import caches
+from django.test import SimpleTestCase
+
+from ..cache import GENERATION_KEY, LocalStore, TwoTierCache
+from ..metrics import registry
+
+
+class TwoTierCacheTests(SimpleTestCase):
+    """Проверка двухуровневого кэша."""
+
+    def setUp(self):
+        caches['shared'].clear()
+        self.first = self.make_cache()
+        self.second = self.make_cache()
+
+    @staticmethod
+    def make_cache(**options):
+        """Кэш со своим локальным уровнем, как в отдельном процессе."""
+        options = dict({'GENERATION_CHECK_INTERVAL': 0}, **options)
+        tier = TwoTierCache('shared', {'OPTIONS': options})
+        tier.local = LocalStore(options.get('LOCAL_MAX_ENTRIES', 1000))
+        return tier
+
+    @staticmethod
+    def tier_count(tier, result):
+        return registry.counters.get(
+            ('yatube_cache_tier_requests_total',
+             (('tier', tier), ('result', result))), 0
+        )
+
+    def test_local_tier_hit(self):
+        """Повторное чтение обслуживает локальный уровень."""
+        self.first.set('key', 'value')
+        hits = self.tier_count('local', 'hit')
+        shared_hits = self.tier_count('shared', 'hit')
+        self.assertEqual(self.second.get('key'), 'value')
+        self.assertEqual(self.second.get('key'), 'value')
+        self.assertEqual(self.tier_count('shared', 'hit'), shared_hits + 1)
+        self.assertEqual(self.tier_count('local', 'hit'), hits + 1)
+        self.assertEqual(self.second.get_many(['key', 'none']),
+                         {'key': 'value'})
+
+    def test_generation_broadcast(self):
+        """incr и invalidate в одном процессе сбрасывают локальные
+        копии в остальных."""
+        self.first.set('version', 1)
+        self.assertEqual(self.second.get('version'), 1)
+        self.first.incr('version')
+        self.assertEqual(self.second.get('version'), 2)
+        self.first.invalidate('version')
+        self.assertIsNone(self.second.get('version'))
+
+    def test_delete_keeps_other_local_tiers(self):
+        """delete (например, снятие блокировки) не меняет поколение
+        и не очищает локальные уровни других процессов."""
+        self.first.set('page', 'страница')
+        self.assertEqual(self.second.get('page'), 'страница')
+        generation = caches['shared'].get(GENERATION_KEY)
+        self.first.add('lock', True, 30)
+        self.first.delete('lock')
+        self.first.delete_many(['lock', 'other'])
+        self.assertIsNone(self.first.get('lock'))
+        self.assertEqual(caches['shared'].get(GENERATION_KEY), generation)
+        self.assertIn(self.second.make_key('page'), self.second.local.data)
+
+    def test_values_are_copies(self):
+        """Изменение значения из кэша не меняет закэшированное."""
+        self.first.set('list', [1])
+        self.first.get('list').append(2)
+        self.assertEqual(self.first.get('list'), [1])
+
+    def test_local_tier_is_bounded(self):
+        """Локальный уровень вытесняет давно не читанные ключи."""
+        tier = self.make_cache(LOCAL_MAX_ENTRIES=2)
+        for key in ('a', 'b', 'c'):
+            tier.set(key, key)
+        self.assertEqual(list(tier.local.data),
+                         [tier.make_key('b'), tier.make_key('c')])
+        self.assertEqual(tier.get('a'), 'a')
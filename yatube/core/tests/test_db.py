@@ -0,0 +1,239 @@
+import os
+import sqlite3
+import tempfile
+from contextlib import closing
+from io import StringIO
+
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import OperationalError, connection, connections
+from django.http import HttpResponse
+from django.test import (RequestFactory, SimpleTestCase, TestCase,
+                         override_settings)
+from django.urls import reverse
+
+from jobs.models import Job
+from jobs.queue import enqueue, job
+from posts.models import Post, User, UserStats
+
+from ..backends.sqlite3.base import DatabaseWrapper
+from ..db import (PIN_COOKIE, PrimaryReplicaRouter, ReplicaPinningMiddleware,
+                  copy_database, immediate_atomic)
+
+CALLS = []
+
+# соединение с временной БД в файле: в тестовой БД в памяти
+# нет ни WAL, ни блокировок между соединениями
+FILE_ALIAS = 'file_db'
+
+
+class SQLiteTuningTests(TestCase):
+    """Проверка настройки соединений SQLite."""
+
+    def test_connection_pragmas(self):
+        """Новое соединение получает PRAGMA из настроек."""
+        pragmas = (
+            ('synchronous', 1),
+            ('temp_store', 2),
+            ('busy_timeout', settings.SQLITE_PRAGMAS['busy_timeout']),
+            ('cache_size', settings.SQLITE_PRAGMAS['cache_size']),
+        )
+        with connection.cursor() as cursor:
+            for name, value in pragmas:
+                with self.subTest(pragma=name):
+                    cursor.execute(f'PRAGMA {name}')
+                    self.assertEqual(cursor.fetchone()[0], value)
+
+    def test_block_errors_are_not_retried(self):
+        """Ошибка внутри блока immediate_atomic не повторяет блок:
+        повторяется только BEGIN."""
+        calls = []
+        with self.assertRaises(OperationalError):
+            with immediate_atomic():
+                calls.append(1)
+                raise OperationalError('database is locked')
+        self.assertEqual(calls, [1])
+
+
+@override_settings(SQLITE_PRAGMAS=dict(settings.SQLITE_PRAGMAS,
+                                       busy_timeout=0),
+                   SQLITE_BUSY_RETRY_DELAY=0)
+class ImmediateTransactionTests(SimpleTestCase):
+    """Проверка транзакций BEGIN IMMEDIATE на БД в файле."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'db.sqlite3')
+        wrapper = DatabaseWrapper(
+            dict(connection.settings_dict, NAME=self.path), FILE_ALIAS
+        )
+        connections[FILE_ALIAS] = wrapper
+        self.addCleanup(delattr, connections._connections, FILE_ALIAS)
+        self.addCleanup(wrapper.close)
+        with wrapper.cursor() as cursor:
+            cursor.execute('CREATE TABLE t (x)')
+
+    def other_connection(self):
+        conn = sqlite3.connect(self.path, timeout=0, isolation_level=None)
+        self.addCleanup(conn.close)
+        return conn
+
+    def test_file_database_pragmas(self):
+        """Соединение с файлом БД переходит в режим WAL."""
+        with connections[FILE_ALIAS].cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            self.assertEqual(cursor.fetchone()[0], 'wal')
+
+    def test_lock_is_taken_at_begin(self):
+        """Блокировка на запись берется в начале транзакции, еще до
+        первой записи."""
+        other = self.other_connection()
+        with immediate_atomic(FILE_ALIAS):
+            with self.assertRaisesRegex(sqlite3.OperationalError,
+                                        'database is locked'):
+                other.execute('BEGIN IMMEDIATE')
+        other.execute('BEGIN IMMEDIATE')
+        other.execute('ROLLBACK')
+
+    def test_busy_begin_is_retried_without_running_block(self):
+        """Пока БД занята, BEGIN повторяется, а код блока не
+        выполняется ни разу."""
+        other = self.other_connection()
+        other.execute('BEGIN IMMEDIATE')
+        calls = []
+        with self.assertRaises(OperationalError):
+            with immediate_atomic(FILE_ALIAS):
+                calls.append(1)
+        self.assertEqual(calls, [])
+        other.execute('ROLLBACK')
+        with immediate_atomic(FILE_ALIAS):
+            calls.append(1)
+        self.assertEqual(calls, [1])
+
+
+@override_settings(DATABASE_REPLICAS=['replica1', 'replica2'])
+class ReplicaRoutingTests(SimpleTestCase):
+    """Проверка роутера реплик и закрепления за основной БД."""
+
+    def setUp(self):
+        self.router = PrimaryReplicaRouter()
+        self.factory = RequestFactory()
+
+    def read_alias(self, request):
+        """Через middleware выполняет view, который запоминает,
+        откуда читала бы ORM."""
+        aliases = []
+
+        def view(request):
+            aliases.append(self.router.db_for_read(Post))
+            aliases.append(self.router.db_for_read(Post))
+            return HttpResponse()
+
+        response = ReplicaPinningMiddleware(view)(request)
+        self.assertEqual(aliases[0], aliases[1])
+        return aliases[0], response
+
+    def test_routes(self):
+        """Запись и миграции - в основную БД; вне запроса чтение
+        тоже из основной БД."""
+        self.assertEqual(self.router.db_for_read(Post), 'default')
+        self.assertEqual(self.router.db_for_write(Post), 'default')
+        self.assertTrue(self.router.allow_migrate('default', 'posts'))
+        self.assertFalse(self.router.allow_migrate('replica1', 'posts'))
+
+    def test_primary_apps_ignore_replicas(self):
+        """Сессии, пользователи и задачи очереди читаются из основной
+        БД и внутри запроса, который читает с реплики."""
+        aliases = {}
+
+        def view(request):
+            for model in (Post, Session, User, Job):
+                aliases[model] = self.router.db_for_read(model)
+            return HttpResponse()
+
+        ReplicaPinningMiddleware(view)(self.factory.get('/'))
+        self.assertIn(aliases.pop(Post), settings.DATABASE_REPLICAS)
+        self.assertEqual(set(aliases.values()), {'default'})
+
+    def test_read_your_writes(self):
+        """Запись закрепляет пользователя за основной БД на
+        DATABASE_PIN_SECONDS, чтение без cookie идет на реплику."""
+        alias, response = self.read_alias(self.factory.get('/'))
+        self.assertIn(alias, settings.DATABASE_REPLICAS)
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+        alias, response = self.read_alias(self.factory.post('/'))
+        self.assertEqual(alias, 'default')
+        self.assertEqual(response.cookies[PIN_COOKIE]['max-age'],
+                         settings.DATABASE_PIN_SECONDS)
+
+        request = self.factory.get('/')
+        request.COOKIES[PIN_COOKIE] = '1'
+        alias, _ = self.read_alias(request)
+        self.assertEqual(alias, 'default')
+
+    def test_copy_database(self):
+        """sync_replicas копирует основную БД в файл реплики."""
+        with tempfile.TemporaryDirectory() as directory:
+            source = os.path.join(directory, 'primary.sqlite3')
+            target = os.path.join(directory, 'replica.sqlite3')
+            with closing(sqlite3.connect(source)) as conn, conn:
+                conn.execute('CREATE TABLE t (x)')
+                conn.execute('INSERT INTO t VALUES (1)')
+            copy_database(source, target)
+            with closing(sqlite3.connect(target)) as conn:
+                self.assertEqual(
+                    conn.execute('SELECT x FROM t').fetchall(), [(1,)]
+                )
+
+
+@job
+def remember(value):
+    """Тестовая задача: запоминает аргумент."""
+    CALLS.append(value)
+
+
+@override_settings(DATABASE_REPLICAS=['replica1'])
+class LaggingReplicaTests(TestCase):
+    """Команды вне запроса и кэш страниц не читают с отставшей
+    реплики."""
+
+    def setUp(self):
+        CALLS.clear()
+        # реплика, которую еще ни разу не синхронизировали: в ней нет
+        # ни строк, ни даже таблиц, любое чтение с нее упадет
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        replica = DatabaseWrapper(
+            dict(connection.settings_dict,
+                 NAME=os.path.join(directory.name, 'replica.sqlite3')),
+            'replica1'
+        )
+        connections['replica1'] = replica
+        self.addCleanup(delattr, connections._connections, 'replica1')
+        self.addCleanup(replica.close)
+
+    def test_commands_read_primary(self):
+        """recount и run_worker видят свежие строки основной БД."""
+        author = User.objects.create_user(username='author')
+        Post.objects.create(text='Пост', author=author)
+        call_command('recount', stdout=StringIO())
+        self.assertEqual(UserStats.objects.get(user=author).posts_count, 1)
+        enqueue(remember, 'задача')
+        call_command('run_worker', '--once', stdout=StringIO())
+        self.assertEqual(CALLS, ['задача'])
+        self.assertFalse(Job.objects.exists())
+
+    def test_cached_pages_read_primary(self):
+        """Страница, которая попадет в общий кэш, строится по основной
+        БД, хотя запрос гостя читает с реплики."""
+        cache.clear()
+        author = User.objects.create_user(username='author')
+        Post.objects.create(text='Свежий пост', author=author)
+        for url in (reverse('posts:index'),
+                    reverse('posts:profile', args=['author'])):
+            with self.subTest(url=url):
+                self.assertContains(self.client.get(url), 'Свежий пост')
@@ -0,0 +1,47 @@
+import os
+import tempfile
+
+from django.template import Context, Engine, TemplateDoesNotExist
+from django.test import SimpleTestCase
+
+
+class AutoreloadCachedLoaderTests(SimpleTestCase):
+    """Проверка кэша шаблонов со сбросом при изменении файла."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.dir = directory.name
+        self.engine = Engine(dirs=[self.dir], loaders=[(
+            'core.loaders.AutoreloadCachedLoader',
+            ['django.template.loaders.filesystem.Loader'],
+        )])
+
+    def write(self, name, text, mtime):
+        path = os.path.join(self.dir, name)
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(text)
+        os.utime(path, (mtime, mtime))
+
+    def render(self, name):
+        return self.engine.get_template(name).render(Context())
+
+    def test_reload_on_change(self):
+        """Шаблон разбирается один раз и заново - после правки,
+        в том числе правки родительского шаблона."""
+        self.write('base.html', 'база {% block b %}{% endblock %}', 1)
+        self.write('page.html',
+                   '{% extends "base.html" %}{% block b %}1{% endblock %}',
+                   1)
+        template = self.engine.get_template('page.html')
+        self.assertIs(self.engine.get_template('page.html'), template)
+        self.assertEqual(self.render('page.html'), 'база 1')
+        self.write('base.html', 'новая {% block b %}{% endblock %}', 2)
+        self.assertEqual(self.render('page.html'), 'новая 1')
+
+    def test_new_template_is_found(self):
+        """Отсутствие шаблона не кэшируется."""
+        with self.assertRaises(TemplateDoesNotExist):
+            self.engine.get_template('new.html')
+        self.write('new.html', 'есть', 1)
+        self.assertEqual(self.render('new.html'), 'есть')
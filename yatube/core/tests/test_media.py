@@ -0,0 +1,108 @@
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.test import TestCase, override_settings
+
+from ..views import parse_range
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+CONTENT = bytes(range(256)) * 4
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class MediaTests(TestCase):
+    """Проверка отдачи загруженных файлов."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        os.makedirs(os.path.join(TEMP_MEDIA_ROOT, 'posts'))
+        with open(os.path.join(TEMP_MEDIA_ROOT, 'posts', 'a.jpg'),
+                  'wb') as file:
+            file.write(CONTENT)
+        with open(os.path.join(TEMP_MEDIA_ROOT, 'posts', 'мой кот.jpg'),
+                  'wb') as file:
+            file.write(CONTENT)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    url = '/media/posts/a.jpg'
+
+    def test_whole_file(self):
+        """Файл отдается целиком через FileResponse."""
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), CONTENT)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        response = self.client.get(
+            self.url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']
+        )
+        self.assertEqual(response.status_code, 304)
+
+    def test_range_requests(self):
+        """Range отдает часть файла, диапазон вне файла - 416."""
+        for header, status, body in (
+            ('bytes=10-19', 206, CONTENT[10:20]),
+            ('bytes=1000-', 206, CONTENT[1000:]),
+            ('bytes=-5', 206, CONTENT[-5:]),
+            ('bytes=5000-', 416, b''),
+            ('bytes=0-1,5-6', 200, CONTENT),
+            ('bytes=5-3', 200, CONTENT),
+        ):
+            with self.subTest(header=header):
+                response = self.client.get(self.url, HTTP_RANGE=header)
+                self.assertEqual(response.status_code, status)
+                if response.streaming:
+                    self.assertEqual(
+                        b''.join(response.streaming_content), body
+                    )
+        response = self.client.get(self.url, HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response['Content-Range'], 'bytes 10-19/1024')
+        self.assertEqual(response['Content-Length'], '10')
+        response = self.client.get(self.url, HTTP_RANGE='bytes=10-19',
+                                   HTTP_IF_RANGE='старая дата')
+        self.assertEqual(response.status_code, 200)
+
+    def test_missing_and_outside_files(self):
+        """Нет файла или путь ведет из MEDIA_ROOT - 404."""
+        for url in ('/media/posts/none.jpg', '/media/../manage.py',
+                    '/media/posts/'):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_accel_offload(self):
+        """С MEDIA_ACCEL_HEADER файл передает фронтовой сервер."""
+        with self.settings(MEDIA_ACCEL_HEADER='X-Accel-Redirect'):
+            response = self.client.get(self.url)
+            self.assertEqual(response['X-Accel-Redirect'],
+                             '/protected-media/posts/a.jpg')
+            self.assertEqual(response.content, b'')
+            response = self.client.get('/media/posts/мой кот.jpg')
+            self.assertEqual(
+                response['X-Accel-Redirect'],
+                '/protected-media/posts/%D0%BC%D0%BE%D0%B9%20'
+                '%D0%BA%D0%BE%D1%82.jpg'
+            )
+        with self.settings(MEDIA_ACCEL_HEADER='X-Sendfile'):
+            response = self.client.get(self.url)
+            self.assertEqual(
+                response['X-Sendfile'],
+                os.path.join(TEMP_MEDIA_ROOT, 'posts', 'a.jpg')
+            )
+
+    def test_parse_range(self):
+        """Разбор заголовка Range."""
+        self.assertEqual(parse_range('bytes=0-', 10), (0, 10))
+        self.assertEqual(parse_range('bytes=5-100', 10), (5, 5))
+        self.assertEqual(parse_range('bytes=-0', 10), (None, None))
+        self.assertEqual(parse_range('bytes=10-', 10), (None, None))
+        self.assertIsNone(parse_range('bytes=5-3', 10))
+        self.assertIsNone(parse_range('bytes=20-3', 10))
+        self.assertIsNone(parse_range('items=0-1', 10))
+        self.assertIsNone(parse_range(None, 10))
@@ -0,0 +1,108 @@
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.core.cache import cache
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from posts.models import User
+from ..metrics import Registry, cache_prefix, registry
+
+TEMP_METRICS_DIR = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+class MetricsTests(TestCase):
+    """Проверка сбора и выдачи метрик."""
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_METRICS_DIR, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+        self.staff_client = Client()
+        self.staff_client.force_login(
+            User.objects.create_user(username='admin', is_staff=True)
+        )
+
+    def test_views_and_cache_are_counted(self):
+        """Запросы, время, запросы к БД и кэш считаются по имени url."""
+        self.guest_client.get(reverse('posts:index'))
+        self.guest_client.get(reverse('posts:index'))
+        response = self.staff_client.get(reverse('metrics'))
+        self.assertEqual(response['Content-Type'],
+                         'text/plain; version=0.0.4; charset=utf-8')
+        text = response.content.decode()
+        self.assertIn('# TYPE yatube_http_requests_total counter', text)
+        self.assertIn('yatube_http_requests_total{view="posts:index",'
+                      'method="GET",status="200"}', text)
+        self.assertIn('yatube_http_request_duration_seconds_bucket{'
+                      'view="posts:index",le="+Inf"}', text)
+        self.assertIn('yatube_db_queries_total{view="posts:index"}', text)
+        self.assertIn('yatube_cache_requests_total{prefix="index_page",'
+                      'result="hit"}', text)
+
+    def test_endpoint_is_closed_by_default(self):
+        """Без токена метрики видит только staff."""
+        url = reverse('metrics')
+        self.assertEqual(self.guest_client.get(url).status_code, 403)
+        self.assertEqual(self.guest_client.get(
+            url, HTTP_AUTHORIZATION='Bearer '
+        ).status_code, 403)
+        self.assertEqual(self.staff_client.get(url).status_code, 200)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_token_protects_endpoint(self):
+        """С METRICS_TOKEN метрики отдаются еще и по токену."""
+        url = reverse('metrics')
+        self.assertEqual(self.guest_client.get(url).status_code, 403)
+        self.assertEqual(self.guest_client.get(
+            url, HTTP_AUTHORIZATION='Bearer wrong'
+        ).status_code, 403)
+        response = self.guest_client.get(url,
+                                         HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+
+    def test_cache_prefix(self):
+        """Метка кэша - префикс без служебной части ключа Django."""
+        keys = (
+            ('views.decorators.cache.cache_page.index_page.17.GET.abc',
+             'index_page'),
+            ('views.decorators.cache.cache_header.index_page.17.abc',
+             'index_page'),
+            ('template.cache.single_post.abc', 'single_post'),
+            ('index_page.version', 'index_page'),
+            ('session:abc', 'session'),
+        )
+        for key, prefix in keys:
+            with self.subTest(key=key):
+                self.assertEqual(cache_prefix(key), prefix)
+
+    @override_settings(METRICS_MULTIPROC_DIR=TEMP_METRICS_DIR)
+    def test_multiprocess_values_are_summed(self):
+        """Значения процессов складываются, а дочерний процесс
+        после fork не повторяет значения родителя."""
+        registry.inc('yatube_test_total', value=2)
+        registry.observe('yatube_test_seconds', 0.02)
+        pid = os.fork()
+        if pid == 0:
+            registry.inc('yatube_test_total', value=3)
+            registry.observe('yatube_test_seconds', 0.2)
+            registry.flush(force=True)
+            os._exit(0)
+        os.waitpid(pid, 0)
+
+        other = Registry()
+        other.file_id = 'other'
+        other.inc('yatube_test_total', value=5)
+        other.flush(force=True)
+
+        text = registry.collect().render()
+        self.assertIn('yatube_test_total 10\n', text)
+        self.assertIn('yatube_test_seconds_count 2\n', text)
+        self.assertIn('yatube_test_seconds_bucket{le="0.025"} 1\n', text)
+        self.assertIn('yatube_test_seconds_bucket{le="0.25"} 2\n', text)
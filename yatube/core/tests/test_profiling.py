@@ -0,0 +1,97 @@
+import marshal
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from posts.models import Post
+from ..profiling import FORMAT_PROF, make_token
+
+User = get_user_model()
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ProfilingMiddlewareTests(TestCase):
+    """Проверка профилирования отдельных запросов."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.staff = User.objects.create_user(username='staff',
+                                             is_staff=True)
+        cls.user = User.objects.create_user(username='user')
+        Post.objects.create(
+            text='Пост с картинкой', author=cls.user,
+            image=SimpleUploadedFile('small.gif', SMALL_GIF,
+                                     content_type='image/gif')
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.staff_client = Client()
+        self.staff_client.force_login(self.staff)
+        self.user_client = Client()
+        self.user_client.force_login(self.user)
+
+    def test_staff_gets_html_report(self):
+        """Staff с ?profile получает сводку вместо страницы."""
+        response = self.staff_client.get(reverse('posts:index'),
+                                         {'profile': ''})
+        self.assertTemplateUsed(response, 'core/profiling.html')
+        self.assertIn('no-cache', response['Cache-Control'])
+        context = response.context
+        self.assertGreater(context['queries_count'], 0)
+        plans = [query['plan'] for query in context['slowest_queries']]
+        self.assertTrue(any('posts_post' in (plan or '') for plan in plans))
+        templates = {name for (name, _, _) in context['templates']}
+        self.assertIn('posts/index.html', templates)
+        self.assertIn('posts/includes/single_post.html', templates)
+        self.assertEqual(len(context['thumbnails']), 1)
+        self.assertIn('posts/views.py', context['profile'])
+
+    def test_other_users_get_the_page(self):
+        """Без прав staff параметр ?profile ничего не меняет."""
+        response = self.user_client.get(reverse('posts:index'),
+                                        {'profile': ''})
+        self.assertTemplateUsed(response, 'posts/index.html')
+        self.assertTemplateNotUsed(response, 'core/profiling.html')
+
+    def test_signed_header_enables_profiling(self):
+        """Подписанный заголовок включает профилирование для
+        любого клиента, поддельный - нет."""
+        guest = Client()
+        response = guest.get(reverse('posts:index'),
+                             HTTP_X_PROFILE=make_token())
+        self.assertTemplateUsed(response, 'core/profiling.html')
+        response = guest.get(reverse('posts:index'),
+                             HTTP_X_PROFILE=make_token() + 'x')
+        self.assertTemplateNotUsed(response, 'core/profiling.html')
+
+    def test_prof_download(self):
+        """Формат prof отдает статистику cProfile файлом."""
+        response = self.staff_client.get(reverse('posts:index'),
+                                         {'profile': FORMAT_PROF})
+        self.assertIn('attachment', response['Content-Disposition'])
+        stats = marshal.loads(response.content)
+        self.assertTrue(any(name == 'index'
+                            for (_, _, name) in stats))
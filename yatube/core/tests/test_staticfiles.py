@@ -0,0 +1,121 @@
+import gzip
+import json
+import os
+import tempfile
+
+from django.core.management import call_command
+from django.test import SimpleTestCase, override_settings
+from django.utils.http import http_date
+
+from ..staticfiles import StaticFilesApplication
+
+CSS = b'body { color: red; }\n' * 100
+
+
+class StaticFilesTests(SimpleTestCase):
+    """Проверка сборки и раздачи статики."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = directory.name
+        self.write('css/site.css', CSS)
+        self.write('css/site.0123456789ab.css', CSS)
+        self.write('css/site.0123456789ab.css.gz', gzip.compress(CSS))
+        self.write('staticfiles.json', json.dumps({
+            'paths': {'css/site.css': 'css/site.0123456789ab.css'},
+        }).encode())
+        self.app = StaticFilesApplication(self.django_app, self.root,
+                                          '/static/')
+
+    def write(self, name, content):
+        path = os.path.join(self.root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as file:
+            file.write(content)
+
+    @staticmethod
+    def django_app(environ, start_response):
+        start_response('404 Not Found', [])
+        return [b'django']
+
+    def get(self, path, method='GET', **headers):
+        environ = dict(headers, PATH_INFO=path, REQUEST_METHOD=method)
+        response = {}
+
+        def start_response(status, headers):
+            response['status'] = status
+            response['headers'] = dict(headers)
+
+        body = b''.join(self.app(environ, start_response))
+        return response['status'], response['headers'], body
+
+    def test_hashed_file_is_immutable_and_compressed(self):
+        """Файл с хешем отдается навсегда и сжатым, если клиент
+        принимает gzip."""
+        status, headers, body = self.get(
+            '/static/css/site.0123456789ab.css',
+            HTTP_ACCEPT_ENCODING='gzip, deflate'
+        )
+        self.assertEqual(status, '200 OK')
+        self.assertIn('immutable', headers['Cache-Control'])
+        self.assertEqual(headers['Content-Encoding'], 'gzip')
+        self.assertEqual(headers['Vary'], 'Accept-Encoding')
+        self.assertEqual(gzip.decompress(body), CSS)
+
+    def test_negotiation(self):
+        """Без gzip в Accept-Encoding (или с q=0) файл не сжимается,
+        файл без хеша кэшируется ненадолго."""
+        for encoding in ('', 'br', 'gzip;q=0'):
+            with self.subTest(encoding=encoding):
+                _, headers, body = self.get(
+                    '/static/css/site.0123456789ab.css',
+                    HTTP_ACCEPT_ENCODING=encoding
+                )
+                self.assertNotIn('Content-Encoding', headers)
+                self.assertEqual(body, CSS)
+        _, headers, _ = self.get('/static/css/site.css')
+        self.assertNotIn('immutable', headers['Cache-Control'])
+
+    def test_conditional_and_head(self):
+        """If-Modified-Since дает 304, HEAD - заголовки без тела."""
+        _, headers, _ = self.get('/static/css/site.css')
+        status, _, body = self.get(
+            '/static/css/site.css',
+            HTTP_IF_MODIFIED_SINCE=headers['Last-Modified']
+        )
+        self.assertEqual((status, body), ('304 Not Modified', b''))
+        status, headers, body = self.get('/static/css/site.css', 'HEAD')
+        self.assertEqual((status, body), ('200 OK', b''))
+        self.assertEqual(headers['Content-Length'], str(len(CSS)))
+        self.assertNotEqual(headers['Last-Modified'], http_date(0))
+
+    def test_other_requests_go_to_django(self):
+        """Чужие пути, выход за STATIC_ROOT и POST идут в Django."""
+        for path, method in (('/static/missing.css', 'GET'),
+                             ('/static/../static/css/site.css', 'POST'),
+                             ('/static/%2e%2e/etc/passwd', 'GET'),
+                             ('/posts/', 'GET')):
+            with self.subTest(path=path):
+                self.assertEqual(self.get(path, method)[2], b'django')
+
+    def test_collectstatic_writes_compressed_copies(self):
+        """collectstatic пишет файлы с хешем и их сжатые копии."""
+        with tempfile.TemporaryDirectory() as source, \
+                tempfile.TemporaryDirectory() as root:
+            os.makedirs(os.path.join(source, 'css'))
+            with open(os.path.join(source, 'css', 'site.css'), 'wb') as file:
+                file.write(CSS)
+            storage = 'core.staticfiles.CompressedManifestStaticFilesStorage'
+            with override_settings(STATIC_ROOT=root,
+                                   STATICFILES_DIRS=[source],
+                                   STATICFILES_STORAGE=storage):
+                call_command('collectstatic', interactive=False,
+                             verbosity=0)
+            with open(os.path.join(root, 'staticfiles.json')) as file:
+                hashed = json.load(file)['paths']['css/site.css']
+            with gzip.open(os.path.join(root, hashed + '.gz')) as file:
+                self.assertEqual(file.read(), CSS)
+            self.assertFalse(os.path.exists(
+                os.path.join(root, 'css', 'site.css.gz')
+            ))
@@ -1,4 +1,25 @@
+import mimetypes
+import os
+import posixpath
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import (FileResponse, Http404, HttpResponse,
+                         HttpResponseForbidden, HttpResponseNotModified,
+                         StreamingHttpResponse)
 from django.shortcuts import render
+from django.utils._os import safe_join
+from django.utils.crypto import constant_time_compare
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+from .metrics import registry
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+# размер куска при отдаче части файла
+CHUNK_SIZE = 64 * 1024
 
 
 def page_not_found(request, exception):
@@ -11,3 +32,115 @@ def csrf_failure(request, reason=''):
 
 def internal_server_error(request, reason=''):
     return render(request, 'core/500.html')
+
+
+def metrics(request):
+    """Метрики в формате Prometheus. Отдаются только staff или
+    с заголовком Authorization: Bearer <METRICS_TOKEN>: в них время
+    ответа страниц и префиксы ключей кэша."""
+    token = settings.METRICS_TOKEN
+    authorized = bool(token) and constant_time_compare(
+        request.META.get('HTTP_AUTHORIZATION', ''), f'Bearer {token}'
+    )
+    if not (authorized or request.user.is_staff):
+        return HttpResponseForbidden()
+    return HttpResponse(registry.collect().render(),
+                        content_type='text/plain; version=0.0.4; '
+                                     'charset=utf-8')
+
+
+def parse_range(header, size):
+    """Диапазон (начало, длина) из заголовка Range для файла
+    размером size. None - заголовка нет или он не поддерживается
+    (несколько диапазонов) или он неверный (конец раньше начала):
+    отдается весь файл. (None, None) - диапазон вне файла."""
+    match = RANGE_RE.match(header.strip()) if header else None
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first:
+        # bytes=-N: последние N байт
+        if not last:
+            return None
+        length = min(int(last), size)
+        return (size - length, length) if length else (None, None)
+    start = int(first)
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        return None, None
+    end = min(int(last), size - 1) if last else size - 1
+    return start, end - start + 1
+
+
+def _read_range(path, start, length):
+    with open(path, 'rb') as file:
+        file.seek(start)
+        while length > 0:
+            chunk = file.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def media(request, path):
+    """Отдает загруженный файл из MEDIA_ROOT: целиком через
+    FileResponse (WSGI-сервер передаст его через sendfile) или
+    часть по заголовку Range. Поддерживает If-Modified-Since.
+    Если задан MEDIA_ACCEL_HEADER (X-Accel-Redirect для nginx или
+    X-Sendfile для Apache/lighttpd), файл передает фронтовой
+    сервер, а view отдает только заголовки."""
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404
+    if not os.path.isfile(full_path):
+        raise Http404
+    stat = os.stat(full_path)
+    last_modified = http_date(stat.st_mtime)
+    if not was_modified_since(request.META.get('HTTP_IF_MODIFIED_SINCE'),
+                              stat.st_mtime, stat.st_size):
+        return HttpResponseNotModified()
+    content_type, encoding = mimetypes.guess_type(full_path)
+    content_type = content_type or 'application/octet-stream'
+
+    accel = settings.MEDIA_ACCEL_HEADER
+    if accel:
+        response = HttpResponse(content_type=content_type)
+        # nginx раскодирует URI из X-Accel-Redirect, а в заголовке
+        # допустимы только символы latin-1
+        response[accel] = (
+            quote(posixpath.join(settings.MEDIA_ACCEL_PREFIX, path))
+            if accel == 'X-Accel-Redirect' else full_path
+        )
+    else:
+        byte_range = parse_range(request.META.get('HTTP_RANGE'),
+                                 stat.st_size)
+        if_range = request.META.get('HTTP_IF_RANGE')
+        if if_range and if_range != last_modified:
+            # файл изменился с прошлой части: отдается целиком
+            byte_range = None
+        if byte_range == (None, None):
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{stat.st_size}'
+            return response
+        if byte_range is None:
+            response = FileResponse(open(full_path, 'rb'),
+                                    content_type=content_type)
+        else:
+            start, length = byte_range
+            response = StreamingHttpResponse(
+                _read_range(full_path, start, length), status=206,
+                content_type=content_type
+            )
+            response['Content-Length'] = length
+            response['Content-Range'] = (
+                f'bytes {start}-{start + length - 1}/{stat.st_size}'
+            )
+        response['Accept-Ranges'] = 'bytes'
+    if encoding:
+        response['Content-Encoding'] = encoding
+    response['Last-Modified'] = last_modified
+    response['Cache-Control'] = settings.MEDIA_CACHE_CONTROL
+    return response
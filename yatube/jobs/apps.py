@@ -0,0 +1,6 @@
+from django.apps import AppConfig
+
+
+class JobsConfig(AppConfig):
+    """Конфигурации приложения Jobs."""
+    name = 'jobs'
@@ -0,0 +1,68 @@
+import base64
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.core.mail.backends.base import BaseEmailBackend
+
+from .queue import enqueue, job
+
+
+def _dump_attachment(attachment):
+    (filename, content, mimetype) = attachment
+    if isinstance(content, bytes):
+        return [filename, base64.b64encode(content).decode(), mimetype, True]
+    return [filename, content, mimetype, False]
+
+
+def _load_attachment(data):
+    (filename, content, mimetype, encoded) = data
+    if encoded:
+        content = base64.b64decode(content)
+    return (filename, content, mimetype)
+
+
+def dump_message(message):
+    """Переводит письмо в словарь, пригодный для JSON."""
+    return {
+        'subject': message.subject,
+        'body': message.body,
+        'from_email': message.from_email,
+        'to': message.to,
+        'cc': message.cc,
+        'bcc': message.bcc,
+        'reply_to': message.reply_to,
+        'headers': message.extra_headers,
+        'alternatives': getattr(message, 'alternatives', []),
+        'attachments': [_dump_attachment(attachment)
+                        for attachment in message.attachments],
+    }
+
+
+@job
+def send_email(message):
+    """Отправляет письмо через настоящий бэкенд JOBS_EMAIL_BACKEND."""
+    email = EmailMultiAlternatives(
+        subject=message['subject'],
+        body=message['body'],
+        from_email=message['from_email'],
+        to=message['to'],
+        cc=message['cc'],
+        bcc=message['bcc'],
+        reply_to=message['reply_to'],
+        headers=message['headers'],
+        alternatives=[tuple(item) for item in message['alternatives']],
+        attachments=[_load_attachment(item)
+                     for item in message['attachments']],
+        connection=get_connection(settings.JOBS_EMAIL_BACKEND),
+    )
+    email.send()
+
+
+class QueuedEmailBackend(BaseEmailBackend):
+    """Почтовый бэкенд, который не отправляет письма в запросе,
+    а ставит каждое письмо в очередь фоновых задач."""
+
+    def send_messages(self, email_messages):
+        for message in email_messages:
+            enqueue(send_email, dump_message(message))
+        return len(email_messages)
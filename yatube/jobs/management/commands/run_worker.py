@@ -0,0 +1,63 @@
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from jobs import queue
+
+
+class Command(BaseCommand):
+    """Обработчик очереди фоновых задач."""
+    help = 'Запускает обработчики фоновых задач из таблицы Job'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=1,
+            help='Число потоков-обработчиков'
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Выполнить готовые задачи и завершиться'
+        )
+        parser.add_argument(
+            '--interval', type=float, default=1.0,
+            help='Пауза в секундах, если очередь пуста'
+        )
+
+    def work(self, once, interval):
+        """Цикл одного обработчика. Каждый поток работает со своим
+        соединением с БД и закрывает его при выходе."""
+        try:
+            while True:
+                done = queue.run_pending()
+                if once:
+                    return
+                if not done:
+                    time.sleep(interval)
+        finally:
+            if threading.current_thread() is not threading.main_thread():
+                connection.close()
+
+    def handle(self, *args, **options):
+        if options['workers'] <= 1:
+            # один обработчик работает в основном потоке
+            try:
+                self.work(options['once'], options['interval'])
+            except KeyboardInterrupt:
+                self.stdout.write('Обработчик остановлен')
+            return
+        threads = [
+            threading.Thread(target=self.work,
+                             args=(options['once'], options['interval']),
+                             daemon=True)
+            for _ in range(options['workers'])
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(timeout=1)
+        except KeyboardInterrupt:
+            self.stdout.write('Обработчики остановлены')
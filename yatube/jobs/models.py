@@ -0,0 +1,66 @@
+from django.db import models
+from django.utils import timezone
+
+
+class Job(models.Model):
+    """Класс модели базы данных для хранения фоновых задач."""
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (QUEUED, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (FAILED, 'Ошибка'),
+    )
+
+    name = models.CharField(
+        verbose_name='Функция задачи',
+        max_length=200
+    )
+    arguments = models.TextField(
+        verbose_name='Аргументы в JSON',
+        default='{}'
+    )
+    status = models.CharField(
+        verbose_name='Статус',
+        max_length=10,
+        choices=STATUS_CHOICES,
+        default=QUEUED
+    )
+    attempts = models.PositiveIntegerField(
+        verbose_name='Число попыток',
+        default=0
+    )
+    max_attempts = models.PositiveIntegerField(
+        verbose_name='Максимум попыток'
+    )
+    run_at = models.DateTimeField(
+        verbose_name='Время запуска',
+        default=timezone.now
+    )
+    locked_at = models.DateTimeField(
+        verbose_name='Время захвата обработчиком',
+        blank=True,
+        null=True
+    )
+    last_error = models.TextField(
+        verbose_name='Последняя ошибка',
+        blank=True
+    )
+    created = models.DateTimeField(
+        verbose_name='Дата постановки в очередь',
+        auto_now_add=True
+    )
+
+    class Meta:
+        ordering = ['run_at', 'id']
+        verbose_name = 'Фоновая задача'
+        verbose_name_plural = 'Фоновые задачи'
+        indexes = [
+            models.Index(fields=['status', 'run_at'],
+                         name='job_status_run_at_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.name} ({self.get_status_display()})'
@@ -0,0 +1,107 @@
+import json
+import logging
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+
+def job(func=None, *, max_attempts=None):
+    """Декоратор, регистрирующий функцию как фоновую задачу.
+    Аргументы задачи должны сериализоваться в JSON."""
+    def decorator(func):
+        func.job_name = f'{func.__module__}.{func.__qualname__}'
+        func.max_attempts = max_attempts or settings.JOBS_MAX_ATTEMPTS
+        return func
+    if func is not None:
+        return decorator(func)
+    return decorator
+
+
+def enqueue(func, *args, **kwargs):
+    """Ставит задачу func(*args, **kwargs) в очередь. В режиме
+    JOBS_SYNC (для тестов) задача выполняется сразу."""
+    if not hasattr(func, 'job_name'):
+        raise ValueError(f'{func!r} не зарегистрирована декоратором @job')
+    if settings.JOBS_SYNC:
+        func(*args, **kwargs)
+        return None
+    return Job.objects.create(
+        name=func.job_name,
+        arguments=json.dumps({'args': args, 'kwargs': kwargs}),
+        max_attempts=func.max_attempts,
+    )
+
+
+def retry_delay(attempts):
+    """Задержка перед следующей попыткой: растет вдвое с каждой
+    неудачей."""
+    return timedelta(seconds=settings.JOBS_RETRY_DELAY * 2 ** (attempts - 1))
+
+
+def claim_next():
+    """Забирает следующую готовую к запуску задачу. Задачи,
+    зависшие у упавшего обработчика дольше JOBS_LOCK_TIMEOUT,
+    выдаются повторно."""
+    now = timezone.now()
+    stale = now - timedelta(seconds=settings.JOBS_LOCK_TIMEOUT)
+    ready = Job.objects.filter(
+        Q(status=Job.QUEUED, run_at__lte=now)
+        | Q(status=Job.RUNNING, locked_at__lt=stale)
+    )
+    for candidate in ready.values('pk', 'status', 'locked_at')[:10]:
+        claimed = Job.objects.filter(
+            pk=candidate['pk'],
+            status=candidate['status'],
+            locked_at=candidate['locked_at'],
+        ).update(status=Job.RUNNING, locked_at=now,
+                 attempts=F('attempts') + 1)
+        if claimed:
+            return Job.objects.get(pk=candidate['pk'])
+    return None
+
+
+def run_job(job_obj):
+    """Выполняет захваченную задачу. Успешная задача удаляется,
+    неудачная откладывается с растущей задержкой или после
+    max_attempts попыток помечается как failed."""
+    try:
+        func = import_string(job_obj.name)
+        if not hasattr(func, 'job_name'):
+            raise ValueError(f'{job_obj.name} не является задачей')
+        arguments = json.loads(job_obj.arguments)
+        func(*arguments.get('args', ()), **arguments.get('kwargs', {}))
+    except Exception:
+        logger.exception('Задача %s завершилась ошибкой', job_obj)
+        job_obj.last_error = traceback.format_exc()
+        job_obj.locked_at = None
+        if job_obj.attempts >= job_obj.max_attempts:
+            job_obj.status = Job.FAILED
+        else:
+            job_obj.status = Job.QUEUED
+            job_obj.run_at = timezone.now() + retry_delay(job_obj.attempts)
+        job_obj.save(update_fields=['last_error', 'locked_at',
+                                    'status', 'run_at'])
+        return False
+    job_obj.delete()
+    return True
+
+
+def run_pending(limit=None):
+    """Выполняет готовые задачи, пока они есть (но не больше limit),
+    и возвращает число выполненных."""
+    done = 0
+    while limit is None or done < limit:
+        job_obj = claim_next()
+        if job_obj is None:
+            break
+        run_job(job_obj)
+        done += 1
+    return done
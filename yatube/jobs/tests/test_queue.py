@@ -0,0 +1,99 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.core import mail
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from ..mail import QueuedEmailBackend
+from ..models import Job
+from ..queue import claim_next, enqueue, job, run_pending
+
+CALLS = []
+
+
+@job
+def remember(value):
+    """Тестовая задача: запоминает аргумент."""
+    CALLS.append(value)
+
+
+@job(max_attempts=2)
+def always_fails():
+    """Тестовая задача, которая всегда падает."""
+    raise RuntimeError('Ошибка задачи')
+
+
+class JobQueueTests(TestCase):
+
+    def setUp(self):
+        CALLS.clear()
+
+    def test_enqueued_job_runs_in_worker(self):
+        """Задача из очереди выполняется обработчиком run_worker
+        и удаляется после успеха."""
+        enqueue(remember, 'значение')
+        self.assertEqual(CALLS, [])
+        call_command('run_worker', '--once', stdout=StringIO())
+        self.assertEqual(CALLS, ['значение'])
+        self.assertFalse(Job.objects.exists())
+
+    @override_settings(JOBS_SYNC=True)
+    def test_sync_mode_runs_immediately(self):
+        """В режиме JOBS_SYNC задача выполняется без очереди."""
+        enqueue(remember, 1)
+        self.assertEqual(CALLS, [1])
+        self.assertFalse(Job.objects.exists())
+
+    def test_not_registered_function_rejected(self):
+        """В очередь попадают только функции с декоратором @job."""
+        with self.assertRaises(ValueError):
+            enqueue(print, 'текст')
+
+    @override_settings(JOBS_RETRY_DELAY=10)
+    def test_failed_job_retried_with_backoff(self):
+        """Упавшая задача откладывается с растущей задержкой,
+        а после max_attempts помечается как failed."""
+        job_obj = enqueue(always_fails)
+        self.assertEqual(run_pending(), 1)
+        job_obj.refresh_from_db()
+        self.assertEqual(job_obj.status, Job.QUEUED)
+        self.assertEqual(job_obj.attempts, 1)
+        self.assertIn('Ошибка задачи', job_obj.last_error)
+        self.assertGreater(job_obj.run_at,
+                           timezone.now() + timedelta(seconds=9))
+        # пока не прошла задержка, задача не выдается
+        self.assertIsNone(claim_next())
+        Job.objects.update(run_at=timezone.now())
+        run_pending()
+        job_obj.refresh_from_db()
+        self.assertEqual(job_obj.status, Job.FAILED)
+        self.assertIsNone(claim_next())
+
+    @override_settings(JOBS_LOCK_TIMEOUT=60)
+    def test_stale_running_job_is_reclaimed(self):
+        """Задача упавшего обработчика выдается повторно."""
+        job_obj = enqueue(remember, 2)
+        self.assertEqual(claim_next().pk, job_obj.pk)
+        self.assertIsNone(claim_next())
+        Job.objects.update(locked_at=timezone.now() - timedelta(minutes=2))
+        self.assertEqual(claim_next().pk, job_obj.pk)
+
+    @override_settings(
+        JOBS_EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend'
+    )
+    def test_email_sent_by_worker(self):
+        """Письмо ставится в очередь и отправляется обработчиком."""
+        message = mail.EmailMultiAlternatives(
+            'Тема', 'Текст', 'from@yatube.ru', ['to@yatube.ru'],
+            connection=QueuedEmailBackend()
+        )
+        message.attach_alternative('<p>Текст</p>', 'text/html')
+        message.send()
+        self.assertEqual(len(mail.outbox), 0)
+        run_pending()
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].subject, 'Тема')
+        self.assertEqual(mail.outbox[0].alternatives,
+                         [('<p>Текст</p>', 'text/html')])
@@ -1,5 +1,6 @@
 from django.contrib import admin
 from .models import Post, Group, Comment, Follow
+from .search import fts_available, fts_query, matching_ids_sql
 
 
 @admin.register(Post)
@@ -11,6 +12,14 @@ class PostAdmin(admin.ModelAdmin):
     list_filter = ('pub_date',)
     empty_value_display = '-пусто-'
 
+    def get_search_results(self, request, queryset, search_term):
+        """Поиск по тексту идет через полнотекстовый индекс
+        вместо LIKE '%...%' по всей таблице."""
+        if not fts_available() or not fts_query(search_term):
+            return super().get_search_results(request, queryset,
+                                              search_term)
+        return queryset.filter(pk__in=matching_ids_sql(search_term)), False
+
 
 @admin.register(Group)
 class GroupAdmin(admin.ModelAdmin):
@@ -0,0 +1,155 @@
+import gc
+import time
+import tracemalloc
+from statistics import quantiles
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Count
+from django.http import HttpResponse
+from django.template.loader import render_to_string
+from django.test import Client, RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .models import Group, Post, User
+from .paginator import make_pagination
+
+# наборы данных для замеров: параметры команды seed
+SIZES = {
+    'small': dict(users=100, groups=5, posts=1000, comments=2000,
+                  follows=500, images=0),
+    'medium': dict(users=1000, groups=20, posts=20000, comments=40000,
+                   follows=10000, images=0),
+    'large': dict(users=10000, groups=50, posts=200000, comments=400000,
+                  follows=50000, images=0),
+}
+# метрики замера
+METRICS = ('p50_ms', 'p95_ms', 'queries', 'peak_kb')
+# метрики, по которым ищется регрессия: p95 из пары десятков
+# замеров - это почти максимум, он слишком шумный для порога
+GATED_METRICS = ('p50_ms', 'queries', 'peak_kb')
+
+
+def measure(request, repeat):
+    """Выполняет request() repeat раз и возвращает задержку p50/p95,
+    число запросов к БД и пиковую память Python одного вызова.
+    Память меряется отдельным прогоном: tracemalloc замедляет код
+    и исказил бы задержку."""
+    # первый вызов компилирует шаблоны и прогревает импорты
+    request()
+    timings = []
+    # сборщик мусора срабатывает в случайные моменты и дает выбросы
+    gc.collect()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            # страницы и фрагменты не берутся из кэша: меряется view
+            cache.clear()
+            started = time.perf_counter()
+            response = request()
+            timings.append((time.perf_counter() - started) * 1000)
+            if response.status_code >= 400:
+                raise AssertionError(f'Ответ {response.status_code}')
+    finally:
+        gc.enable()
+
+    cache.clear()
+    with CaptureQueriesContext(connection) as queries:
+        tracemalloc.start()
+        request()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    if len(timings) > 1:
+        cuts = quantiles(timings, n=100, method='inclusive')
+        p50, p95 = cuts[49], cuts[94]
+    else:
+        p50 = p95 = timings[0]
+    return {
+        'p50_ms': round(p50, 2),
+        'p95_ms': round(p95, 2),
+        'queries': len(queries),
+        'peak_kb': round(peak / 1024, 1),
+    }
+
+
+def render_index_template():
+    """Отрисовка posts/index.html с полной страницей постов без
+    view и запросов к БД: замер только шаблонов и фрагментов."""
+    request = RequestFactory().get(reverse('posts:index'))
+    request.user = AnonymousUser()
+    page_obj = make_pagination(
+        request, Post.objects.select_related('author', 'group')
+    )
+    page_obj.object_list = list(page_obj.object_list)
+    return lambda: HttpResponse(render_to_string(
+        'posts/index.html', {'page_obj': page_obj}, request
+    ))
+
+
+def run_views(repeat=20):
+    """Замеряет страницы сайта на данных, которые уже есть в БД.
+    Читатель - пользователь с наибольшим числом подписок, автор
+    и группа - с наибольшим числом постов."""
+    reader = User.objects.annotate(
+        n=Count('follower')
+    ).order_by('-n', 'pk').first()
+    author = User.objects.annotate(
+        n=Count('posts')
+    ).order_by('-n', 'pk').first()
+    group = Group.objects.annotate(
+        n=Count('posts')
+    ).order_by('-n', 'pk').first()
+    post = Post.objects.order_by('-comments_count', '-pk').first()
+
+    guest = Client()
+    client = Client()
+    client.force_login(reader)
+    views = {
+        'index': lambda: guest.get(reverse('posts:index')),
+        'index_template': render_index_template(),
+        'profile': lambda: guest.get(
+            reverse('posts:profile', kwargs={'username': author.username})
+        ),
+        'post_detail': lambda: guest.get(
+            reverse('posts:post_detail', kwargs={'post_id': post.pk})
+        ),
+        'follow_index': lambda: client.get(reverse('posts:follow_index')),
+        'post_create': lambda: client.post(
+            reverse('posts:post_create'), {'text': 'Замер'}
+        ),
+        'add_comment': lambda: client.post(
+            reverse('posts:add_comment', kwargs={'post_id': post.pk}),
+            {'text': 'Замер'}
+        ),
+    }
+    if group is not None:
+        views['group_posts'] = lambda: guest.get(
+            reverse('posts:group_list', kwargs={'slug': group.slug})
+        )
+    return {name: measure(request, repeat)
+            for (name, request) in sorted(views.items())}
+
+
+def compare(results, baseline, threshold):
+    """Сравнивает замеры с базовыми. Возвращает список регрессий:
+    метрика хуже базовой больше чем в (1 + threshold) раз.
+    Число запросов должно совпадать с базовым или быть меньше."""
+    regressions = []
+    for size, views in results.items():
+        for view, metrics in views.items():
+            base = baseline.get(size, {}).get(view)
+            if base is None:
+                continue
+            for metric in GATED_METRICS:
+                value, limit = metrics[metric], base[metric]
+                if metric != 'queries':
+                    limit = limit * (1 + threshold)
+                if value > limit:
+                    regressions.append(
+                        f'{size}/{view}: {metric} {value} > {limit:g} '
+                        f'(база {base[metric]})'
+                    )
+    return regressions
@@ -0,0 +1,247 @@
+import hashlib
+import math
+import random
+import time
+import uuid
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import OuterRef, Subquery
+from django.utils.http import quote_etag
+
+from core.db import primary_reads
+from core.metrics import registry
+
+from .models import Comment, Post
+
+# префикс кэша главной страницы; его версию сбрасывают сигналы
+# из posts.signals, и по ней же сбрасываются кэши групп и профилей
+INDEX_CACHE_PREFIX = 'index_page'
+GROUP_CACHE_PREFIX = 'group_page'
+PROFILE_CACHE_PREFIX = 'profile_page'
+# как часто ожидающий запрос проверяет, готова ли страница, с
+WAIT_INTERVAL = 0.05
+
+registry.describe('yatube_page_cache_total', 'counter',
+                  'Ответы из кэша страниц: fresh, stale, wait - из кэша, '
+                  'refresh - пересчитаны')
+
+
+def _version_key(key_prefix):
+    return f'{key_prefix}.version'
+
+
+def _new_version():
+    """Новая версия - случайная строка. Она не совпадет ни с одной
+    из прежних, даже если счетчик вытеснят из кэша, а две смены
+    версии из разных процессов не сольются в одну, как у incr
+    (в FileBasedCache это get + set без блокировки)."""
+    return uuid.uuid4().hex
+
+
+def get_cache_version(key_prefix):
+    """Возвращает текущую версию кэша для префикса key_prefix."""
+    key = _version_key(key_prefix)
+    version = cache.get(key)
+    if version is None:
+        version = _new_version()
+        cache.add(key, version, None)
+        version = cache.get(key, version)
+    return version
+
+
+def bump_cache_version(key_prefix):
+    """Меняет версию кэша для префикса key_prefix: все
+    закэшированные ранее страницы становятся недоступны.
+    invalidate сбрасывает копии версии в локальных кэшах процессов
+    (core.cache.TwoTierCache; у других бэкендов локальных копий нет),
+    а add не затирает версию, которую другой процесс успел создать
+    уже после удаления."""
+    key = _version_key(key_prefix)
+    getattr(cache, 'invalidate', cache.delete)(key)
+    cache.add(key, _new_version(), None)
+
+
+def _page_key(request, key_prefix):
+    """Ключ страницы: адрес и пользователь (в шапке его имя).
+    Версии в ключе нет - она хранится в записи, чтобы после сброса
+    можно было отдать прежнюю страницу, пока готовится новая."""
+    user = request.user.pk if request.user.is_authenticated else 'anon'
+    url = hashlib.md5(request.build_absolute_uri().encode()).hexdigest()
+    return f'{key_prefix}.{user}.{url}'
+
+
+def _is_fresh(entry, version, beta):
+    """Запись текущей версии, которую еще рано пересчитывать.
+    Вероятностное раннее обновление (XFetch): чем ближе срок и чем
+    дольше строится страница, тем вероятнее пересчет до срока -
+    и истечение записи не совпадает у всех запросов сразу."""
+    if entry is None or entry['version'] != version:
+        return False
+    early = entry['delta'] * beta * -math.log(1 - random.random())
+    return time.time() + early < entry['expires']
+
+
+def _is_shareable(request, response):
+    """Страницу можно отдавать другим пользователям: с CSRF-токеном
+    или cookie она чужая для остальных."""
+    return (response.status_code == 200 and not response.cookies
+            and not request.META.get('CSRF_COOKIE_USED')
+            and not response.streaming)
+
+
+def _build_page(view_func, request, args, kwargs, key, version, timeout):
+    """Строит страницу и, если она общая, кладет в кэш вместе
+    с версией, сроком и временем построения (для XFetch)."""
+    started = time.monotonic()
+    # запись кэша живет дольше отставания реплик
+    with primary_reads():
+        response = view_func(request, *args, **kwargs)
+    delta = time.monotonic() - started
+    if _is_shareable(request, response):
+        cache.set(key, {
+            'response': response,
+            'version': version,
+            'expires': time.time() + timeout,
+            'delta': delta,
+        }, timeout + settings.PAGE_CACHE_STALE_TIMEOUT)
+    return response
+
+
+def _take_lock(key, version):
+    """Блокировка пересчета версии version страницы key; None -
+    страницу уже строит другой запрос. Блокировка не снимается:
+    после пересчета свежая запись и так отвечает всем, а блокировка
+    истекает сама."""
+    lock = f'{key}.{version}.lock'
+    if cache.add(lock, True, settings.PAGE_CACHE_LOCK_TIMEOUT):
+        return lock
+    return None
+
+
+@contextmanager
+def _release_on_error(lock):
+    """Снимает блокировку, если страницу построить не удалось
+    (например, Http404): иначе до ее истечения все ждали бы."""
+    try:
+        yield
+    except Exception:
+        cache.delete(lock)
+        raise
+
+
+def _wait_for_page(key, version):
+    """Ждет до PAGE_CACHE_WAIT_TIMEOUT секунд запись версии version,
+    которую строит другой запрос; None - не дождались."""
+    deadline = time.monotonic() + settings.PAGE_CACHE_WAIT_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(WAIT_INTERVAL)
+        entry = cache.get(key)
+        if entry is not None and entry['version'] == version:
+            return entry
+    return None
+
+
+def _entry_during_refresh(entry, key, version):
+    """Чем ответить, пока страницу строит другой запрос: прежней
+    записью ('stale'), даже устаревшей или прежней версии, а если ее
+    нет - дождавшейся новой ('wait'). (None, None) - не дождались."""
+    if entry is not None:
+        return 'stale', entry
+    entry = _wait_for_page(key, version)
+    if entry is None:
+        return None, None
+    return 'wait', entry
+
+
+def stampede_cache_page(timeout, key_prefix,
+                        version_prefix=INDEX_CACHE_PREFIX,
+                        anonymous_only=False):
+    """Замена cache_page, которая не дает запросам пересчитывать
+    страницу одновременно.
+
+    Пересчитывает страницу один запрос - тот, кто первым взял
+    блокировку cache.add. Остальные тем временем получают прежнюю
+    страницу, даже устаревшую или прежней версии, а если ее нет -
+    ждут до PAGE_CACHE_WAIT_TIMEOUT секунд готовую. Запись живет
+    timeout секунд или до bump_cache_version(version_prefix), затем
+    еще PAGE_CACHE_STALE_TIMEOUT секунд отдается как устаревшая.
+    С anonymous_only страницы для пользователей не кэшируются.
+    Страница для кэша читает из основной БД, а не с реплики.
+
+    ETag ответа из кэша считается по версии, с которой страница
+    построена: устаревшая страница не должна попасть в кэш браузера
+    под ETag текущей версии."""
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if (request.method not in ('GET', 'HEAD')
+                    or anonymous_only and request.user.is_authenticated):
+                return view_func(request, *args, **kwargs)
+            key = _page_key(request, key_prefix)
+            version = get_cache_version(version_prefix)
+
+            def result(name, response, built_version):
+                registry.inc('yatube_page_cache_total',
+                             (('prefix', key_prefix), ('result', name)))
+                response['ETag'] = quote_etag(_etag(request, built_version))
+                return response
+
+            def refresh():
+                return result('refresh', _build_page(
+                    view_func, request, args, kwargs, key, version, timeout
+                ), version)
+
+            entry = cache.get(key)
+            if _is_fresh(entry, version, settings.PAGE_CACHE_BETA):
+                return result('fresh', entry['response'], version)
+            lock = _take_lock(key, version)
+            if lock is not None:
+                with _release_on_error(lock):
+                    return refresh()
+            name, entry = _entry_during_refresh(entry, key, version)
+            if entry is not None:
+                return result(name, entry['response'], entry['version'])
+            return refresh()
+        return wrapper
+    return decorator
+
+
+def _etag(request, *parts):
+    """ETag из частей и пользователя. CSRF-cookie входит в ключ:
+    после входа в систему она меняется, и страницу с формой нельзя
+    отдавать из кэша браузера со старым токеном."""
+    user = request.user.pk if request.user.is_authenticated else 'anon'
+    csrf = request.COOKIES.get(settings.CSRF_COOKIE_NAME, '')
+    raw = '.'.join(str(part) for part in (*parts, user, csrf))
+    return hashlib.md5(raw.encode()).hexdigest()
+
+
+def feed_etag(request, *args, **kwargs):
+    """ETag ленты (главная, группа, профиль) - версия кэша лент:
+    ее меняет любое изменение постов, групп, авторов и подписок,
+    в том числе удаление, которое не сдвигает дату новейшего поста.
+    Запросов к БД нет. Ответ из кэша страниц stampede_cache_page
+    заменяет ETag на ETag версии, с которой он построен."""
+    return _etag(request, get_cache_version(INDEX_CACHE_PREFIX))
+
+
+def post_etag(request, post_id):
+    """ETag страницы поста: правка поста, комментарии (их число и
+    время последнего) и версия лент (автор, его счетчики, группа).
+    Last-Modified не отдается: удаление комментария или смена
+    автора и группы время изменения не сдвигают. Один запрос."""
+    last_comment = Comment.objects.filter(
+        post=OuterRef('pk')
+    ).order_by('-created').values('created')[:1]
+    state = Post.objects.filter(pk=post_id).annotate(
+        last_comment=Subquery(last_comment),
+    ).order_by().values('updated', 'comments_count',
+                        'last_comment').first()
+    if state is None:
+        return None
+    return _etag(request, get_cache_version(INDEX_CACHE_PREFIX),
+                 state['updated'].isoformat(), state['comments_count'],
+                 state['last_comment'] and state['last_comment'].isoformat())
@@ -0,0 +1,105 @@
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import Comment, Follow, Post, User, UserStats
+
+# размер пачки для bulk_update при пересчете
+RECOUNT_BATCH_SIZE = 1000
+
+
+def _shifted(field, delta):
+    """F(field) + delta, но не меньше нуля: если счетчик уже
+    разошелся с данными (пропущенный сигнал, еще не было recount),
+    уменьшение не должно ронять удаление на CHECK >= 0."""
+    return Greatest(F(field) + delta, 0)
+
+
+def change_user_stats(user_id, **deltas):
+    """Атомарно сдвигает счетчики пользователя на deltas.
+    Если строки счетчиков еще нет, она будет посчитана при
+    первом чтении в get_user_stats."""
+    UserStats.objects.filter(user_id=user_id).update(
+        **{field: _shifted(field, delta)
+           for (field, delta) in deltas.items()}
+    )
+
+
+def change_comments_count(post_id, delta):
+    """Атомарно сдвигает счетчик комментариев поста на delta."""
+    Post.objects.filter(pk=post_id).update(
+        comments_count=_shifted('comments_count', delta)
+    )
+
+
+def _count(queryset, field):
+    """Подзапрос с числом строк queryset для пользователя из
+    внешнего запроса по полю field."""
+    return Coalesce(Subquery(
+        queryset.filter(
+            **{field: OuterRef('pk')}
+        ).order_by().values(field).annotate(
+            count=Count('pk')
+        ).values('count')
+    ), 0)
+
+
+def _annotated_users():
+    return User.objects.annotate(
+        real_posts=_count(Post.objects.all(), 'author'),
+        real_followers=_count(Follow.objects.all(), 'author'),
+        real_following=_count(Follow.objects.all(), 'user'),
+    )
+
+
+def recount_user(user):
+    """Пересчитывает и сохраняет счетчики одного пользователя."""
+    counted = _annotated_users().get(pk=user.pk)
+    stats, _ = UserStats.objects.update_or_create(
+        user=user,
+        defaults={
+            'posts_count': counted.real_posts,
+            'followers_count': counted.real_followers,
+            'following_count': counted.real_following,
+        }
+    )
+    return stats
+
+
+def get_user_stats(user):
+    """Возвращает счетчики пользователя, при необходимости
+    посчитав их с нуля."""
+    try:
+        return user.stats
+    except UserStats.DoesNotExist:
+        return recount_user(user)
+
+
+def _save_stats(batch, existing):
+    """Сохраняет пачку счетчиков: новые создает, старые обновляет."""
+    UserStats.objects.bulk_create(
+        [stats for stats in batch if stats.user_id not in existing]
+    )
+    UserStats.objects.bulk_update(
+        [stats for stats in batch if stats.user_id in existing],
+        ['posts_count', 'followers_count', 'following_count']
+    )
+
+
+def recount_all():
+    """Пересчитывает все счетчики пользователей и постов."""
+    users = _annotated_users().order_by('pk').values_list(
+        'pk', 'real_posts', 'real_followers', 'real_following'
+    )
+    existing = set(UserStats.objects.values_list('user_id', flat=True))
+    batch = []
+    for (user_id, posts, followers, following) in users.iterator():
+        batch.append(UserStats(user_id=user_id, posts_count=posts,
+                               followers_count=followers,
+                               following_count=following))
+        if len(batch) >= RECOUNT_BATCH_SIZE:
+            _save_stats(batch, existing)
+            batch = []
+    _save_stats(batch, existing)
+    Post.objects.update(
+        comments_count=_count(Comment.objects.all(), 'post')
+    )
@@ -1,5 +1,8 @@
 from django import forms
+from django.core.files.uploadedfile import UploadedFile
+
 from . models import Post, Comment
+from .uploads import normalize
 
 
 class PostForm(forms.ModelForm):
@@ -8,6 +11,25 @@ class PostForm(forms.ModelForm):
         model = Post
         fields = ('text', 'group', 'image')
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # файл, отклоненный при загрузке (posts.uploads), не отдаем
+        # полю: ImageField распаковал бы его или ругнулся бы невнятно
+        self.upload_error = None
+        upload = self.files.get('image')
+        if getattr(upload, 'upload_error', None):
+            self.upload_error = upload.upload_error
+            self.files = self.files.copy()
+            del self.files['image']
+
+    def clean_image(self):
+        if self.upload_error:
+            raise forms.ValidationError(self.upload_error)
+        image = self.cleaned_data['image']
+        if isinstance(image, UploadedFile):
+            image = normalize(image)
+        return image
+
 
 class CommentForm(forms.ModelForm):
     """Класс для формы создания нового комментария."""
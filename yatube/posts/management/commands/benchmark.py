@@ -0,0 +1,88 @@
+import json
+import os
+from io import StringIO
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import (setup_test_environment,
+                               teardown_test_environment)
+
+from posts import benchmarks
+
+
+class Command(BaseCommand):
+    """Замеряет страницы сайта на наборах данных разного размера.
+    Каждый набор заполняется командой seed в отдельной тестовой БД,
+    рабочая БД не затрагивается. Результат сравнивается с базовым
+    из BENCHMARK_BASELINE; при регрессии команда падает."""
+    help = 'Замеряет задержку, число запросов и память страниц'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='small,medium',
+                            help='Наборы данных через запятую: '
+                                 + ', '.join(benchmarks.SIZES))
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--threshold', type=float,
+                            default=settings.BENCHMARK_THRESHOLD,
+                            help='Допустимое ухудшение, доля от базы')
+        parser.add_argument('--baseline',
+                            default=settings.BENCHMARK_BASELINE)
+        parser.add_argument('--save', action='store_true',
+                            help='Записать результат как новую базу')
+
+    def handle(self, *args, **options):
+        sizes = options['sizes'].split(',')
+        unknown = set(sizes) - set(benchmarks.SIZES)
+        if unknown:
+            raise CommandError(f'Неизвестные наборы: {", ".join(unknown)}')
+
+        results = {}
+        setup_test_environment()
+        try:
+            for size in sizes:
+                results[size] = self.run_size(size, options['repeat'])
+        finally:
+            teardown_test_environment()
+
+        baseline = {}
+        if os.path.exists(options['baseline']):
+            with open(options['baseline'], encoding='utf-8') as file:
+                baseline = json.load(file)
+
+        if options['save']:
+            baseline.update(results)
+            with open(options['baseline'], 'w', encoding='utf-8') as file:
+                json.dump(baseline, file, indent=2, sort_keys=True)
+            self.stdout.write(self.style.SUCCESS(
+                f'База записана в {options["baseline"]}'
+            ))
+            return
+
+        regressions = benchmarks.compare(results, baseline,
+                                         options['threshold'])
+        if regressions:
+            raise CommandError('Регрессия:\n' + '\n'.join(regressions))
+        self.stdout.write(self.style.SUCCESS('Регрессий нет'))
+
+    def run_size(self, size, repeat):
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True,
+                                           serialize=False)
+        try:
+            call_command('seed', stdout=StringIO(),
+                         **benchmarks.SIZES[size])
+            results = benchmarks.run_views(repeat)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        self.stdout.write(f'\n{size}')
+        self.stdout.write(f'{"view":<14}{"p50, мс":>10}{"p95, мс":>10}'
+                          f'{"запросов":>10}{"память, КБ":>12}')
+        for view, metrics in results.items():
+            self.stdout.write(
+                f'{view:<14}{metrics["p50_ms"]:>10}{metrics["p95_ms"]:>10}'
+                f'{metrics["queries"]:>10}{metrics["peak_kb"]:>12}'
+            )
+        return results
@@ -0,0 +1,76 @@
+import random
+import sqlite3
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts.search import (FTS_CREATE_SQL, FTS_REBUILD_SQL, FTS_TABLE,
+                          fts_query)
+
+WORDS = (
+    'котики', 'собаки', 'солнце', 'море', 'город', 'дорога', 'книга',
+    'утро', 'вечер', 'музыка', 'дождь', 'лес', 'река', 'кофе', 'поезд',
+    'письмо', 'окно', 'сад', 'зима', 'лето', 'друг', 'работа', 'дом',
+    'небо', 'ветер', 'снег', 'цветы', 'чай', 'кино', 'ночь',
+)
+
+
+class Command(BaseCommand):
+    """Сравнивает поиск LIKE '%...%' с поиском по индексу FTS5
+    на отдельной БД в памяти с заданным числом постов."""
+    help = 'Замеряет время поиска по постам: LIKE против FTS5'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=1_000_000)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        db = sqlite3.connect(':memory:')
+        db.execute('CREATE TABLE posts_post '
+                   '(id INTEGER PRIMARY KEY, text TEXT NOT NULL)')
+        # словарь дополняется редкими словами, чтобы в замере были
+        # и частые, и редкие запросы
+        vocabulary = WORDS + tuple(f'слово{i}' for i in range(5000))
+        started = time.perf_counter()
+        batch = []
+        for pk in range(1, options['posts'] + 1):
+            text = ' '.join(rng.choice(vocabulary)
+                            for _ in range(rng.randint(5, 40)))
+            batch.append((pk, text))
+            if len(batch) == 10_000:
+                db.executemany('INSERT INTO posts_post VALUES (?, ?)', batch)
+                batch = []
+        db.executemany('INSERT INTO posts_post VALUES (?, ?)', batch)
+        db.execute(FTS_CREATE_SQL)
+        db.execute(FTS_REBUILD_SQL)
+        db.commit()
+        self.stdout.write(
+            f'{options["posts"]} постов подготовлено за '
+            f'{time.perf_counter() - started:.1f} с'
+        )
+
+        like_sql = ('SELECT id FROM posts_post WHERE text LIKE ? '
+                    'ORDER BY id LIMIT 10')
+        fts_sql = (f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} '
+                   f'MATCH ? ORDER BY bm25({FTS_TABLE}), rowid LIMIT 10')
+        for word in ('котики', 'слово4321', 'отсутствует'):
+            like = self.measure(db, like_sql, f'%{word}%', options['repeat'])
+            fts = self.measure(db, fts_sql, fts_query(word),
+                               options['repeat'])
+            self.stdout.write(
+                f'{word:>12}: LIKE {like * 1000:9.2f} мс, '
+                f'FTS5 {fts * 1000:9.2f} мс'
+            )
+
+    @staticmethod
+    def measure(db, sql, param, repeat):
+        """Медиана времени выполнения запроса."""
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            db.execute(sql, (param,)).fetchall()
+            timings.append(time.perf_counter() - started)
+        timings.sort()
+        return timings[len(timings) // 2]
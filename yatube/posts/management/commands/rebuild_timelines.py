@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from posts import timeline
+from posts.models import Timeline
+
+
+class Command(BaseCommand):
+    """Пересобирает материализованные ленты подписок с нуля."""
+    help = 'Пересобирает ленты подписок по таблице Follow'
+
+    def handle(self, *args, **options):
+        timeline.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'Лент пересобрано, записей: {Timeline.objects.count()}'
+        ))
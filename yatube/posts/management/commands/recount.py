@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from posts import counters
+
+
+class Command(BaseCommand):
+    """Пересчитывает денормализованные счетчики постов,
+    комментариев и подписок."""
+    help = 'Пересчитывает счетчики UserStats и Post.comments_count'
+
+    def handle(self, *args, **options):
+        counters.recount_all()
+        self.stdout.write(self.style.SUCCESS('Счетчики пересчитаны'))
@@ -0,0 +1,272 @@
+import io
+import random
+import time
+from datetime import timedelta
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+from faker import Faker
+from PIL import Image
+
+from posts import counters, search, timeline
+from posts.cache import INDEX_CACHE_PREFIX, bump_cache_version
+from posts.models import Comment, Follow, Group, Post, User
+
+# показатель степенного распределения популярности авторов:
+# чем он больше, тем сильнее посты и подписчики стянуты к первым
+# ("горячим") авторам
+POPULARITY_EXPONENT = 1.1
+# число готовых предложений, из которых собираются тексты
+SENTENCE_POOL_SIZE = 5000
+# кэш страниц SQLite на время заполнения, КБ
+SQLITE_CACHE_KB = 512 * 1024
+
+
+class Command(BaseCommand):
+    """Заполняет БД большим воспроизводимым набором данных:
+    пользователи, группы, посты, комментарии, подписки и картинки.
+    Активность авторов и число подписчиков распределены по
+    степенному закону: немногие авторы пишут большую часть постов,
+    немногие собирают большую часть подписчиков."""
+    help = 'Заполняет БД тестовыми данными реалистичного объема'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--groups', type=int, default=50)
+        parser.add_argument('--posts', type=int, default=10000)
+        parser.add_argument('--comments', type=int, default=20000)
+        parser.add_argument('--follows', type=int, default=10000)
+        parser.add_argument('--images', type=int, default=20)
+        parser.add_argument('--days', type=int, default=365,
+                            help='За сколько дней распределить посты')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--password', default='password')
+        parser.add_argument('--skip-timelines', action='store_true',
+                            help='Не пересобирать ленты подписок')
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.faker = Faker('ru_RU')
+        self.faker.seed_instance(options['seed'])
+        self.batch_size = options['batch_size']
+        self.now = timezone.now()
+        self.period = timedelta(days=options['days'])
+        if connection.vendor == 'sqlite':
+            # индексы миллиона строк не помещаются в кэш SQLite по
+            # умолчанию (2 МБ), и вставка упирается в чтение с диска
+            with connection.cursor() as cursor:
+                cursor.execute(f'PRAGMA cache_size = -{SQLITE_CACHE_KB}')
+
+        user_ids = self.step('Пользователи', self.create_users,
+                             options['users'], options['password'])
+        group_ids = self.step('Группы', self.create_groups,
+                              options['groups'])
+        images = self.step('Картинки', self.create_images,
+                           options['images'])
+        # веса популярности: i-й по популярности пользователь получает
+        # вес 1 / i^POPULARITY_EXPONENT. Порядок разный для авторов
+        # постов и для подписок: если самые плодовитые авторы были бы
+        # и самыми читаемыми, ленты разрослись бы до миллиардов записей
+        popularity = list(accumulate(
+            1 / rank ** POPULARITY_EXPONENT
+            for rank in range(1, len(user_ids) + 1)
+        ))
+        posters = self.rng.sample(user_ids, len(user_ids))
+        celebrities = self.rng.sample(user_ids, len(user_ids))
+        posts = self.step('Посты', self.create_posts, options['posts'],
+                          posters, popularity, group_ids, images)
+        self.step('Комментарии', self.create_comments,
+                  options['comments'], user_ids, posts)
+        self.step('Подписки', self.create_follows, options['follows'],
+                  user_ids, celebrities, popularity)
+        if not options['skip_timelines']:
+            self.step('Ленты', timeline.rebuild)
+        self.step('Счетчики', counters.recount_all)
+        bump_cache_version(INDEX_CACHE_PREFIX)
+        self.stdout.write(self.style.SUCCESS('БД заполнена'))
+
+    def step(self, title, func, *args):
+        started = time.perf_counter()
+        result = func(*args)
+        self.stdout.write(
+            f'{title}: {time.perf_counter() - started:.1f} с'
+        )
+        return result
+
+    def insert(self, model, objects):
+        """Сохраняет объекты пачками, каждую - в своей транзакции."""
+        batch = []
+        for obj in objects:
+            batch.append(obj)
+            if len(batch) >= self.batch_size:
+                with transaction.atomic():
+                    model.objects.bulk_create(batch)
+                batch = []
+        if batch:
+            with transaction.atomic():
+                model.objects.bulk_create(batch)
+
+    def insert_rows(self, model, fields, rows):
+        """Быстрый путь для больших таблиц: строки-кортежи пишутся
+        через executemany пачками, каждая - в своей транзакции.
+        bulk_create собирает SQL по каждому значению отдельно и на
+        миллионе постов тратит на это минуты."""
+        quote = connection.ops.quote_name
+        columns = ', '.join(quote(model._meta.get_field(name).column)
+                            for name in fields)
+        sql = (f'INSERT INTO {quote(model._meta.db_table)} ({columns}) '
+               f'VALUES ({", ".join(["%s"] * len(fields))})')
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= self.batch_size:
+                with transaction.atomic(), connection.cursor() as cursor:
+                    cursor.executemany(sql, batch)
+                batch = []
+        if batch:
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.executemany(sql, batch)
+
+    def new_ids(self, model, field=None):
+        """Возвращает id (и значение field) объектов, добавленных
+        после вызова: SQLite не возвращает id из bulk_create."""
+        last_pk = model.objects.aggregate(last=Max('pk'))['last'] or 0
+
+        def fetch():
+            rows = model.objects.filter(pk__gt=last_pk).order_by('pk')
+            if field is None:
+                return list(rows.values_list('pk', flat=True))
+            return list(rows.values_list('pk', field))
+        return fetch
+
+    def random_dates(self, count):
+        """Даты по возрастанию: id постов растут вместе с датой, как
+        на живом сайте, а индексы по дате заполняются по порядку."""
+        return sorted(self.now - self.period * self.rng.random()
+                      for _ in range(count))
+
+    def create_users(self, count, password):
+        # хеш пароля дорогой, он считается один раз на всех
+        password = make_password(password)
+        fetch = self.new_ids(User)
+        offset = User.objects.count()
+        self.insert(User, (
+            User(username=f'user{offset + i}',
+                 first_name=self.faker.first_name(),
+                 last_name=self.faker.last_name(),
+                 password=password,
+                 date_joined=self.now - self.period)
+            for i in range(count)
+        ))
+        return fetch()
+
+    def create_groups(self, count):
+        fetch = self.new_ids(Group)
+        offset = Group.objects.count()
+        self.insert(Group, (
+            Group(title=self.faker.catch_phrase()[:200],
+                  slug=f'group-{offset + i}',
+                  description=self.faker.paragraph())
+            for i in range(count)
+        ))
+        return fetch()
+
+    def create_images(self, count):
+        """Сохраняет count небольших картинок и возвращает их имена."""
+        storage = Post._meta.get_field('image').storage
+        names = []
+        for i in range(count):
+            color = tuple(self.rng.randrange(256) for _ in range(3))
+            buffer = io.BytesIO()
+            Image.new('RGB', (960, 540), color).save(buffer, 'JPEG')
+            names.append(storage.save(
+                f'posts/seed_{i}.jpg', ContentFile(buffer.getvalue())
+            ))
+        return names
+
+    def create_posts(self, count, authors, popularity, group_ids, images):
+        if not authors:
+            return []
+        sentences = [self.faker.sentence(nb_words=10)
+                     for _ in range(SENTENCE_POOL_SIZE)]
+        post_authors = self.rng.choices(authors, cum_weights=popularity,
+                                        k=count)
+        image_posts = set(self.rng.sample(range(count),
+                                          min(len(images), count)))
+        adapt = connection.ops.adapt_datetimefield_value
+        fetch = self.new_ids(Post, 'pub_date')
+
+        def posts():
+            dates = self.random_dates(count)
+            for i, (author_id, pub_date) in enumerate(zip(post_authors,
+                                                          dates)):
+                pub_date = adapt(pub_date)
+                yield (
+                    ' '.join(self.rng.choices(sentences,
+                                              k=self.rng.randint(1, 5))),
+                    author_id,
+                    (self.rng.choice(group_ids)
+                     if group_ids and self.rng.random() < 0.5 else None),
+                    self.rng.choice(images) if i in image_posts else '',
+                    pub_date,
+                    pub_date,
+                    0,
+                    False,
+                )
+
+        # счетчик комментариев заполнит recount_all
+        with search.deferred_index():
+            self.insert_rows(Post, ('text', 'author', 'group', 'image',
+                                    'pub_date', 'updated',
+                                    'comments_count', 'thumbnail_pending'),
+                             posts())
+        return fetch()
+
+    def create_comments(self, count, user_ids, posts):
+        if not posts:
+            return
+        sentences = [self.faker.sentence(nb_words=6)
+                     for _ in range(SENTENCE_POOL_SIZE // 5)]
+        comments = []
+        for _ in range(count):
+            post_id, pub_date = self.rng.choice(posts)
+            comments.append((
+                pub_date + (self.now - pub_date) * self.rng.random(),
+                post_id,
+                self.rng.choice(user_ids),
+                self.rng.choice(sentences),
+            ))
+        comments.sort()
+        adapt = connection.ops.adapt_datetimefield_value
+        self.insert_rows(
+            Comment, ('created', 'post', 'author', 'text'),
+            ((adapt(created), *rest) for (created, *rest) in comments)
+        )
+
+    def create_follows(self, count, user_ids, authors, popularity):
+        """Подписки: подписчик выбирается равномерно, автор - по
+        популярности, поэтому число подписчиков распределено по
+        степенному закону."""
+        existing = set(Follow.objects.values_list('user_id', 'author_id'))
+        count = min(count,
+                    len(user_ids) * (len(authors) - 1) - len(existing))
+        pairs = set()
+        while len(pairs) < count:
+            need = count - len(pairs)
+            users = self.rng.choices(user_ids, k=need)
+            targets = self.rng.choices(authors, cum_weights=popularity,
+                                       k=need)
+            pairs.update(
+                pair for pair in zip(users, targets)
+                if pair[0] != pair[1] and pair not in existing
+            )
+        self.insert(Follow, (
+            Follow(user_id=user_id, author_id=author_id)
+            for (user_id, author_id) in sorted(pairs)[:count]
+        ))
@@ -0,0 +1,60 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts.cache import INDEX_CACHE_PREFIX, bump_cache_version
+from posts.models import Post
+from posts.storage import is_sharded
+
+
+class Command(BaseCommand):
+    """Переносит картинки постов из плоского каталога posts/
+    в каталоги шардов по хешу содержимого (см. posts.storage)
+    и переписывает Post.image пачками. Одинаковые файлы сливаются
+    в один. Команду можно прервать и запустить снова: уже
+    перенесенные картинки пропускаются."""
+    help = 'Переносит картинки постов в каталоги шардов по хешу'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--keep-old', action='store_true',
+                            help='Не удалять файлы со старыми именами')
+
+    def handle(self, *args, **options):
+        storage = Post._meta.get_field('image').storage
+        moved = missing = last_pk = 0
+        while True:
+            batch = list(
+                Post.objects.filter(pk__gt=last_pk).exclude(image='')
+                .order_by('pk').values_list('pk', 'image')
+                [:options['batch_size']]
+            )
+            if not batch:
+                break
+            last_pk = batch[-1][0]
+            renames = {}
+            for _, name in batch:
+                if is_sharded(name) or name in renames:
+                    continue
+                if not storage.exists(name):
+                    missing += 1
+                    self.stderr.write(f'Нет файла {name}')
+                    continue
+                with storage.open(name) as file:
+                    renames[name] = storage.save(name, file)
+            # update() не трогает Post.updated: дата правки поста
+            # остается прежней
+            with transaction.atomic():
+                for old, new in renames.items():
+                    moved += Post.objects.filter(image=old).update(
+                        image=new
+                    )
+            if not options['keep_old']:
+                for old in renames:
+                    storage.delete(old)
+        if moved:
+            # Post.updated не изменился: фрагменты постов сменят ключ
+            # по имени картинки, а кэш лент - по новой версии
+            bump_cache_version(INDEX_CACHE_PREFIX)
+        self.stdout.write(self.style.SUCCESS(
+            f'Перенесено постов: {moved}, нет файла: {missing}'
+        ))
@@ -0,0 +1,37 @@
+# Generated by Django 2.2.16 on 2026-10-17 06:03
+
+import json
+
+from django.conf import settings
+from django.db import migrations
+
+
+def move_tasks_to_jobs(apps, schema_editor):
+    """Переносит необработанные задачи на миниатюры в общую
+    очередь фоновых задач."""
+    ThumbnailTask = apps.get_model('posts', 'ThumbnailTask')
+    Job = apps.get_model('jobs', 'Job')
+    db_alias = schema_editor.connection.alias
+    Job.objects.using(db_alias).bulk_create(
+        Job(name='posts.thumbnails.generate_post_thumbnails',
+            arguments=json.dumps({'args': [post_id], 'kwargs': {}}),
+            max_attempts=settings.JOBS_MAX_ATTEMPTS)
+        for post_id in ThumbnailTask.objects.using(db_alias).values_list(
+            'post_id', flat=True
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jobs', '0001_initial'),
+        ('posts', '0013_thumbnail_task'),
+    ]
+
+    operations = [
+        migrations.RunPython(move_tasks_to_jobs, migrations.RunPython.noop),
+        migrations.DeleteModel(
+            name='ThumbnailTask',
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.16 on 2026-10-17 08:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0016_post_image_sharded'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='thumbnail_pending',
+            field=models.BooleanField(default=False, verbose_name='Миниатюры готовятся'),
+        ),
+    ]
@@ -1,6 +1,8 @@
 from django.db import models
 from django.contrib.auth import get_user_model
 
+from .storage import HashedFileSystemStorage
+
 User = get_user_model()
 
 
@@ -14,6 +16,10 @@ class Post(models.Model):
         auto_now_add=True,
         verbose_name='Дата пубикации'
     )
+    updated = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Дата изменения'
+    )
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -32,13 +38,34 @@ class Post(models.Model):
     image = models.ImageField(
         'Картинка',
         upload_to='posts/',
+        # posts/ab/cd/<sha256>.jpg: шарды по хешу, без дублей
+        storage=HashedFileSystemStorage(),
         blank=True
     )
+    comments_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Число комментариев'
+    )
+    # миниатюры картинки еще в очереди (posts.thumbnails): шаблоны
+    # показывают исходную картинку, а не создают миниатюру в запросе
+    thumbnail_pending = models.BooleanField(
+        default=False,
+        verbose_name='Миниатюры готовятся'
+    )
 
     class Meta:
-        ordering = ['-pub_date']
+        ordering = ['-pub_date', '-id']
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
+        # индексы под сортировку лент: общая, автора и группы
+        indexes = [
+            models.Index(fields=['pub_date', 'id'],
+                         name='post_date_idx'),
+            models.Index(fields=['author', 'pub_date'],
+                         name='post_author_date_idx'),
+            models.Index(fields=['group', 'pub_date'],
+                         name='post_group_date_idx'),
+        ]
 
     def __str__(self):
         return self.text[:15]
@@ -91,9 +118,13 @@ class Comment(models.Model):
     )
 
     class Meta:
-        ordering = ['-created']
+        ordering = ['-created', '-id']
         verbose_name = 'Комментарий'
         verbose_name_plural = 'Комментарии'
+        indexes = [
+            models.Index(fields=['post', 'created'],
+                         name='comment_post_created_idx'),
+        ]
 
     def __str__(self):
         return f'Комментарий: {self.text[:15]}'
@@ -128,3 +159,81 @@ class Follow(models.Model):
 
     def __str__(self):
         return f'Подписка {self.user} на {self.author}'
+
+
+class Timeline(models.Model):
+    """Класс модели базы данных для хранения материализованной
+    ленты подписок: одна запись на пару (подписчик, пост)."""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        verbose_name='Подписчик'
+    )
+    post = models.ForeignKey(
+        'Post',
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name='Пост'
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Публикатор'
+    )
+    pub_date = models.DateTimeField(
+        verbose_name='Дата пубикации'
+    )
+
+    class Meta:
+        ordering = ['-pub_date', '-id']
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'post'],
+                                    name='unique_timeline_post')
+        ]
+        indexes = [
+            models.Index(fields=['user', 'pub_date'],
+                         name='timeline_user_date_idx'),
+            models.Index(fields=['user', 'author'],
+                         name='timeline_user_author_idx'),
+        ]
+
+    def __str__(self):
+        return f'Лента {self.user}: {self.post}'
+
+
+class UserStats(models.Model):
+    """Класс модели базы данных для хранения счетчиков пользователя:
+    число постов, подписчиков и подписок. Счетчики обновляются
+    сигналами из posts.signals."""
+
+    user = models.OneToOneField(
+        User,
+        primary_key=True,
+        on_delete=models.CASCADE,
+        related_name='stats',
+        verbose_name='Пользователь'
+    )
+    posts_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Число постов'
+    )
+    followers_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Число подписчиков'
+    )
+    following_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Число подписок'
+    )
+
+    class Meta:
+        verbose_name = 'Счетчики пользователя'
+        verbose_name_plural = 'Счетчики пользователей'
+
+    def __str__(self):
+        return f'Счетчики {self.user}'
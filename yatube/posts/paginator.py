@@ -1,12 +1,140 @@
+import base64
+import binascii
+from collections.abc import Sequence
+
 from django.core.paginator import Paginator
 from django.conf import settings
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
 
+def make_pagination(request, pages, field='pub_date', cursor=False):
+    """Разбивает список объектов на пачки по page_len.
+    Если в запросе есть курсор ?after= или ?before= (или cursor=True),
+    страница строится по ключу (field, pk) без COUNT(*) и OFFSET,
+    иначе - по номеру страницы ?page=."""
+    after = request.GET.get('after')
+    before = request.GET.get('before')
+    if cursor or after or before:
+        paginator = CursorPaginator(pages, settings.PAGINATOR_PAGE_LEN,
+                                    field=field)
+        return paginator.get_page(after=after, before=before)
 
-def make_pagination(request, pages):
-    """Разбивает список объектов на пачки по page_len"""
     paginator = Paginator(pages, settings.PAGINATOR_PAGE_LEN)
 
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
 
     return page_obj
+
+
+def encode_cursor(value, pk):
+    """Упаковывает ключ (value, pk) в непрозрачный токен для url."""
+    raw = f'{value.isoformat()}|{pk}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Распаковывает токен курсора. Для испорченного токена
+    возвращает None."""
+    if not token:
+        return None
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode()).decode()
+        value, pk = raw.rsplit('|', 1)
+        value = parse_datetime(value)
+        pk = int(pk)
+    except (ValueError, TypeError, binascii.Error, UnicodeDecodeError):
+        return None
+    if value is None:
+        return None
+    return value, pk
+
+
+class CursorPaginator:
+    """Паджинатор по ключу (field, pk) в порядке убывания.
+    Не выполняет COUNT(*) и OFFSET: каждая страница - это один
+    запрос с условием по ключу последнего показанного объекта."""
+
+    def __init__(self, object_list, per_page, field='pub_date'):
+        self.object_list = object_list
+        self.per_page = int(per_page)
+        self.field = field
+
+    def get_page(self, after=None, before=None):
+        """Возвращает страницу после курсора after или перед
+        курсором before. Без курсора - первую страницу."""
+        after_key = decode_cursor(after)
+        before_key = decode_cursor(before) if after_key is None else None
+
+        queryset = self.object_list
+        if before_key is not None:
+            value, pk = before_key
+            queryset = queryset.filter(
+                Q(**{f'{self.field}__gt': value})
+                | Q(**{self.field: value, 'pk__gt': pk})
+            ).order_by(self.field, 'pk')
+        else:
+            if after_key is not None:
+                value, pk = after_key
+                queryset = queryset.filter(
+                    Q(**{f'{self.field}__lt': value})
+                    | Q(**{self.field: value, 'pk__lt': pk})
+                )
+            queryset = queryset.order_by(f'-{self.field}', '-pk')
+
+        objects = list(queryset[:self.per_page + 1])
+        has_more = len(objects) > self.per_page
+        objects = objects[:self.per_page]
+
+        if before_key is not None:
+            objects.reverse()
+            return CursorPage(objects, self,
+                              has_next=True, has_previous=has_more)
+        return CursorPage(objects, self,
+                          has_next=has_more,
+                          has_previous=after_key is not None)
+
+
+class CursorPage(Sequence):
+    """Страница курсорного паджинатора. Повторяет ту часть
+    интерфейса django.core.paginator.Page, которую используют шаблоны."""
+
+    is_cursor = True
+
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        self.object_list = object_list
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+        # токены считаются сразу: object_list потом можно подменить,
+        # например, постами вместо записей ленты
+        self.next_cursor = None
+        self.previous_cursor = None
+        if object_list:
+            if has_next:
+                self.next_cursor = self._cursor_for(object_list[-1])
+            if has_previous:
+                self.previous_cursor = self._cursor_for(object_list[0])
+
+    def __repr__(self):
+        return f'<CursorPage of {len(self.object_list)} objects>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    def _cursor_for(self, obj):
+        return encode_cursor(getattr(obj, self.paginator.field), obj.pk)
@@ -0,0 +1,214 @@
+import base64
+import binascii
+import re
+from contextlib import contextmanager
+
+from django.db import connection, connections, router
+from django.db.models.expressions import RawSQL
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .models import Post
+from .paginator import CursorPage
+
+# полнотекстовый индекс SQLite FTS5 над posts_post.text; таблица
+# хранит только индекс (content='posts_post'), а синхронизацию
+# с постами выполняют триггеры
+FTS_TABLE = 'posts_post_fts'
+FTS_CREATE_SQL = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    "text, content='posts_post', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2')"
+)
+FTS_TRIGGERS_SQL = (
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai "
+    "AFTER INSERT ON posts_post BEGIN "
+    f"INSERT INTO {FTS_TABLE}(rowid, text) VALUES (new.id, new.text); "
+    "END",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad "
+    "AFTER DELETE ON posts_post BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, text) "
+    "VALUES ('delete', old.id, old.text); "
+    "END",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au "
+    "AFTER UPDATE OF text ON posts_post BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, text) "
+    "VALUES ('delete', old.id, old.text); "
+    f"INSERT INTO {FTS_TABLE}(rowid, text) VALUES (new.id, new.text); "
+    "END",
+)
+FTS_REBUILD_SQL = f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"
+FTS_DROP_SQL = (
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_ai',
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_ad',
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_au',
+    f'DROP TABLE IF EXISTS {FTS_TABLE}',
+)
+
+# служебные символы, которыми snippet() отмечает найденные слова;
+# в текст поста они не попадают, поэтому после экранирования HTML
+# их можно безопасно заменить на <mark>
+MARK_START = '\x02'
+MARK_END = '\x03'
+SNIPPET_TOKENS = 16
+
+
+def fts_available(conn=connection):
+    """Полнотекстовый индекс есть только в SQLite."""
+    return conn.vendor == 'sqlite'
+
+
+def install_fts(conn=connection):
+    """Создает индекс с триггерами и заполняет его текущими постами."""
+    if not fts_available(conn):
+        return
+    with conn.cursor() as cursor:
+        cursor.execute(FTS_CREATE_SQL)
+        for sql in FTS_TRIGGERS_SQL:
+            cursor.execute(sql)
+        cursor.execute(FTS_REBUILD_SQL)
+
+
+def restore_triggers(conn=connection):
+    """Создает недостающие триггеры, если индекс уже есть:
+    пересоздание таблицы posts_post при миграциях SQLite удаляет
+    ее триггеры."""
+    if not fts_available(conn):
+        return
+    with conn.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s",
+            (FTS_TABLE,)
+        )
+        if cursor.fetchone() is None:
+            return
+        for sql in FTS_TRIGGERS_SQL:
+            cursor.execute(sql)
+
+
+@contextmanager
+def deferred_index(conn=connection):
+    """Снимает триггеры на время массовой загрузки постов и после нее
+    перестраивает индекс целиком: это в разы быстрее, чем обновлять
+    индекс построчно."""
+    if not fts_available(conn):
+        yield
+        return
+    with conn.cursor() as cursor:
+        for sql in FTS_DROP_SQL[:-1]:
+            cursor.execute(sql)
+    try:
+        yield
+    finally:
+        install_fts(conn)
+
+
+def fts_query(text):
+    """Превращает ввод пользователя в запрос FTS5: каждое слово
+    берется в кавычки, поэтому синтаксис FTS5 в вводе не работает
+    и не ломает запрос. Все слова должны встретиться в посте."""
+    words = re.findall(r'\w+', text)
+    return ' '.join(f'"{word}"' for word in words)
+
+
+def matching_ids_sql(query):
+    """Подзапрос с id постов, подходящих под запрос."""
+    return RawSQL(
+        f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+        (fts_query(query),)
+    )
+
+
+def encode_rank_cursor(rank, pk):
+    raw = f'{rank!r}|{pk}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_rank_cursor(token):
+    if not token:
+        return None
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode()).decode()
+        rank, pk = raw.rsplit('|', 1)
+        return float(rank), int(pk)
+    except (ValueError, TypeError, binascii.Error, UnicodeDecodeError):
+        return None
+
+
+def highlight(snippet):
+    """Экранирует фрагмент текста и выделяет найденные слова."""
+    return mark_safe(
+        escape(snippet).replace(MARK_START, '<mark>')
+        .replace(MARK_END, '</mark>')
+    )
+
+
+class SearchPage(CursorPage):
+    """Страница результатов поиска, курсор - пара (ранг, id).
+    Поиск листается только вперед, назад ведет ссылка на первую
+    страницу."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.previous_cursor = None
+
+    def _cursor_for(self, obj):
+        return encode_rank_cursor(obj.search_rank, obj.pk)
+
+
+def _fts_rows(conn, query, after_key, limit):
+    sql = (
+        f'SELECT rowid, bm25({FTS_TABLE}), '
+        f"snippet({FTS_TABLE}, 0, %s, %s, '…', %s) "
+        f'FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s'
+    )
+    params = [MARK_START, MARK_END, SNIPPET_TOKENS, query]
+    if after_key is not None:
+        sql += (f' AND (bm25({FTS_TABLE}) > %s'
+                f' OR (bm25({FTS_TABLE}) = %s AND rowid > %s))')
+        params += [after_key[0], after_key[0], after_key[1]]
+    sql += f' ORDER BY bm25({FTS_TABLE}), rowid LIMIT %s'
+    params.append(limit)
+    with conn.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+def _like_rows(query, after_key, limit):
+    """Запасной путь для БД без FTS5: поиск подстроки без ранга."""
+    posts = Post.objects.filter(text__icontains=query).order_by('pk')
+    if after_key is not None:
+        posts = posts.filter(pk__gt=after_key[1])
+    return [(pk, 0.0, text[:200])
+            for (pk, text) in posts.values_list('pk', 'text')[:limit]]
+
+
+def search_posts(query, per_page, after=None):
+    """Ищет посты по тексту и возвращает страницу результатов
+    в порядке релевантности. У каждого поста есть атрибуты
+    search_rank и snippet (фрагмент текста с выделением)."""
+    after_key = decode_rank_cursor(after)
+    if not fts_query(query):
+        return SearchPage([], None, has_next=False, has_previous=False)
+    # сырой SQL читает оттуда же, куда роутер отправил бы ORM
+    conn = connections[router.db_for_read(Post)]
+    if fts_available(conn):
+        rows = _fts_rows(conn, fts_query(query), after_key, per_page + 1)
+    else:
+        rows = _like_rows(query, after_key, per_page + 1)
+    has_next = len(rows) > per_page
+    rows = rows[:per_page]
+    posts = Post.objects.select_related('author', 'group').in_bulk(
+        [pk for (pk, _, _) in rows]
+    )
+    results = []
+    for (pk, rank, snippet) in rows:
+        post = posts.get(pk)
+        if post is None:
+            continue
+        post.search_rank = rank
+        post.snippet = highlight(snippet)
+        results.append(post)
+    return SearchPage(results, None, has_next=has_next,
+                      has_previous=after_key is not None)
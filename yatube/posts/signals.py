@@ -0,0 +1,96 @@
+from django.db import connections
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import counters, search, timeline
+from .cache import INDEX_CACHE_PREFIX, bump_cache_version
+from .models import Comment, Follow, Group, Post, User
+
+
+@receiver(post_save, sender=Post)
+def post_fan_out(sender, instance, created, **kwargs):
+    """Новый пост попадает в ленты подписчиков автора. Срабатывает
+    для post_create и для любого другого способа создания поста."""
+    if created:
+        timeline.fan_out_post(instance)
+
+
+@receiver(post_save, sender=Follow)
+def follow_backfill(sender, instance, created, **kwargs):
+    """После подписки в ленту попадают все посты автора."""
+    if created and instance.user_id and instance.author_id:
+        timeline.backfill(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_prune(sender, instance, **kwargs):
+    """После отписки посты автора убираются из ленты."""
+    if instance.user_id and instance.author_id:
+        timeline.prune(instance.user_id, instance.author_id)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def invalidate_index_cache(sender, update_fields=None, **kwargs):
+    """Любое изменение постов, групп или авторов сбрасывает
+    кэш главной страницы, страниц групп и профилей; подписки
+    меняют счетчики в профиле. Обновление last_login при входе
+    на страницу не влияет и кэш не трогает."""
+    if update_fields and set(update_fields) <= {'last_login'}:
+        return
+    bump_cache_version(INDEX_CACHE_PREFIX)
+
+
+@receiver(post_save, sender=Post)
+def post_counters_add(sender, instance, created, **kwargs):
+    """Новый пост увеличивает счетчик постов автора."""
+    if created:
+        counters.change_user_stats(instance.author_id, posts_count=1)
+
+
+@receiver(post_delete, sender=Post)
+def post_counters_remove(sender, instance, **kwargs):
+    """Удаленный пост уменьшает счетчик постов автора."""
+    counters.change_user_stats(instance.author_id, posts_count=-1)
+
+
+@receiver(post_save, sender=Comment)
+def comment_counters_add(sender, instance, created, **kwargs):
+    """Новый комментарий увеличивает счетчик комментариев поста."""
+    if created and instance.post_id:
+        counters.change_comments_count(instance.post_id, 1)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_counters_remove(sender, instance, **kwargs):
+    """Удаленный комментарий уменьшает счетчик комментариев поста."""
+    if instance.post_id:
+        counters.change_comments_count(instance.post_id, -1)
+
+
+@receiver(post_save, sender=Follow)
+def follow_counters_add(sender, instance, created, **kwargs):
+    """Подписка меняет счетчики подписчиков и подписок."""
+    if created:
+        counters.change_user_stats(instance.author_id, followers_count=1)
+        counters.change_user_stats(instance.user_id, following_count=1)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_counters_remove(sender, instance, **kwargs):
+    """Отписка меняет счетчики подписчиков и подписок."""
+    counters.change_user_stats(instance.author_id, followers_count=-1)
+    counters.change_user_stats(instance.user_id, following_count=-1)
+
+
+def ensure_fts(sender, using, **kwargs):
+    """После migrate восстанавливает триггеры полнотекстового
+    индекса: SQLite теряет их, когда миграция пересоздает таблицу
+    posts_post. Подключается в PostsConfig.ready()."""
+    search.restore_triggers(connections[using])
@@ -0,0 +1,53 @@
+import hashlib
+import os
+import posixpath
+import re
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+
+# posts/ab/cd/<sha256><расширение>
+SHARDED_NAME_RE = re.compile(
+    r'(^|/)[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}(\.\w+)?$'
+)
+
+
+def content_hash(content):
+    """sha256 содержимого File; позиция чтения возвращается
+    в начало."""
+    digest = hashlib.sha256()
+    for chunk in content.chunks():
+        digest.update(chunk)
+    content.seek(0)
+    return digest.hexdigest()
+
+
+def sharded_name(name, digest):
+    """Имя name в каталоге шарда по хешу: posts/x.gif ->
+    posts/ab/cd/abcd...ef.gif. Два уровня по 256 каталогов держат
+    каталог небольшим и при миллионах файлов."""
+    directory, filename = posixpath.split(name)
+    ext = os.path.splitext(filename)[1].lower()
+    return posixpath.join(directory, digest[:2], digest[2:4],
+                          f'{digest}{ext}')
+
+
+def is_sharded(name):
+    return bool(SHARDED_NAME_RE.search(name))
+
+
+class HashedFileSystemStorage(FileSystemStorage):
+    """Хранилище, которое кладет файл по хешу содержимого в каталог
+    шарда (см. sharded_name). Одинаковые файлы получают одно имя
+    и хранятся один раз: повторная загрузка только возвращает имя
+    уже сохраненного файла."""
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = sharded_name(name, content_hash(content))
+        if self.exists(name):
+            return name
+        return super().save(name, content, max_length)
@@ -1,13 +1,19 @@
+import os
 import shutil
 import tempfile
+from io import StringIO
 
+from django.core.files.storage import default_storage
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.core.cache import cache
+from django.core.management import call_command
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
 
 from django.conf import settings
+from jobs.models import Job
 from ..models import User, Post, Group, Comment
+from ..storage import content_hash, is_sharded
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
@@ -48,12 +54,13 @@ class PostFormTests(TestCase):
         return group, post
 
     @staticmethod
-    def create_image_object(img_name):
-        """Создание объекта изображения."""
+    def create_image_object(img_name, color=b'\xFF\xFF\xFF'):
+        """Создание объекта изображения; color - второй цвет
+        палитры, разный color дает разное содержимое."""
         small_gif = (
             b'\x47\x49\x46\x38\x39\x61\x02\x00'
             b'\x01\x00\x80\x00\x00\x00\x00\x00'
-            b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+            + color + b'\x21\xF9\x04\x00\x00'
             b'\x00\x00\x00\x2C\x00\x00\x00\x00'
             b'\x02\x00\x01\x00\x00\x02\x02\x0C'
             b'\x0A\x00\x3B'
@@ -70,11 +77,13 @@ class PostFormTests(TestCase):
         # подготовка
         uploaded = self.create_image_object('small')
         text_field = 'Новая запись в БД'
+        # картинка хранится по хешу содержимого
+        digest = content_hash(uploaded)
         post_data = [
             ('text', text_field),
             ('group', None),
             ('author', self.user),
-            ('image', 'posts/small.gif'),
+            ('image', f'posts/{digest[:2]}/{digest[2:4]}/{digest}.gif'),
         ]
         success_url = reverse('posts:profile',
                               kwargs={'username': self.user.username})
@@ -98,6 +107,89 @@ class PostFormTests(TestCase):
         # после создания пользователь перенаправлен
         self.assertRedirects(response, success_url)
 
+    def test_post_image_thumbnails_are_pregenerated(self):
+        """Картинка нового поста ставится в очередь, и обработчик
+        очереди заранее создает ее миниатюры. Пока задача в очереди,
+        страницы показывают исходную картинку и миниатюр не создают."""
+        response = self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={
+                'text': 'Пост с картинкой',
+                'image': self.create_image_object('thumb'),
+            },
+            follow=True
+        )
+        self.assertEqual(Job.objects.count(), 1)
+        post = Post.objects.get()
+        self.assertTrue(post.thumbnail_pending)
+        self.assertContains(response, f'src="{post.image.url}"')
+        self.assertContains(self.guest_client.get(reverse('posts:index')),
+                            f'src="{post.image.url}"')
+        thumbnails_dir = os.path.join(TEMP_MEDIA_ROOT, 'cache')
+        self.assertFalse(os.path.exists(thumbnails_dir))
+        call_command('run_worker', '--once', stdout=StringIO())
+        self.assertFalse(Job.objects.exists())
+        self.assertFalse(Post.objects.get().thumbnail_pending)
+        self.assertTrue(any(files for (_, _, files)
+                            in os.walk(thumbnails_dir)))
+        response = self.guest_client.get(reverse('posts:index'))
+        self.assertNotContains(response, f'src="{post.image.url}"')
+        self.assertContains(response, 'src="/media/cache/')
+
+    def test_failed_thumbnail_job_stays_queued(self):
+        """Если миниатюру создать не удалось, задача не удаляется,
+        а откладывается для повтора."""
+        self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={
+                'text': 'Пост с картинкой',
+                'image': self.create_image_object('lost'),
+            }
+        )
+        default_storage.delete(Post.objects.get().image.name)
+        with self.assertLogs('sorl.thumbnail', 'ERROR'), \
+                self.assertLogs('jobs.queue', 'ERROR'):
+            call_command('run_worker', '--once', stdout=StringIO())
+        job = Job.objects.get()
+        self.assertEqual((job.status, job.attempts), (Job.QUEUED, 1))
+
+    def test_identical_images_are_stored_once(self):
+        """Одинаковые картинки из разных постов - один файл."""
+        for name in ('first', 'second'):
+            self.authorized_client.post(
+                reverse('posts:post_create'),
+                data={'text': name, 'image': self.create_image_object(name)}
+            )
+        names = set(Post.objects.values_list('image', flat=True))
+        self.assertEqual(len(names), 1)
+        self.assertTrue(is_sharded(names.pop()))
+
+    def test_shard_images_command(self):
+        """Команда переносит картинки из плоского каталога в шарды
+        и переписывает имена у всех постов с этой картинкой; кэш
+        страниц с постами сбрасывается, остальной кэш остается."""
+        old = default_storage.save('posts/old.gif',
+                                   self.create_image_object('old'))
+        posts = [Post.objects.create(text=str(i), author=self.user,
+                                     image=old) for i in range(3)]
+        Post.objects.create(text='нет файла', author=self.user,
+                            image='posts/missing.gif')
+        old_page = self.guest_client.get(reverse('posts:index')).content
+        cache.set('other', 'значение')
+        call_command('shard_images', batch_size=2, stdout=StringIO(),
+                     stderr=StringIO())
+        names = {Post.objects.get(pk=post.pk).image.name
+                 for post in posts}
+        self.assertEqual(len(names), 1)
+        new = names.pop()
+        self.assertTrue(is_sharded(new))
+        self.assertTrue(default_storage.exists(new))
+        self.assertFalse(default_storage.exists(old))
+        self.assertEqual(cache.get('other'), 'значение')
+        self.assertNotEqual(
+            self.guest_client.get(reverse('posts:index')).content, old_page
+        )
+
     def test_post_create_skip_not_valid_data_from_form(self):
         """Не валидная форма не будет отправлена и сохранена."""
         # подготовка
@@ -137,7 +229,8 @@ class PostFormTests(TestCase):
     def test_post_edit_edits_existed_db_record(self):
         """Валидная форма сохраняется как обновлнение записи в БД."""
         # подготовка: заполнение БД тестовой информацией
-        new_img = self.create_image_object('large')
+        # картинка с другим содержимым: одинаковые хранятся одним файлом
+        new_img = self.create_image_object('large', color=b'\xFF\x00\x00')
         new_text = 'Пам-парам-пам-прам-пам-пам'
         _, post = self.create_test_post()
         # содержание полей для отредактированного поста
@@ -1,6 +1,12 @@
-from django.test import TestCase
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
 from datetime import datetime
-from ..models import User, Post, Group
+from ..models import User, Post, Group, Comment, Follow
+from ..paginator import encode_cursor
 
 
 class PostsModelsTest(TestCase):
@@ -29,3 +35,64 @@ class PostsModelsTest(TestCase):
         for (model, expected_return) in test_data:
             with self.subTest(model=model):
                 self.assertEqual(str(model), expected_return)
+
+
+class FeedQueryPlanTest(TestCase):
+    """Проверка, что запросы лент используют индексы и не сортируют
+    результат во временном B-дереве."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Test group',
+            slug='test_slug',
+            description='Test description'
+        )
+        Follow.objects.create(author=cls.author, user=cls.reader)
+        cls.post = Post.objects.create(text='Пост', author=cls.author,
+                                       group=cls.group)
+        Post.objects.bulk_create([
+            Post(text=f'Пост {i}', author=cls.author, group=cls.group)
+            for i in range(settings.PAGINATOR_PAGE_LEN * 2)
+        ])
+        Comment.objects.create(text='Коммент', author=cls.reader,
+                               post=cls.post)
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.reader)
+        cache.clear()
+
+    def explain(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            return [row[-1] for row in cursor.fetchall()]
+
+    def test_feed_queries_use_indexes(self):
+        """Каждый SELECT страниц лент читает таблицы по индексу."""
+        cursor = encode_cursor(self.post.pub_date, self.post.pk)
+        urls = []
+        for url in (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile',
+                    kwargs={'username': self.author.username}),
+            reverse('posts:follow_index'),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+        ):
+            urls.extend((url, f'{url}?page=2', f'{url}?after={cursor}'))
+        for url in urls:
+            with CaptureQueriesContext(connection) as queries:
+                cache.clear()
+                self.client.get(url)
+            selects = [query['sql'] for query in queries.captured_queries
+                       if query['sql'].startswith('SELECT')]
+            for sql in selects:
+                for step in self.explain(sql):
+                    with self.subTest(url=url, sql=sql, step=step):
+                        self.assertNotIn('TEMP B-TREE', step)
+                        if step.startswith('SCAN'):
+                            self.assertIn('INDEX', step)
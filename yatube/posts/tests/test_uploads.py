@@ -0,0 +1,224 @@
+import os
+import shutil
+import struct
+import tempfile
+import tracemalloc
+import zlib
+from contextlib import contextmanager
+from io import BytesIO
+from unittest import mock
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import (Client, RequestFactory, TestCase,
+                         override_settings)
+from django.urls import reverse
+from PIL import Image, features
+
+from .. import forms, uploads, views
+from ..models import Post, User
+from ..uploads import ERROR_FORMAT
+from ..views import post_create
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+# тег EXIF Orientation; 6 - повернуть на 90 по часовой
+ORIENTATION = 0x0112
+# тег EXIF Make - производитель камеры
+MAKE = 0x010F
+
+
+def jpeg(size, orientation=None, noise=False):
+    """JPEG размера size; noise - случайные пиксели, которые плохо
+    сжимаются."""
+    if noise:
+        image = Image.frombytes('RGB', size,
+                                os.urandom(size[0] * size[1] * 3))
+    else:
+        image = Image.new('RGB', size, 'red')
+    exif = Image.Exif()
+    if orientation:
+        exif[ORIENTATION] = orientation
+    buffer = BytesIO()
+    image.save(buffer, 'JPEG', quality=95, exif=exif.tobytes())
+    return buffer.getvalue()
+
+
+def photo(image_format, size, orientation):
+    """Картинка image_format с EXIF: поворот и производитель камеры."""
+    exif = Image.Exif()
+    exif[ORIENTATION] = orientation
+    exif[MAKE] = 'SecretCamera'
+    buffer = BytesIO()
+    Image.new('RGB', size, 'red').save(buffer, image_format,
+                                       exif=exif.tobytes())
+    return buffer.getvalue()
+
+
+def png_bomb(width, height):
+    """PNG, который в заголовке объявляет width x height пикселей,
+    а весит сотню байт."""
+    buffer = BytesIO()
+    Image.new('1', (1, 1)).save(buffer, 'PNG')
+    data = buffer.getvalue()
+    header = b'IHDR' + struct.pack('>II', width, height) + data[24:29]
+    return (data[:12] + header + struct.pack('>I', zlib.crc32(header))
+            + data[33:])
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ImageUploadTests(TestCase):
+    """Проверка потоковой загрузки и проверки картинок."""
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='uploader')
+        self.client.force_login(self.user)
+
+    def upload(self, name, content):
+        return self.client.post(reverse('posts:post_create'), data={
+            'text': name,
+            'image': SimpleUploadedFile(name, content),
+        })
+
+    def assertRejected(self, response, error):
+        self.assertFalse(Post.objects.exists())
+        self.assertFormError(response, 'form', 'image', error)
+
+    def test_orientation_applied_and_exif_stripped(self):
+        """Картинка повернута по EXIF Orientation, EXIF удален."""
+        self.upload('photo.jpg', jpeg((40, 20), orientation=6))
+        post = Post.objects.get()
+        with Image.open(post.image.path) as image:
+            self.assertEqual(image.size, (20, 40))
+            self.assertFalse(image.getexif())
+
+    def test_exif_stripped_in_every_format(self):
+        """EXIF (не только Orientation) удаляется из JPEG, PNG и WEBP."""
+        for image_format, name in (('JPEG', 'photo.jpg'),
+                                   ('PNG', 'photo.png'),
+                                   ('WEBP', 'photo.webp')):
+            with self.subTest(image_format=image_format):
+                if image_format == 'WEBP' and not features.check('webp'):
+                    self.skipTest('Pillow собран без WEBP')
+                self.upload(name, photo(image_format, (40, 20), 6))
+                post = Post.objects.get(text=name)
+                with Image.open(post.image.path) as image:
+                    self.assertEqual(image.format, image_format)
+                    self.assertEqual(image.size, (20, 40))
+                    self.assertFalse(image.getexif())
+                with post.image.open() as file:
+                    self.assertNotIn(b'SecretCamera', file.read())
+
+    def test_image_without_exif_is_kept(self):
+        """Картинку без EXIF не пересжимаем."""
+        content = jpeg((40, 20))
+        self.upload('photo.jpg', content)
+        with Post.objects.get().image.open() as file:
+            self.assertEqual(file.read(), content)
+
+    def test_decompression_bomb_rejected(self):
+        """Картинка с огромными размерами в заголовке отклоняется
+        без распаковки."""
+        response = self.upload('bomb.png', png_bomb(50000, 50000))
+        self.assertRejected(response, 'Картинка больше 24 млн пикселей.')
+
+    @override_settings(IMAGE_MAX_PIXELS=100)
+    def test_too_many_pixels_rejected(self):
+        """Предел берется из настроек при каждой проверке, общий
+        предел Pillow не меняется."""
+        default_limit = Image.MAX_IMAGE_PIXELS
+        response = self.upload('photo.jpg', jpeg((20, 20)))
+        self.assertRejected(response,
+                            'Картинка больше 0.0001 млн пикселей.')
+        response = self.upload('bomb.png', png_bomb(1000, 1000))
+        self.assertRejected(response,
+                            'Картинка больше 0.0001 млн пикселей.')
+        self.assertEqual(Image.MAX_IMAGE_PIXELS, default_limit)
+
+    def test_not_an_image_rejected(self):
+        """Файл, который по первым байтам не картинка, не пишется
+        на диск дальше первого куска."""
+        response = self.upload('fake.gif', b'<?php echo 1; ?>' * 100)
+        self.assertRejected(response, ERROR_FORMAT)
+
+    @override_settings(IMAGE_UPLOAD_MAX_BYTES=512 * 1024)
+    def test_too_large_rejected(self):
+        response = self.upload('photo.jpg',
+                               jpeg((1000, 1000), noise=True))
+        self.assertRejected(response, 'Файл больше 0.5 МБ.')
+
+    def test_handler_only_in_post_views(self):
+        """Проверка картинок включена только в формах постов, и CSRF
+        в них по-прежнему проверяется."""
+        handlers = RequestFactory().post('/').upload_handlers
+        self.assertEqual(
+            [type(handler).__name__ for handler in handlers],
+            ['MemoryFileUploadHandler', 'TemporaryFileUploadHandler']
+        )
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(self.user)
+        response = client.post(reverse('posts:post_create'),
+                               data={'text': 'без токена'})
+        self.assertTemplateUsed(response, 'core/403csrf.html')
+        self.assertFalse(Post.objects.exists())
+
+    def test_write_lock_only_around_writes(self):
+        """Картинка обрабатывается и файл пишется до того, как взята
+        блокировка БД на запись; в блокировке - только save()."""
+        events = []
+
+        @contextmanager
+        def immediate_atomic():
+            events.append('lock')
+            yield
+            events.append('unlock')
+
+        def normalize(upload):
+            events.append('normalize')
+            return uploads.normalize(upload)
+
+        def save_post(post, *args, **kwargs):
+            events.append('save')
+            return post_save(post, *args, **kwargs)
+
+        def save_file(*args, **kwargs):
+            events.append('file')
+            return file_save(*args, **kwargs)
+
+        storage = Post._meta.get_field('image').storage
+        post_save, file_save = Post.save, storage.save
+        with mock.patch.object(views, 'immediate_atomic', immediate_atomic), \
+                mock.patch.object(forms, 'normalize', normalize), \
+                mock.patch.object(Post, 'save', save_post), \
+                mock.patch.object(storage, 'save', save_file):
+            self.upload('photo.jpg', jpeg((40, 20), orientation=6))
+        self.assertEqual(events,
+                         ['normalize', 'file', 'lock', 'save', 'unlock'])
+
+    def test_peak_memory_is_bounded(self):
+        """Загрузка идет во временный файл кусками: пик памяти Python
+        на запрос много меньше размера файла. Пиксели Pillow держит
+        вне кучи Python, их ограничивает IMAGE_MAX_PIXELS."""
+        content = jpeg((2000, 1500), orientation=3, noise=True)
+        request = RequestFactory().post(
+            reverse('posts:post_create'),
+            data={'text': 'большая картинка',
+                  'image': SimpleUploadedFile('big.jpg', content)}
+        )
+        request.user = self.user
+        request._dont_enforce_csrf_checks = True
+        tracemalloc.start()
+        try:
+            response = post_create(request)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+            request.close()
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(Post.objects.exists())
+        self.assertGreater(len(content), 2 * 1024 * 1024)
+        self.assertLess(peak, len(content) // 4)
@@ -1,16 +1,35 @@
 import shutil
 import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from io import StringIO
+from unittest import mock
+from urllib.parse import quote
 
+from django.contrib.auth.models import AnonymousUser
 from django.core.paginator import Page
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.core.cache import cache
-from django.test import Client, TestCase, override_settings
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.models import F
+from django.http import HttpResponse
+from django.test import (Client, RequestFactory, SimpleTestCase, TestCase,
+                         override_settings)
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django import forms
 
 from django.conf import settings
-from ..models import User, Post, Group, Comment, Follow
+from core.cache import LocalStore, TwoTierCache
+from ..models import User, Post, Group, Comment, Follow, Timeline, UserStats
 from ..forms import PostForm
+from .. import benchmarks
+from ..counters import get_user_stats
+from ..cache import (INDEX_CACHE_PREFIX, _is_fresh, _page_key,
+                     bump_cache_version, get_cache_version,
+                     stampede_cache_page)
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
@@ -254,6 +273,38 @@ class SingleFixtureTests(TestCase):
         # проверка наличия нового комментария
         self.assertIn(comment, comments_list)
 
+    def test_post_detail_paginates_post_comments(self):
+        """На странице поста выводятся комментарии только этого поста
+        постранично, авторы загружаются тем же запросом."""
+        other_post = Post.objects.create(text='Другой пост',
+                                         author=SingleFixtureTests.author)
+        Comment.objects.create(text='Чужой коммент', author=self.author,
+                               post=other_post)
+        Comment.objects.bulk_create([
+            Comment(text=f'Коммент {i}', author=self.author,
+                    post=SingleFixtureTests.post)
+            for i in range(settings.PAGINATOR_PAGE_LEN + 5)
+        ])
+        url = reverse('posts:post_detail',
+                      kwargs={'post_id': SingleFixtureTests.post.pk})
+        response = self.guest_client.get(url)
+        first_page = response.context['comments']
+        self.assertEqual(len(first_page), settings.PAGINATOR_PAGE_LEN)
+        response = self.guest_client.get(
+            url, {'after': first_page.next_cursor}
+        )
+        second_page = response.context['comments']
+        self.assertEqual(len(second_page), 5)
+        self.assertFalse(second_page.has_next())
+        comments = list(first_page) + list(second_page)
+        for comment in comments:
+            with self.subTest(comment=comment.text):
+                self.assertEqual(comment.post_id,
+                                 SingleFixtureTests.post.pk)
+        # авторы уже загружены: обращение к ним не делает запросов
+        with self.assertNumQueries(0):
+            [comment.author.username for comment in comments]
+
     """Проверка функционала инструмента подписок."""
 
     def test_self_subscription_unavailable(self):
@@ -350,6 +401,80 @@ class SingleFixtureTests(TestCase):
         post_list = request.context['page_obj']
         self.assertEqual(len(post_list), 0)
 
+    def test_timeline_follows_subscriptions(self):
+        """Лента подписок пополняется новыми постами автора,
+        очищается при отписке и пересобирается командой
+        rebuild_timelines."""
+        publisher = User.objects.create_user(username='Саша_author')
+        self.author_client.get(reverse('posts:profile_follow',
+                                       kwargs={'username': 'Саша_author'}))
+        post = Post.objects.create(text='После подписки', author=publisher)
+        response = self.author_client.get(reverse('posts:follow_index'))
+        self.assertEqual(list(response.context['page_obj']), [post])
+        # пересборка лент дает тот же результат
+        Timeline.objects.all().delete()
+        call_command('rebuild_timelines', stdout=StringIO())
+        self.assertTrue(Timeline.objects.filter(user=self.author,
+                                                post=post).exists())
+        # после отписки лента пуста
+        self.author_client.get(reverse('posts:profile_unfollow',
+                                       kwargs={'username': 'Саша_author'}))
+        self.assertFalse(Timeline.objects.filter(user=self.author).exists())
+
+    def test_counters_follow_posts_comments_and_follows(self):
+        """Счетчики постов, комментариев и подписок обновляются при
+        создании и удалении объектов и пересчитываются командой
+        recount."""
+        publisher = User.objects.create_user(username='Саша_author')
+        profile_url = reverse('posts:profile',
+                              kwargs={'username': 'Саша_author'})
+        self.guest_client.get(profile_url)
+        post = Post.objects.create(text='Счетчики', author=publisher)
+        Follow.objects.create(author=publisher, user=self.author)
+        Comment.objects.create(text='Коммент', author=self.author, post=post)
+        comment = Comment.objects.create(text='Еще', author=self.author,
+                                         post=post)
+        comment.delete()
+        stats = self.guest_client.get(profile_url).context['author_stats']
+        self.assertEqual(
+            (stats.posts_count, stats.followers_count,
+             stats.following_count),
+            (1, 1, 0)
+        )
+        self.assertEqual(get_user_stats(self.author).following_count, 1)
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        # рассинхронизированные счетчики восстанавливаются командой
+        UserStats.objects.update(posts_count=100)
+        Post.objects.update(comments_count=100)
+        call_command('recount', stdout=StringIO())
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        self.assertEqual(UserStats.objects.get(user=publisher).posts_count,
+                         1)
+
+    def test_counters_do_not_go_below_zero(self):
+        """Разошедшийся с данными нулевой счетчик не мешает удалить
+        комментарий, пост и подписку."""
+        publisher = User.objects.create_user(username='Саша_author')
+        reader = User.objects.create_user(username='Вася_reader')
+        get_user_stats(publisher)
+        get_user_stats(reader)
+        post = Post.objects.create(text='Счетчики', author=publisher)
+        follow = Follow.objects.create(author=publisher, user=reader)
+        comment = Comment.objects.create(text='Коммент', author=reader,
+                                         post=post)
+        UserStats.objects.update(posts_count=0, followers_count=0,
+                                 following_count=0)
+        Post.objects.update(comments_count=0)
+        comment.delete()
+        follow.delete()
+        post.delete()
+        self.assertEqual(UserStats.objects.get(user=publisher).posts_count,
+                         0)
+        self.assertEqual(UserStats.objects.get(user=reader).following_count,
+                         0)
+
     """Дополнительные проверки"""
 
     def test_post_display_page(self):
@@ -377,28 +502,52 @@ class SingleFixtureTests(TestCase):
                     cache.clear()
 
     def test_index_page_caching(self):
-        """Главная страница posts:index генерируется раз в 20 секунд.
-        И остальное время используется ее версия из кэша."""
-        # создаем новый пост в БД
-        Post.objects.create(
-            text='Свежий пост',
-            author=SingleFixtureTests.author,
-        )
+        """Главная страница posts:index берется из кэша, пока посты
+        не меняются, и сбрасывается при создании и удалении поста."""
         # запоминаем кэш
         response = self.author_client.get(reverse('posts:index'))
         old_cache = response.content
-        # удаляем пост
-        Post.objects.filter(text='Свежий пост',
-                            author=SingleFixtureTests.author).delete()
+        # изменение в обход сигналов не сбрасывает кэш
+        Post.objects.filter(pk=SingleFixtureTests.post.pk).update(
+            text='Текст без сигналов'
+        )
         response = self.author_client.get(reverse('posts:index'))
-        new_cache = response.content
-        # проверка: без очистки кэша старый и новый кэш одинаковы
-        self.assertEqual(old_cache, new_cache)
-        cache.clear()
+        self.assertEqual(old_cache, response.content)
+        # создание поста сразу сбрасывает кэш
+        post = Post.objects.create(
+            text='Свежий пост',
+            author=SingleFixtureTests.author,
+        )
+        response = self.author_client.get(reverse('posts:index'))
+        self.assertNotEqual(old_cache, response.content)
+        self.assertContains(response, 'Свежий пост')
+        # удаление поста тоже сбрасывает кэш
+        post.delete()
         response = self.author_client.get(reverse('posts:index'))
-        brand_new_cache = response.content
-        # проверка: после очистки кэша старый и новый кэш отличны
-        self.assertNotEqual(new_cache, brand_new_cache)
+        self.assertNotContains(response, 'Свежий пост')
+
+    def test_single_post_fragment_caching(self):
+        """Фрагмент поста берется из кэша на всех страницах и
+        обновляется после правки поста."""
+        url = reverse('posts:profile',
+                      kwargs={'username': SingleFixtureTests.author.username})
+        self.guest_client.get(url)
+        # изменение в обход поля updated не видно: фрагмент в кэше
+        Post.objects.filter(pk=SingleFixtureTests.post.pk).update(
+            text='Текст без обновления версии'
+        )
+        for page in (url, reverse('posts:group_list',
+                                  kwargs={'slug': self.group.slug})):
+            with self.subTest(page=page):
+                response = self.guest_client.get(page)
+                self.assertNotContains(response,
+                                       'Текст без обновления версии')
+        # сохранение поста меняет версию фрагмента
+        post = Post.objects.get(pk=SingleFixtureTests.post.pk)
+        post.text = 'Отредактированный текст'
+        post.save()
+        response = self.guest_client.get(url)
+        self.assertContains(response, 'Отредактированный текст')
 
 
 class MultiFixtureTests(TestCase):
@@ -533,6 +682,276 @@ class MultiFixtureTests(TestCase):
                     context_data[1]
                 )
 
+    def test_cursor_pagination_walks_all_posts(self):
+        """Курсорная паджинация ?after= проходит все посты в том же
+        порядке, что и постраничная, а ?before= возвращает назад."""
+        url = reverse('posts:index')
+        expected = list(Post.objects.order_by('-pub_date', '-pk'))
+        # первая страница в курсорном режиме - с испорченным токеном
+        page_obj = self.guest_client.get(
+            url, {'after': 'испорчен'}
+        ).context['page_obj']
+        self.assertFalse(page_obj.has_previous())
+        walked = list(page_obj)
+        pages = [page_obj]
+        while page_obj.next_cursor:
+            cache.clear()
+            page_obj = self.guest_client.get(
+                url, {'after': page_obj.next_cursor}
+            ).context['page_obj']
+            walked.extend(page_obj)
+            pages.append(page_obj)
+        self.assertEqual(walked, expected)
+        self.assertEqual(len(pages), 3)
+        # возвращаемся со второй страницы на первую
+        cache.clear()
+        response = self.guest_client.get(
+            url, {'before': pages[1].previous_cursor}
+        )
+        self.assertEqual(list(response.context['page_obj']),
+                         list(pages[0]))
+        self.assertContains(response, '?after=')
+
+
+class SearchTests(TestCase):
+    """Проверка полнотекстового поиска по постам."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='Петя_author',
+                                              is_staff=True,
+                                              is_superuser=True)
+        cls.cat_post = Post.objects.create(
+            text='Котики <b>спят</b> на солнце', author=cls.author
+        )
+        Post.objects.create(text='Собаки бегают', author=cls.author)
+        Post.objects.bulk_create([
+            Post(text=f'Много котиков № {i}', author=cls.author)
+            for i in range(settings.PAGINATOR_PAGE_LEN + 2)
+        ])
+
+    def setUp(self):
+        self.guest_client = Client()
+        cache.clear()
+
+    def search(self, query, **params):
+        return self.guest_client.get(reverse('posts:search'),
+                                     {'q': query, **params})
+
+    def test_search_finds_and_highlights(self):
+        """Поиск находит пост без учета регистра, выделяет найденное
+        слово и экранирует HTML из текста поста."""
+        response = self.search('КОТИКИ')
+        page_obj = response.context['page_obj']
+        self.assertEqual(page_obj[0], self.cat_post)
+        self.assertContains(response, '<mark>Котики</mark>')
+        self.assertContains(response, '&lt;b&gt;спят&lt;/b&gt;')
+        self.assertEqual(len(self.search('собаки').context['page_obj']), 1)
+        self.assertEqual(len(self.search('"').context['page_obj']), 0)
+
+    def test_search_index_follows_posts(self):
+        """Индекс обновляется при правке и удалении поста."""
+        post = Post.objects.create(text='Уникальное слово', author=self.author)
+        self.assertEqual(list(self.search('уникальное').context['page_obj']),
+                         [post])
+        post.text = 'Другое содержание'
+        post.save()
+        self.assertEqual(len(self.search('уникальное').context['page_obj']),
+                         0)
+        self.assertEqual(len(self.search('содержание').context['page_obj']),
+                         1)
+        post.delete()
+        self.assertEqual(len(self.search('содержание').context['page_obj']),
+                         0)
+
+    def test_search_cursor_pagination(self):
+        """Результаты поиска листаются курсором без повторов."""
+        first = self.search('котиков').context['page_obj']
+        self.assertEqual(len(first), settings.PAGINATOR_PAGE_LEN)
+        response = self.search('котиков', after=first.next_cursor)
+        second = response.context['page_obj']
+        self.assertEqual(len(second), 2)
+        self.assertFalse(set(first) & set(second))
+        self.assertContains(response, f'?q={quote("котиков")}')
+        # ссылка на первую страницу теряет только курсор
+        self.assertContains(response, f'href="?q={quote("котиков")}"')
+
+    def test_admin_search_uses_index(self):
+        """Поиск в админке находит посты через полнотекстовый индекс."""
+        admin_client = Client()
+        admin_client.force_login(self.author)
+        response = admin_client.get(reverse('admin:posts_post_changelist'),
+                                    {'q': 'собаки'})
+        self.assertEqual(response.context['cl'].result_count, 1)
+
+
+class QueryBudgetTests(TestCase):
+    """Число запросов страниц-списков не зависит от числа
+    постов на странице и в БД."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = User.objects.create_user(username='reader')
+        cls.author = User.objects.create_user(username='author')
+        cls.group = Group.objects.create(title='Группа', slug='group')
+        cls.post = Post.objects.create(text='Первый пост котики',
+                                       author=cls.author, group=cls.group)
+        Comment.objects.create(post=cls.post, author=cls.reader,
+                               text='Первый комментарий')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def setUp(self):
+        self.client.force_login(self.reader)
+
+    def add_data(self):
+        """Добавляет больше страницы постов и комментариев
+        от разных авторов и в разных группах."""
+        for i in range(settings.PAGINATOR_PAGE_LEN + 5):
+            author = User.objects.create_user(username=f'author_{i}')
+            group = Group.objects.create(title=f'Группа {i}',
+                                         slug=f'group-{i}')
+            Follow.objects.create(user=self.reader, author=author)
+            Post.objects.create(text=f'Пост котики {i}', author=author,
+                                group=group)
+            Post.objects.create(text=f'Пост котики в группе {i}',
+                                author=self.author, group=self.group)
+            Comment.objects.create(post=self.post, author=author,
+                                   text=f'Комментарий {i}')
+
+    def assertFixedQueries(self, url, budget):
+        """Страница url укладывается в budget запросов и при
+        одном посте, и при полной странице."""
+        counts = []
+        for fill in (None, self.add_data):
+            if fill:
+                fill()
+            # первый запрос прогревает ленивые счетчики, кэш
+            # страниц и фрагментов сбрасывается перед замером
+            self.client.get(url)
+            cache.clear()
+            with query_budget(self, budget) as queries:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_list_views_have_fixed_query_count(self):
+        """Запросы к БД не растут с размером страницы."""
+        urls = (
+            (reverse('posts:index'), 4),
+            (reverse('posts:group_list', kwargs={'slug': 'group'}), 5),
+            (reverse('posts:profile', kwargs={'username': 'author'}), 7),
+            (reverse('posts:follow_index'), 4),
+            # +1 запрос на ETag
+            (reverse('posts:post_detail',
+                     kwargs={'post_id': self.post.pk}), 6),
+            (reverse('posts:search') + '?q=котики', 4),
+        )
+        for url, budget in urls:
+            with self.subTest(url=url):
+                with transaction.atomic():
+                    self.assertFixedQueries(url, budget)
+                    transaction.set_rollback(True)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class SeedCommandTests(TestCase):
+    """Проверка команды заполнения БД тестовыми данными."""
+
+    options = dict(users=30, groups=3, posts=200, comments=100,
+                   follows=60, images=2, seed=7, stdout=StringIO())
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def test_seed_creates_consistent_data(self):
+        """Команда создает заданное число объектов, ленты,
+        счетчики и поисковый индекс."""
+        call_command('seed', **self.options)
+        self.assertEqual(User.objects.count(), 30)
+        self.assertEqual(Group.objects.count(), 3)
+        self.assertEqual(Post.objects.count(), 200)
+        self.assertEqual(Comment.objects.count(), 100)
+        self.assertEqual(Follow.objects.count(), 60)
+        self.assertEqual(Post.objects.exclude(image='').count(), 2)
+        self.assertFalse(Follow.objects.filter(user=F('author')).exists())
+        follow = Follow.objects.first()
+        self.assertEqual(
+            Timeline.objects.filter(user=follow.user,
+                                    author=follow.author).count(),
+            Post.objects.filter(author=follow.author).count()
+        )
+        post = Post.objects.order_by('-comments_count').first()
+        self.assertEqual(post.comments_count, post.comments.count())
+        self.assertEqual(get_user_stats(post.author).posts_count,
+                         post.author.posts.count())
+        word = post.text.split()[0]
+        page_obj = self.client.get(reverse('posts:search'),
+                                   {'q': word}).context['page_obj']
+        self.assertTrue(len(page_obj))
+
+    def test_seed_is_deterministic(self):
+        """С одним и тем же seed команда создает одни и те же данные."""
+        def snapshot():
+            return list(Post.objects.order_by('pk').values_list(
+                'text', 'author__username', 'group__slug'
+            ))
+
+        call_command('seed', **self.options)
+        first = snapshot()
+        User.objects.all().delete()
+        Group.objects.all().delete()
+        call_command('seed', **self.options)
+        self.assertEqual(snapshot(), first)
+
+
+class BenchmarkTests(TestCase):
+    """Проверка замеров страниц и поиска регрессий."""
+
+    def test_run_views_measures_every_view(self):
+        """Замер возвращает метрики для каждой страницы."""
+        call_command('seed', users=20, groups=2, posts=50, comments=20,
+                     follows=40, images=0, stdout=StringIO())
+        results = benchmarks.run_views(repeat=2)
+        self.assertEqual(set(results), {
+            'index', 'index_template', 'group_posts', 'profile',
+            'post_detail', 'follow_index', 'post_create', 'add_comment',
+        })
+        for view, metrics in results.items():
+            with self.subTest(view=view):
+                self.assertEqual(set(metrics), set(benchmarks.METRICS))
+        # шаблон отрисовывается по готовым данным, без БД
+        self.assertEqual(results['index_template']['queries'], 0)
+        self.assertGreater(results['index']['queries'], 0)
+
+    def test_compare_finds_regressions(self):
+        """Регрессия - рост медианной задержки или памяти сверх
+        порога или любой рост числа запросов."""
+        base = {'p50_ms': 10, 'p95_ms': 20, 'queries': 3, 'peak_kb': 100}
+        baseline = {'small': {'index': base}}
+        same = {'small': {'index': dict(base, p50_ms=12, p95_ms=40)}}
+        self.assertEqual(benchmarks.compare(same, baseline, 0.25), [])
+        worse = {'small': {'index': dict(base, p50_ms=13, queries=4)}}
+        regressions = benchmarks.compare(worse, baseline, 0.25)
+        self.assertEqual(len(regressions), 2)
+        self.assertIn('small/index: queries 4', regressions[1])
+        # для страниц без базы сравнивать не с чем
+        self.assertEqual(benchmarks.compare(worse, {}, 0.25), [])
+
+
+@contextmanager
+def query_budget(test_class, budget):
+    """Контекстный менеджер: блок кода должен выполнить не больше
+    budget запросов к БД. Список запросов доступен через as."""
+    with CaptureQueriesContext(connection) as queries:
+        yield queries
+    test_class.assertLessEqual(
+        len(queries), budget,
+        '\n'.join(query['sql'] for query in queries.captured_queries)
+    )
+
 
 def check_page_context(test_class,
                        namespace,
@@ -561,3 +980,144 @@ def check_page_context(test_class,
             field_value = getattr(item, field_name)
             with test_class.subTest(field=field_name):
                 test_class.assertEqual(field_value, desired)
+
+
+class ConditionalGetTests(TestCase):
+    """Проверка ответов 304 Not Modified."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author')
+        cls.post = Post.objects.create(text='Пост', author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_feed_not_modified(self):
+        """Лента отдает 304, пока посты не менялись, и разный ETag
+        гостю и пользователю."""
+        url = reverse('posts:index')
+        etag = self.client.get(url)['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        author_client = Client()
+        author_client.force_login(self.author)
+        self.assertNotEqual(author_client.get(url)['ETag'], etag)
+        Post.objects.create(text='Новый пост', author=self.author)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_stale_page_keeps_its_etag(self):
+        """Устаревшая страница, которую отдают во время пересчета,
+        приходит с ETag своей версии: браузер не считает ее свежей
+        и после пересчета получает новую."""
+        url = reverse('posts:index')
+        old_etag = self.client.get(url)['ETag']
+        Post.objects.create(text='Новый пост', author=self.author)
+        request = RequestFactory().get(url)
+        request.user = AnonymousUser()
+        lock = (f'{_page_key(request, INDEX_CACHE_PREFIX)}.'
+                f'{get_cache_version(INDEX_CACHE_PREFIX)}.lock')
+        cache.add(lock, True)
+        response = self.client.get(url)
+        self.assertNotContains(response, 'Новый пост')
+        self.assertEqual(response['ETag'], old_etag)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=old_etag)
+        self.assertEqual(response.status_code, 200)
+        cache.delete(lock)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=old_etag)
+        self.assertContains(response, 'Новый пост')
+        new_etag = response['ETag']
+        self.assertNotEqual(new_etag, old_etag)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=new_etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_post_detail_not_modified(self):
+        """Страница поста отдает 304, пока не меняются комментарии;
+        Last-Modified нет - удаление комментария его не сдвигает."""
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        response = self.client.get(url)
+        self.assertFalse(response.has_header('Last-Modified'))
+        etag = response['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        comment = Comment.objects.create(post=self.post, author=self.author,
+                                         text='Комментарий')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        etag = response['ETag']
+        comment.delete()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+
+class PageCacheTests(SimpleTestCase):
+    """Проверка защиты кэша страниц от одновременного пересчета."""
+
+    def setUp(self):
+        cache.clear()
+        self.calls = []
+
+        @stampede_cache_page(60, key_prefix='test_page')
+        def view(request):
+            self.calls.append(request)
+            time.sleep(0.1)
+            return HttpResponse(f'page {len(self.calls)}')
+
+        self.view = view
+
+    def get(self):
+        request = RequestFactory().get('/page/')
+        request.user = AnonymousUser()
+        return self.view(request).content
+
+    def test_single_flight(self):
+        """Одновременные промахи пересчитывают страницу один раз."""
+        with ThreadPoolExecutor(max_workers=5) as pool:
+            pages = list(pool.map(lambda _: self.get(), range(5)))
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(set(pages), {b'page 1'})
+
+    def test_stale_while_revalidate(self):
+        """Пока другой запрос пересчитывает страницу после сброса
+        версии, отдается прежняя."""
+        self.get()
+        bump_cache_version(INDEX_CACHE_PREFIX)
+        version = get_cache_version(INDEX_CACHE_PREFIX)
+        request = RequestFactory().get('/page/')
+        request.user = AnonymousUser()
+        lock = f'{_page_key(request, "test_page")}.{version}.lock'
+        cache.add(lock, True)
+        self.assertEqual(self.get(), b'page 1')
+        cache.delete(lock)
+        self.assertEqual(self.get(), b'page 2')
+        self.assertEqual(self.get(), b'page 2')
+
+    def test_bump_reaches_other_processes(self):
+        """Каждая смена версии дает новое значение, и процесс
+        с версией в локальном кэше видит новую сразу."""
+        other = TwoTierCache('shared', {
+            'OPTIONS': {'GENERATION_CHECK_INTERVAL': 0}
+        })
+        other.local = LocalStore(100)
+        key = f'{INDEX_CACHE_PREFIX}.version'
+        versions = {get_cache_version(INDEX_CACHE_PREFIX)}
+        for _ in range(3):
+            self.assertIn(other.get(key), versions)
+            bump_cache_version(INDEX_CACHE_PREFIX)
+            self.assertNotIn(other.get(key), versions)
+            versions.add(other.get(key))
+        self.assertEqual(len(versions), 4)
+
+    def test_early_refresh(self):
+        """Страница, которая строится дольше, чем осталось до срока,
+        пересчитывается заранее."""
+        version = get_cache_version(INDEX_CACHE_PREFIX)
+        entry = {'version': version, 'delta': 0.1,
+                 'expires': time.time() + 60}
+        with mock.patch('posts.cache.random.random', return_value=0.5):
+            self.assertTrue(_is_fresh(entry, version, beta=1.0))
+            entry['expires'] = time.time() + 0.01
+            self.assertFalse(_is_fresh(entry, version, beta=1.0))
+            self.assertFalse(_is_fresh(entry, 'other', beta=1.0))
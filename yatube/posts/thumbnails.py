@@ -0,0 +1,56 @@
+from sorl.thumbnail import get_thumbnail
+
+from jobs.queue import enqueue, job
+from .cache import INDEX_CACHE_PREFIX, bump_cache_version
+from .models import Post
+
+# геометрии миниатюр из тега {% thumbnail %} в шаблонах постов
+# (posts/includes/single_post.html, posts/post_detail.html);
+# при изменении шаблонов список нужно обновить
+THUMBNAIL_GEOMETRIES = (
+    ('960x339', {'crop': 'center', 'upscale': True}),
+)
+
+
+def generate_thumbnails(post):
+    """Создает все миниатюры картинки поста. Повторный вызов
+    только находит готовые миниатюры в хранилище sorl.
+    sorl не бросает исключение, если не смог прочитать картинку,
+    а возвращает несозданную миниатюру: тогда бросаем OSError,
+    чтобы задача осталась в очереди и была повторена."""
+    if not post.image:
+        return
+    for (geometry, options) in THUMBNAIL_GEOMETRIES:
+        thumbnail = get_thumbnail(post.image, geometry, **options)
+        if not thumbnail.exists():
+            raise OSError(f'Миниатюра {geometry} для {post.image.name} '
+                          f'не создана')
+
+
+@job
+def generate_post_thumbnails(post_id):
+    """Фоновая задача: миниатюры для поста post_id. Когда они
+    готовы, снимает Post.thumbnail_pending и сбрасывает кэш лент:
+    в нем страницы с исходной картинкой."""
+    post = Post.objects.filter(pk=post_id).first()
+    if post is None:
+        return
+    generate_thumbnails(post)
+    # картинку могли заменить, пока шла задача: тогда флаг снимет
+    # задача новой картинки
+    if Post.objects.filter(pk=post_id, image=post.image.name,
+                           thumbnail_pending=True).update(
+                               thumbnail_pending=False):
+        bump_cache_version(INDEX_CACHE_PREFIX)
+
+
+def enqueue_thumbnails(post):
+    """Ставит пост с новой картинкой в очередь на генерацию
+    миниатюр; до ее выполнения шаблоны показывают исходную картинку.
+    update() не меняет Post.updated."""
+    post.thumbnail_pending = bool(post.image)
+    Post.objects.filter(pk=post.pk).update(
+        thumbnail_pending=post.thumbnail_pending
+    )
+    if post.image:
+        enqueue(generate_post_thumbnails, post.pk)
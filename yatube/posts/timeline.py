@@ -0,0 +1,64 @@
+from django.db import connection, transaction
+
+from .models import Follow, Post, Timeline
+
+# размер пачки для bulk_create при раздаче постов по лентам;
+# Django 2.2 не урезает явный batch_size под лимиты SQLite
+# (999 параметров и 500 SELECT в одном INSERT), поэтому
+# 4 поля * 200 записей
+TIMELINE_BATCH_SIZE = 200
+
+
+def _bulk_insert(entries):
+    """Сохраняет записи ленты пачками, пропуская уже существующие."""
+    Timeline.objects.bulk_create(entries,
+                                 batch_size=TIMELINE_BATCH_SIZE,
+                                 ignore_conflicts=True)
+
+
+def fan_out_post(post):
+    """Раздает новый пост в ленты всех подписчиков его автора."""
+    follower_ids = Follow.objects.filter(
+        author_id=post.author_id
+    ).values_list('user_id', flat=True)
+    _bulk_insert(
+        Timeline(user_id=user_id, post_id=post.pk,
+                 author_id=post.author_id, pub_date=post.pub_date)
+        for user_id in follower_ids.iterator()
+    )
+
+
+def backfill(user_id, author_id):
+    """Добавляет в ленту подписчика все посты автора."""
+    posts = Post.objects.filter(
+        author_id=author_id
+    ).values_list('pk', 'pub_date')
+    _bulk_insert(
+        Timeline(user_id=user_id, post_id=post_id,
+                 author_id=author_id, pub_date=pub_date)
+        for (post_id, pub_date) in posts.iterator()
+    )
+
+
+def prune(user_id, author_id):
+    """Удаляет из ленты подписчика все посты автора."""
+    Timeline.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+def rebuild():
+    """Пересобирает все ленты с нуля по таблице подписок одним
+    INSERT ... SELECT, без выгрузки постов в Python."""
+    quote = connection.ops.quote_name
+    sql = (
+        f'INSERT INTO {quote(Timeline._meta.db_table)} '
+        '(user_id, post_id, author_id, pub_date) '
+        'SELECT follow.user_id, post.id, post.author_id, post.pub_date '
+        f'FROM {quote(Follow._meta.db_table)} follow '
+        f'JOIN {quote(Post._meta.db_table)} post '
+        'ON post.author_id = follow.author_id '
+        'WHERE follow.user_id IS NOT NULL'
+    )
+    with transaction.atomic():
+        Timeline.objects.all().delete()
+        with connection.cursor() as cursor:
+            cursor.execute(sql)
@@ -0,0 +1,147 @@
+from functools import wraps
+
+from django.conf import settings
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+from PIL import Image, ImageOps
+
+# сигнатуры поддерживаемых форматов: формат и части (смещение, байты)
+SIGNATURES = (
+    ('JPEG', ((0, b'\xff\xd8\xff'),)),
+    ('PNG', ((0, b'\x89PNG\r\n\x1a\n'),)),
+    ('GIF', ((0, b'GIF87a'),)),
+    ('GIF', ((0, b'GIF89a'),)),
+    ('WEBP', ((0, b'RIFF'), (8, b'WEBP'))),
+)
+FORMATS = {image_format for (image_format, _) in SIGNATURES}
+# сколько байт начала файла нужно для сигнатуры
+SIGNATURE_BYTES = 12
+# форматы, у которых бывают EXIF и поворот
+EXIF_FORMATS = ('JPEG', 'PNG', 'WEBP')
+JPEG_QUALITY = 90
+
+ERROR_TOO_LARGE = 'Файл больше {:g} МБ.'
+ERROR_FORMAT = 'Загрузите картинку JPEG, PNG, GIF или WEBP.'
+ERROR_PIXELS = 'Картинка больше {:g} млн пикселей.'
+
+
+def sniff_format(head):
+    """Формат картинки по первым байтам файла или None."""
+    for image_format, parts in SIGNATURES:
+        if all(head[offset:offset + len(magic)] == magic
+               for (offset, magic) in parts):
+            return image_format
+    return None
+
+
+def _error_pixels():
+    return ERROR_PIXELS.format(settings.IMAGE_MAX_PIXELS / 10 ** 6)
+
+
+def check_header(path):
+    """Открывает только заголовок картинки и возвращает текст ошибки
+    или None. Пиксели не распаковываются: Image.open ленивый, а размер
+    сверяется с IMAGE_MAX_PIXELS по заголовку. Общий предел Pillow
+    (Image.MAX_IMAGE_PIXELS) не меняется: его видят все потоки."""
+    try:
+        with Image.open(path) as image:
+            image_format = image.format
+            width, height = image.size
+    except Image.DecompressionBombError:
+        return _error_pixels()
+    except Exception:
+        return ERROR_FORMAT
+    if image_format not in FORMATS:
+        return ERROR_FORMAT
+    if width * height > settings.IMAGE_MAX_PIXELS:
+        return _error_pixels()
+    return None
+
+
+class ImageUploadHandler(TemporaryFileUploadHandler):
+    """Пишет загрузку во временный файл кусками, не держа ее
+    в памяти. Файл больше IMAGE_UPLOAD_MAX_BYTES и файл, который по
+    первым байтам не картинка, дальше не пишутся. Готовый файл
+    проверяется по заголовку (формат и размер в пикселях).
+    Ошибка попадает в атрибут upload_error файла, ее показывает
+    PostForm."""
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.error = None
+        self.received = 0
+        self.head = b''
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.error is not None:
+            return None
+        self.received += len(raw_data)
+        if self.received > settings.IMAGE_UPLOAD_MAX_BYTES:
+            self.reject(ERROR_TOO_LARGE.format(
+                settings.IMAGE_UPLOAD_MAX_BYTES / 2 ** 20
+            ))
+            return None
+        if len(self.head) < SIGNATURE_BYTES:
+            self.head += raw_data[:SIGNATURE_BYTES]
+            if (len(self.head) >= SIGNATURE_BYTES
+                    and sniff_format(self.head) is None):
+                self.reject(ERROR_FORMAT)
+                return None
+        self.file.write(raw_data)
+        return None
+
+    def reject(self, error):
+        """Останавливает запись: на диске остается пустой файл."""
+        self.error = error
+        self.file.seek(0)
+        self.file.truncate()
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        if self.error is None:
+            if sniff_format(self.head) is None:
+                self.error = ERROR_FORMAT
+            else:
+                self.error = check_header(file.temporary_file_path())
+        file.upload_error = self.error
+        return file
+
+
+def image_uploads(view_func):
+    """Ставит ImageUploadHandler первым обработчиком загрузок view;
+    остальные загрузки (например, в админке) идут как обычно.
+    Обработчики нельзя менять после чтения request.POST, а его читает
+    CsrfViewMiddleware, поэтому CSRF проверяется здесь, после замены."""
+    protected_view = csrf_protect(view_func)
+
+    @csrf_exempt
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        request.upload_handlers.insert(0, ImageUploadHandler(request))
+        return protected_view(request, *args, **kwargs)
+    return wrapper
+
+
+def normalize(upload):
+    """Поворачивает картинку по EXIF Orientation и убирает EXIF
+    за одну распаковку; результат пишется на место загруженного
+    файла. Картинки без EXIF не пересжимаются. GIF не трогается:
+    пересохранение потеряло бы анимацию."""
+    with Image.open(upload) as image:
+        if image.format not in EXIF_FORMATS or not image.getexif():
+            upload.seek(0)
+            return upload
+        image_format = image.format
+        normalized = ImageOps.exif_transpose(image)
+    if image_format == 'JPEG' and normalized.mode not in ('RGB', 'L'):
+        normalized = normalized.convert('RGB')
+    options = {'quality': JPEG_QUALITY} if image_format == 'JPEG' else {}
+    # JPEG и WEBP пишут EXIF только из exif=..., а PNG берет его
+    # и из info
+    normalized.info.pop('exif', None)
+    upload.seek(0)
+    upload.truncate()
+    normalized.save(upload.file, image_format, **options)
+    upload.size = upload.tell()
+    upload.seek(0)
+    return upload
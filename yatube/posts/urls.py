@@ -60,4 +60,10 @@ urlpatterns = [
         views.add_comment,
         name='add_comment'
     ),
+    # url - поиск
+    path(
+        'search/',
+        views.search,
+        name='search'
+    ),
 ]
@@ -1,9 +1,19 @@
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from django.views.decorators.cache import cache_page
 from django.shortcuts import render, get_object_or_404, redirect
+from django.views.decorators.http import condition
+
+from core.db import immediate_atomic, save_files
 from .models import User, Post, Group, Follow
 from .forms import PostForm, CommentForm
 from .paginator import make_pagination
+from .cache import (GROUP_CACHE_PREFIX, INDEX_CACHE_PREFIX,
+                    PROFILE_CACHE_PREFIX, feed_etag, post_etag,
+                    stampede_cache_page)
+from .counters import get_user_stats
+from .thumbnails import enqueue_thumbnails
+from .search import search_posts
+from .uploads import image_uploads
 
 
 @login_required
@@ -16,16 +26,20 @@ def add_comment(request, post_id):
         comment = form.save(commit=False)
         comment.author = request.user
         comment.post = post
-        comment.save()
+        with immediate_atomic():
+            comment.save()
     return redirect('posts:post_detail', post_id=post_id)
 
 
+@condition(etag_func=feed_etag)
+@stampede_cache_page(settings.PAGE_CACHE_TIMEOUT,
+                     key_prefix=GROUP_CACHE_PREFIX)
 def group_posts(request, slug):
     """Возвращает заполненный шаблон страницы с информацией
     о постах группы slug."""
 
     group = get_object_or_404(Group, slug=slug)
-    post_list = group.posts.select_related('author').all()
+    post_list = group.posts.select_related('author', 'group').all()
     page_obj = make_pagination(request, post_list)
 
     return render(
@@ -35,10 +49,13 @@ def group_posts(request, slug):
     )
 
 
-@cache_page(20, key_prefix="index_page")
+@condition(etag_func=feed_etag)
+@stampede_cache_page(settings.INDEX_PAGE_CACHE_TIMEOUT,
+                     key_prefix=INDEX_CACHE_PREFIX)
 def index(request):
     """Возвращает заполненный шаблон страницы со всеми
-    постами из БД."""
+    постами из БД. Кэш страницы сбрасывается сигналами
+    при изменении постов, групп и авторов."""
 
     post_list = Post.objects.select_related('group', 'author').all()
     page_obj = make_pagination(request, post_list)
@@ -51,6 +68,7 @@ def index(request):
 
 
 @login_required
+@image_uploads
 def post_create(request):
     """При получении POST-запроса сохраняет данные в БД
     и открывает стриницу профиля автора.
@@ -62,7 +80,11 @@ def post_create(request):
         if form.is_valid():
             post = form.save(commit=False)
             post.author = request.user
-            post.save()
+            save_files(post)
+            with immediate_atomic():
+                post.save()
+                if 'image' in form.changed_data:
+                    enqueue_thumbnails(post)
             return redirect('posts:profile', post.author)
 
     return render(
@@ -72,12 +94,22 @@ def post_create(request):
     )
 
 
+@condition(etag_func=post_etag)
 def post_detail(request, post_id):
     """Возвращает заполненный шаблон с подробной
     информацией о посте post_id."""
 
-    post_obj = get_object_or_404(Post, pk=post_id)
-    posts_comment = post_obj.comments.filter(pk=post_id)
+    post_obj = get_object_or_404(
+        Post.objects.select_related('author', 'group'), pk=post_id
+    )
+    # комментарии листаются курсором по дате создания: страница
+    # строится одним запросом вместе с авторами при любом их числе
+    posts_comment = make_pagination(
+        request,
+        post_obj.comments.select_related('author'),
+        field='created',
+        cursor=True
+    )
     comment_form = CommentForm(request.POST or None)
 
     return render(
@@ -85,6 +117,7 @@ def post_detail(request, post_id):
         'posts/post_detail.html',
         {
             'post': post_obj,
+            'author_stats': get_user_stats(post_obj.author),
             'comments': posts_comment,
             'form': comment_form,
         }
@@ -92,6 +125,7 @@ def post_detail(request, post_id):
 
 
 @login_required
+@image_uploads
 def post_edit(request, post_id):
     """Для автора поста post_id:
     При получении POST-запроса обновляет данные в БД
@@ -112,7 +146,12 @@ def post_edit(request, post_id):
     )
     if request.method == 'POST':
         if post_form.is_valid():
-            post_form.save()
+            post = post_form.save(commit=False)
+            save_files(post)
+            with immediate_atomic():
+                post.save()
+                if 'image' in post_form.changed_data:
+                    enqueue_thumbnails(post)
             return redirect('posts:post_detail', post_id)
 
     return render(
@@ -126,12 +165,15 @@ def post_edit(request, post_id):
     )
 
 
+@condition(etag_func=feed_etag)
+@stampede_cache_page(settings.PAGE_CACHE_TIMEOUT,
+                     key_prefix=PROFILE_CACHE_PREFIX, anonymous_only=True)
 def profile(request, username):
     """Возвращает заполненный шаблон со всеми постами
     пользователя username - страницу профиля username."""
 
     author = get_object_or_404(User, username=username)
-    post_list = author.posts.select_related('group').all()
+    post_list = author.posts.select_related('author', 'group').all()
     page_obj = make_pagination(request, post_list)
 
     following = (request.user.is_authenticated
@@ -144,6 +186,7 @@ def profile(request, username):
         {
             'page_obj': page_obj,
             'author': author,
+            'author_stats': get_user_stats(author),
             'following': following,
         }
     )
@@ -151,9 +194,14 @@ def profile(request, username):
 
 @login_required
 def follow_index(request):
-    """Страница с постами авторов, на которых подписан пользователь."""
-    post_list = Post.objects.filter(author__following__user=request.user)
-    page_obj = make_pagination(request, post_list)
+    """Страница с постами авторов, на которых подписан пользователь.
+    Посты читаются из материализованной ленты Timeline, которую
+    заполняют сигналы при создании поста и при подписке."""
+    entries = request.user.timeline.select_related('post__author',
+                                                   'post__group')
+    page_obj = make_pagination(request, entries)
+    # на странице показываются сами посты, а не записи ленты
+    page_obj.object_list = [entry.post for entry in page_obj]
 
     return render(
         request,
@@ -166,15 +214,14 @@ def follow_index(request):
 def profile_follow(request, username):
     """Подписка пользователя на публикации автора username."""
     author = get_object_or_404(User, username=username)
-
-    if (
-            Follow.objects.filter(author=author, user=request.user).exists()
-            or request.user == author
-    ):
+    if request.user == author:
         return redirect('posts:profile', username=username)
 
-    Follow.objects.create(author=author,
-                          user=request.user)
+    with immediate_atomic():
+        if not Follow.objects.filter(author=author,
+                                     user=request.user).exists():
+            Follow.objects.create(author=author,
+                                  user=request.user)
 
     return redirect('posts:profile', username=username)
 
@@ -185,7 +232,22 @@ def profile_unfollow(request, username):
     author = get_object_or_404(User, username=username)
     follow_obj = Follow.objects.filter(author=author,
                                        user=request.user)
-    if follow_obj.exists():
-        follow_obj.delete()
+    with immediate_atomic():
+        if follow_obj.exists():
+            follow_obj.delete()
 
     return redirect('posts:profile', username=username)
+
+
+def search(request):
+    """Страница полнотекстового поиска по постам: результаты
+    в порядке релевантности с выделенными совпадениями."""
+    query = request.GET.get('q', '').strip()
+    page_obj = search_posts(query, settings.PAGINATOR_PAGE_LEN,
+                            after=request.GET.get('after'))
+
+    return render(
+        request,
+        'posts/search.html',
+        {'page_obj': page_obj, 'query': query}
+    )
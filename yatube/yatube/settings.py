@@ -28,10 +28,13 @@ INSTALLED_APPS = [
     'users.apps.UsersConfig',
     'core.apps.CoreConfig',
     'about.apps.AboutConfig',
+    'jobs.apps.JobsConfig',
     'sorl.thumbnail',
 ]
 
 MIDDLEWARE = [
+    'core.metrics.MetricsMiddleware',
+    'core.db.ReplicaPinningMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -39,6 +42,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'core.profiling.ProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'yatube.urls'
@@ -48,8 +52,16 @@ TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [TEMPLATES_DIR],
-        'APP_DIRS': True,
+        'APP_DIRS': False,
         'OPTIONS': {
+            # разобранные шаблоны кэшируются и при DEBUG; в разработке
+            # кэш сбрасывается при изменении файла шаблона
+            'loaders': [(
+                ('core.loaders.AutoreloadCachedLoader' if DEBUG
+                 else 'django.template.loaders.cached.Loader'),
+                ['django.template.loaders.filesystem.Loader',
+                 'django.template.loaders.app_directories.Loader'],
+            )],
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
@@ -63,13 +75,49 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'yatube.wsgi.application'
 
+# core.backends.sqlite3 - SQLite с транзакциями BEGIN IMMEDIATE
+# для записи из view (core.db.immediate_atomic)
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'core.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
     }
 }
 
+# реплики только для чтения: пути к файлам SQLite через пробел
+# в DATABASE_REPLICAS; локально это копии основной БД, которые
+# обновляет manage.py sync_replicas. В тестах реплики - зеркала
+# основной тестовой БД
+DATABASE_REPLICAS = []
+for number, name in enumerate(os.getenv('DATABASE_REPLICAS', '').split(),
+                              start=1):
+    DATABASES[f'replica{number}'] = {
+        'ENGINE': 'core.backends.sqlite3',
+        'NAME': name,
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica{number}')
+DATABASE_ROUTERS = ['core.db.PrimaryReplicaRouter']
+# сколько секунд после записи пользователь читает из основной БД
+DATABASE_PIN_SECONDS = 10
+
+# PRAGMA для каждого соединения с SQLite (core.db.configure_sqlite):
+# в режиме WAL чтение не ждет записи, а synchronous=NORMAL в WAL
+# не теряет целостность при падении процесса; cache_size в КБ
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64 * 1024,
+    'temp_store': 'MEMORY',
+    'busy_timeout': 5000,
+}
+# сколько раз повторить BEGIN IMMEDIATE, если за busy_timeout
+# блокировку получить не удалось (core.db.immediate_atomic);
+# задержка удваивается с каждой попыткой
+SQLITE_BUSY_RETRIES = 3
+SQLITE_BUSY_RETRY_DELAY = 0.05
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -97,13 +145,25 @@ USE_TZ = True
 
 STATIC_URL = '/static/'
 STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static/')]
+# сюда collectstatic собирает статику; ее отдает обертка
+# StaticFilesApplication в wsgi.py
+STATIC_ROOT = os.getenv('STATIC_ROOT', os.path.join(BASE_DIR, 'static_root'))
+if not DEBUG:
+    # имена с хешем содержимого и готовые .gz/.br; без DEBUG перед
+    # запуском нужен collectstatic
+    STATICFILES_STORAGE = (
+        'core.staticfiles.CompressedManifestStaticFilesStorage'
+    )
 
 LOGIN_URL = 'users:login'
 LOGIN_REDIRECT_URL = 'posts:index'
 # LOGOUT_REDIRECT_URL = 'posts:index'
 
+# письма ставятся в очередь фоновых задач, а обработчик
+# (manage.py run_worker) отправляет их через JOBS_EMAIL_BACKEND
+EMAIL_BACKEND = 'jobs.mail.QueuedEmailBackend'
 # подключение движка filebased.EmailBackend
-EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
+JOBS_EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
 # путь к директории, в которой хранятся файлы писем
 EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 
@@ -116,10 +176,92 @@ CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 # хранилище медиа пользователей
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# загруженные файлы отдает core.views.media; с MEDIA_ACCEL_HEADER
+# ('X-Accel-Redirect' для nginx, 'X-Sendfile' для Apache) файл
+# передает фронтовой сервер. Для nginx MEDIA_ACCEL_PREFIX - путь
+# internal-локации, которая смотрит в MEDIA_ROOT
+MEDIA_ACCEL_HEADER = os.getenv('MEDIA_ACCEL_HEADER')
+MEDIA_ACCEL_PREFIX = os.getenv('MEDIA_ACCEL_PREFIX', '/protected-media/')
+MEDIA_CACHE_CONTROL = 'public, max-age=86400'
+
+# картинки постов (post_create, post_edit) пишутся во временный файл
+# кусками, без копии в памяти; формат и размер проверяются
+# по заголовку (posts.uploads.image_uploads)
+IMAGE_UPLOAD_MAX_BYTES = 10 * 1024 * 1024
+# больше пикселей не распаковываем: 24 млн - около 96 МБ в памяти
+IMAGE_MAX_PIXELS = 24 * 10 ** 6
 
 # для хранения кэша на боевом сервере обычно используют Memcached или Redis
+# кэш из двух уровней: LRU в памяти процесса перед общим кэшем.
+# Общий кэш - файловый в CACHE_DIR, чтобы его делили все процессы
+# gunicorn; без CACHE_DIR (разработка, тесты) - в памяти процесса
+CACHE_DIR = os.getenv('CACHE_DIR')
 CACHES = {
     'default': {
+        'BACKEND': 'core.cache.MeteredTwoTierCache',
+        'LOCATION': 'shared',
+        'OPTIONS': {
+            'LOCAL_MAX_ENTRIES': 1000,
+            'LOCAL_TIMEOUT': 5,
+            'GENERATION_CHECK_INTERVAL': 1,
+        },
+    },
+    'shared': ({
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': CACHE_DIR,
+        'TIMEOUT': None,
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    } if CACHE_DIR else {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-    }
+        'TIMEOUT': None,
+    }),
 }
+
+# время жизни кэша главной страницы; устаревшие версии
+# сбрасываются сигналами из posts.signals
+INDEX_PAGE_CACHE_TIMEOUT = 60 * 60
+# время жизни кэша страниц групп и профилей (см. stampede_cache_page)
+PAGE_CACHE_TIMEOUT = 10 * 60
+# сколько еще секунд после срока отдавать страницу, пока ее
+# пересчитывает другой запрос
+PAGE_CACHE_STALE_TIMEOUT = 5 * 60
+# время жизни блокировки пересчета и предельное ожидание чужого
+# пересчета, с
+PAGE_CACHE_LOCK_TIMEOUT = 30
+PAGE_CACHE_WAIT_TIMEOUT = 2
+# коэффициент раннего пересчета XFetch: больше - раньше
+PAGE_CACHE_BETA = 1.0
+
+# настройка фоновых задач: в режиме JOBS_SYNC задачи выполняются
+# сразу при постановке в очередь (удобно для тестов)
+JOBS_SYNC = False
+JOBS_MAX_ATTEMPTS = 5
+# задержка перед повторной попыткой, удваивается с каждой неудачей
+JOBS_RETRY_DELAY = 10
+# через сколько секунд задача упавшего обработчика выдается снова
+JOBS_LOCK_TIMEOUT = 10 * 60
+
+# базовые замеры страниц (manage.py benchmark --save) и допустимое
+# ухудшение задержки и памяти относительно них; разброс задержки
+# между запусками на одной машине доходит до 30%
+BENCHMARK_BASELINE = os.path.join(BASE_DIR, 'benchmarks.json')
+BENCHMARK_THRESHOLD = 0.5
+
+# профилирование отдельных запросов (core.profiling): staff включает
+# его параметром ?profile, остальные - заголовком X-Profile со
+# значением из manage.py profiling_token
+PROFILING_TOKEN_MAX_AGE = 60 * 60
+PROFILING_TOP_FUNCTIONS = 40
+# для скольких самых долгих запросов к БД показывать EXPLAIN
+PROFILING_EXPLAIN_LIMIT = 5
+THUMBNAIL_BACKEND = 'core.profiling.ProfiledThumbnailBackend'
+
+# метрики Prometheus (/metrics): при нескольких процессах сервера
+# (gunicorn -w N) укажите общий каталог METRICS_MULTIPROC_DIR и
+# очищайте его при перезапуске; процессы сбрасывают туда значения
+# не чаще раза в METRICS_FLUSH_INTERVAL секунд
+METRICS_MULTIPROC_DIR = os.getenv('METRICS_MULTIPROC_DIR')
+METRICS_FLUSH_INTERVAL = 1
+# /metrics открыт только staff и сборщику с заголовком
+# Authorization: Bearer <METRICS_TOKEN>; без токена - только staff
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
@@ -1,7 +1,8 @@
 from django.contrib import admin
 from django.urls import include, path
 from django.conf import settings
-from django.conf.urls.static import static
+
+from core.views import media, metrics
 
 
 handler404 = 'core.views.page_not_found'
@@ -32,10 +33,16 @@ urlpatterns = [
         'auth/',
         include('django.contrib.auth.urls')
     ),
+    # метрики для Prometheus
+    path(
+        'metrics',
+        metrics,
+        name='metrics'
+    ),
+    # загруженные файлы - и при DEBUG, и без него
+    path(
+        f'{settings.MEDIA_URL.lstrip("/")}<path:path>',
+        media,
+        name='media'
+    ),
 ]
-
-
-if settings.DEBUG:
-    urlpatterns += static(
-        settings.MEDIA_URL, document_root=settings.MEDIA_ROOT
-    )
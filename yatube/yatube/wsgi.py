@@ -1,7 +1,13 @@
 import os
 
+from django.conf import settings
 from django.core.wsgi import get_wsgi_application
 
+from core.staticfiles import StaticFilesApplication
+
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
 
-application = get_wsgi_application()
+# статика из STATIC_ROOT отдается до Django
+application = StaticFilesApplication(get_wsgi_application(),
+                                     settings.STATIC_ROOT,
+                                     settings.STATIC_URL)